@@ -13,7 +13,12 @@ CREATE TABLE IF NOT EXISTS `usuarios` (
     `id` INT PRIMARY KEY AUTO_INCREMENT,
     `nome` VARCHAR(255) NOT NULL,
     `email` VARCHAR(255) UNIQUE NOT NULL COMMENT 'E-mail deve ser único para login',
-    `senha_hash` VARCHAR(255) NOT NULL COMMENT 'Armazena a senha criptografada (hash)'
+    `senha_hash` VARCHAR(255) NOT NULL COMMENT 'Armazena a senha criptografada (hash)',
+    `tarefas_versao` INT NOT NULL DEFAULT 0 COMMENT 'Incrementada a cada alteração nas tarefas (ETag do calendário)',
+    `tarefas_alterado_em` DATETIME NULL COMMENT 'Última alteração nas tarefas',
+    `notif_email` BOOLEAN NOT NULL DEFAULT TRUE COMMENT 'Lembretes de tarefas e vencimentos por e-mail',
+    `notif_push` BOOLEAN NOT NULL DEFAULT FALSE,
+    `notif_relatorio` BOOLEAN NOT NULL DEFAULT FALSE COMMENT 'Resumo mensal por e-mail'
 ) ENGINE=InnoDB;
 
 -- Tabela 'tarefas'
@@ -23,7 +28,7 @@ CREATE TABLE IF NOT EXISTS `tarefas` (
     `user_id` INT NOT NULL,
     `titulo` VARCHAR(255) NOT NULL,
     `descricao` TEXT COMMENT 'Descrição detalhada da tarefa',
-    `data` VARCHAR(10) NOT NULL COMMENT 'Data da tarefa (formato YYYY-MM-DD ou similar)',
+    `data` DATE NOT NULL COMMENT 'Data da tarefa',
     `categoria` VARCHAR(50) COMMENT 'Categoria ou tag da tarefa',
     `status` TINYINT DEFAULT 0 COMMENT '0: pendente, 1: concluída',
    
@@ -40,16 +45,98 @@ CREATE TABLE IF NOT EXISTS `financas` (
     `descricao` VARCHAR(255) COMMENT 'Breve descrição da transação',
     `categoria` VARCHAR(50) COMMENT 'Categoria da transação (ex: salario, mercado, lazer)',
     `tipo` VARCHAR(10) NOT NULL COMMENT 'Tipo de transação: "entrada" ou "saida"',
-    `valor` FLOAT NOT NULL COMMENT 'Valor da transação',
+    `valor` DECIMAL(12,2) NOT NULL COMMENT 'Valor da transação',
     `forma_pagamento` VARCHAR(50) COMMENT 'Forma de pagamento (ex: credito, debito, pix)',
     `parcelas` INT DEFAULT 1 COMMENT 'Número de parcelas (para compras parceladas)',
-    `data` VARCHAR(10) COMMENT 'Data da transação (formato YYYY-MM-DD ou similar)',
+    `data` DATE COMMENT 'Data da transação',
    
     -- Chave estrangeira que conecta a transação ao usuário
     FOREIGN KEY(`usuario_id`) REFERENCES `usuarios`(`id`)
         ON DELETE CASCADE -- Se o usuário for deletado, suas finanças também serão
 ) ENGINE=InnoDB;
 
+-- Tabelas de arquivo: tarefas concluídas e lançamentos antigos, movidos em lotes
+-- por `flask arquivar` (mesmas colunas e ids das tabelas quentes).
+CREATE TABLE IF NOT EXISTS `tarefas_arquivo` (
+    `id` INT PRIMARY KEY,
+    `user_id` INT NOT NULL,
+    `titulo` VARCHAR(255) NOT NULL,
+    `descricao` TEXT,
+    `data` DATE NOT NULL,
+    `categoria` VARCHAR(50),
+    `status` TINYINT DEFAULT 1,
+    `arquivada_em` DATETIME NOT NULL,
+    FOREIGN KEY (`user_id`) REFERENCES `usuarios`(`id`) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS `financas_arquivo` (
+    `id` INT PRIMARY KEY,
+    `usuario_id` INT NOT NULL,
+    `descricao` VARCHAR(255),
+    `categoria` VARCHAR(50),
+    `tipo` VARCHAR(10) NOT NULL,
+    `valor` DECIMAL(12,2) NOT NULL,
+    `forma_pagamento` VARCHAR(50),
+    `parcelas` INT DEFAULT 1,
+    `data` DATE,
+    `arquivada_em` DATETIME NOT NULL,
+    FOREIGN KEY (`usuario_id`) REFERENCES `usuarios`(`id`) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- Anexos (RF16): um registro por conteúdo (SHA-256) e um por item anexado
+CREATE TABLE IF NOT EXISTS `arquivos` (
+    `hash` CHAR(64) PRIMARY KEY,
+    `tamanho` BIGINT NOT NULL,
+    `tipo` VARCHAR(100) NOT NULL,
+    `criado_em` DATETIME NOT NULL
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS `anexos` (
+    `id` INT PRIMARY KEY AUTO_INCREMENT,
+    `usuario_id` INT NOT NULL,
+    `tarefa_id` INT NULL COMMENT 'Tarefa (quente ou arquivada)',
+    `financa_id` INT NULL COMMENT 'Lançamento (quente ou arquivado)',
+    `arquivo_hash` CHAR(64) NOT NULL,
+    `nome` VARCHAR(255) NOT NULL,
+    `tamanho` BIGINT NOT NULL,
+    `criado_em` DATETIME NOT NULL,
+    FOREIGN KEY (`usuario_id`) REFERENCES `usuarios`(`id`) ON DELETE CASCADE,
+    FOREIGN KEY (`arquivo_hash`) REFERENCES `arquivos`(`hash`),
+    INDEX anexo_usuario_id_tarefa_id (usuario_id, tarefa_id),
+    INDEX anexo_usuario_id_financa_id (usuario_id, financa_id)
+) ENGINE=InnoDB;
+
+-- Compartilhamento de lembretes (RF15/R9): arestas + feed materializado por destinatário
+CREATE TABLE IF NOT EXISTS `compartilhamentos` (
+    `id` INT PRIMARY KEY AUTO_INCREMENT,
+    `tarefa_id` INT NOT NULL COMMENT 'Tarefa (quente ou arquivada)',
+    `dono_id` INT NOT NULL,
+    `destinatario_id` INT NOT NULL,
+    `criado_em` DATETIME NOT NULL,
+    FOREIGN KEY (`dono_id`) REFERENCES `usuarios`(`id`) ON DELETE CASCADE,
+    FOREIGN KEY (`destinatario_id`) REFERENCES `usuarios`(`id`) ON DELETE CASCADE,
+    UNIQUE INDEX compartilhamento_tarefa_id_destinatario_id (tarefa_id, destinatario_id),
+    INDEX compartilhamento_dono_id_tarefa_id (dono_id, tarefa_id)
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS `feed_compartilhado` (
+    `id` INT PRIMARY KEY AUTO_INCREMENT,
+    `destinatario_id` INT NOT NULL,
+    `tarefa_id` INT NOT NULL,
+    `dono_id` INT NOT NULL,
+    `dono_nome` VARCHAR(255) NOT NULL,
+    `titulo` VARCHAR(255) NOT NULL,
+    `descricao` TEXT,
+    `data` DATE NOT NULL,
+    `categoria` VARCHAR(255),
+    `status` INT NOT NULL DEFAULT 0,
+    `atualizado_em` DATETIME NOT NULL,
+    FOREIGN KEY (`destinatario_id`) REFERENCES `usuarios`(`id`) ON DELETE CASCADE,
+    FOREIGN KEY (`dono_id`) REFERENCES `usuarios`(`id`) ON DELETE CASCADE,
+    UNIQUE INDEX feedcompartilhado_destinatario_id_tarefa_id (destinatario_id, tarefa_id),
+    INDEX feedcompartilhado_tarefa_id (tarefa_id)
+) ENGINE=InnoDB;
+
 -- -------------------------------------------------------------------------
 -- 3. CRIAÇÃO DE USUÁRIO E PERMISSÕES (Opcional, mas recomendado)
 -- Você pode pular esta seção se já tiver um usuário com permissões.
@@ -64,8 +151,41 @@ CREATE TABLE IF NOT EXISTS `financas` (
 -- 4. ÍNDICES (Opcional, mas melhora performance)
 -- -------------------------------------------------------------------------
 
--- Índice para a busca de tarefas por usuário e status
-CREATE INDEX idx_tarefas_user_status ON tarefas (user_id, status);
+-- (os mesmos índices são criados pelos modelos Peewee e por `flask migrar`)
+
+-- Tarefas do dia / calendário: usuário + status + data
+CREATE INDEX tarefa_user_id_status_data ON tarefas (user_id, status, data);
+
+-- Lançamentos por usuário e tipo, ordenados por data
+CREATE INDEX financa_usuario_id_tipo_data ON financas (usuario_id, tipo, data);
+
+-- Totais por categoria
+CREATE INDEX financa_usuario_id_categoria_tipo ON financas (usuario_id, categoria, tipo);
+
+-- Listagens paginadas por (data, id)
+CREATE INDEX tarefa_user_id_data ON tarefas (user_id, data);
+CREATE INDEX financa_usuario_id_data ON financas (usuario_id, data);
+
+-- Filtro por categoria na busca de tarefas
+CREATE INDEX tarefa_user_id_categoria_data ON tarefas (user_id, categoria, data);
+
+-- Busca textual (MATCH ... AGAINST) em tarefas e lançamentos
+CREATE FULLTEXT INDEX tarefa_ft_titulo_descricao ON tarefas (titulo, descricao);
+CREATE FULLTEXT INDEX financa_ft_descricao ON financas (descricao);
+
+-- Agendador de notificações: itens que vencem em um dia (todos os usuários)
+CREATE INDEX tarefa_data_status ON tarefas (data, status);
+CREATE INDEX financa_data_tipo ON financas (data, tipo);
+
+-- Histórico arquivado ("incluir arquivados" nas listagens e na busca)
+CREATE INDEX tarefaarquivada_user_id_data ON tarefas_arquivo (user_id, data);
+CREATE INDEX tarefaarquivada_user_id_categoria_data ON tarefas_arquivo (user_id, categoria, data);
+CREATE INDEX financaarquivada_usuario_id_data ON financas_arquivo (usuario_id, data);
+CREATE INDEX financaarquivada_usuario_id_tipo_data ON financas_arquivo (usuario_id, tipo, data);
+CREATE FULLTEXT INDEX tarefaarquivada_ft_titulo_descricao ON tarefas_arquivo (titulo, descricao);
+CREATE FULLTEXT INDEX financaarquivada_ft_descricao ON financas_arquivo (descricao);
 
--- Índice para a busca de finanças por usuário e data (comum para relatórios)
-CREATE INDEX idx_financas_user_data ON financas (usuario_id, data DESC);
\ No newline at end of file
+-- Feed das tarefas compartilhadas: calendário e listagem de quem recebe
+CREATE INDEX feedcompartilhado_destinatario_id_status_data ON feed_compartilhado (destinatario_id, status, data);
+CREATE INDEX feedcompartilhado_destinatario_id_data_tarefa_id ON feed_compartilhado (destinatario_id, data, tarefa_id);
+CREATE FULLTEXT INDEX feedcompartilhado_ft_titulo_descricao ON feed_compartilhado (titulo, descricao);
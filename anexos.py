@@ -0,0 +1,297 @@
+"""Anexos (RF16): documentos e comprovantes ligados a tarefas e lançamentos.
+
+Envio: o corpo é lido em blocos de 64 KB direto para um temporário em
+ANEXOS_DIR/tmp (nem o arquivo inteiro nem o multipart ficam na memória),
+calculando o SHA-256 no caminho. O limite (ANEXO_MAX_BYTES e o que resta da
+cota do usuário, ANEXOS_COTA_BYTES) é conferido a cada bloco: estourou, o
+envio é interrompido ali e o temporário apagado.
+
+Armazenamento por conteúdo: o temporário é renomeado para
+ANEXOS_DIR/objetos/ab/cd/<sha256>, então o mesmo comprovante enviado duas
+vezes (ou por dois usuários) ocupa o disco uma vez só. `arquivos` guarda um
+registro por conteúdo e `anexos` um por item anexado; a cota conta o que o
+usuário anexou, não o que ocupou no disco. Conteúdos sem anexo são apagados
+por `limpar_orfaos` (`flask anexos-limpar`).
+
+Miniaturas de imagens são geradas sob demanda, na primeira vez em que são
+pedidas, num pool de threads do processo; até ficarem prontas a rota
+responde 202.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from peewee import fn
+
+from modelos import db, Arquivo, Anexo, Tarefa, TarefaArquivada, Financa, FinancaArquivada
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger("datefy.anexos")
+
+ANEXOS_DIR = os.getenv("ANEXOS_DIR",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados", "anexos"))
+ANEXO_MAX_BYTES = int(os.getenv("ANEXO_MAX_BYTES", str(10 * 1024 * 1024)))
+ANEXOS_COTA_BYTES = int(os.getenv("ANEXOS_COTA_BYTES", str(100 * 1024 * 1024)))
+MINIATURA_LADO = int(os.getenv("ANEXOS_MINIATURA_LADO", "320"))
+MINIATURAS_WORKERS = int(os.getenv("ANEXOS_MINIATURAS_WORKERS", "2"))
+BLOCO = 64 * 1024
+
+# Assinaturas dos tipos servidos em linha; o resto é baixado como anexo
+ASSINATURAS = [
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+EM_LINHA = {"application/pdf", "image/png", "image/jpeg", "image/gif", "image/webp"}
+# Itens que aceitam anexos: tabela quente e arquivo de cada um
+ITENS = {
+    "tarefa": ((Tarefa, Tarefa.user), (TarefaArquivada, TarefaArquivada.user)),
+    "financa": ((Financa, Financa.usuario), (FinancaArquivada, FinancaArquivada.usuario)),
+}
+
+
+class AnexoInvalido(ValueError):
+    pass
+
+class CotaExcedida(AnexoInvalido):
+    pass
+
+
+def caminho_objeto(hash_):
+    return os.path.join(ANEXOS_DIR, "objetos", hash_[:2], hash_[2:4], hash_)
+
+def caminho_miniatura(hash_):
+    return os.path.join(ANEXOS_DIR, "miniaturas", hash_[:2], hash_ + ".jpg")
+
+def detectar_tipo(inicio):
+    for assinatura, tipo in ASSINATURAS:
+        if inicio.startswith(assinatura):
+            return tipo
+    if inicio[:4] == b"RIFF" and inicio[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+def _nome_seguro(nome):
+    nome = os.path.basename((nome or "").replace("\\", "/")).strip()
+    return (nome or "anexo")[:200]
+
+
+# --- Cota ---
+def usado(usuario_id):
+    return Anexo.select(fn.COALESCE(fn.SUM(Anexo.tamanho), 0)).where(Anexo.usuario == usuario_id).scalar()
+
+def limite_envio(usuario_id):
+    """Bytes que o próximo envio pode ter: o menor entre o máximo por arquivo e o que resta da cota."""
+    return max(0, min(ANEXO_MAX_BYTES, ANEXOS_COTA_BYTES - usado(usuario_id)))
+
+
+class Gravacao:
+    """Destino de um envio: temporário em disco + SHA-256 + limite conferido a cada bloco.
+
+    Também serve de `stream_factory` do parser multipart do Werkzeug, que só
+    chama write/seek no objeto devolvido.
+    """
+
+    def __init__(self, limite):
+        pasta = os.path.join(ANEXOS_DIR, "tmp")
+        os.makedirs(pasta, exist_ok=True)
+        self._arquivo = tempfile.NamedTemporaryFile(dir=pasta, prefix="envio-", delete=False)
+        self.caminho = self._arquivo.name
+        self.limite = limite
+        self.tamanho = 0
+        self.inicio = b""
+        self._hash = hashlib.sha256()
+
+    def write(self, dados):
+        self.tamanho += len(dados)
+        if self.tamanho > self.limite:
+            raise CotaExcedida(f"Arquivo maior que o permitido ({self.limite // 1024} KB disponíveis).")
+        if len(self.inicio) < 16:
+            self.inicio += dados[:16 - len(self.inicio)]
+        self._hash.update(dados)
+        return self._arquivo.write(dados)
+
+    def seek(self, *args):
+        return self._arquivo.seek(*args)
+
+    def read(self, *args):
+        return self._arquivo.read(*args)
+
+    @property
+    def hash(self):
+        return self._hash.hexdigest()
+
+    def copiar_de(self, fluxo):
+        """Lê um fluxo (corpo cru da requisição) em blocos."""
+        while True:
+            bloco = fluxo.read(BLOCO)
+            if not bloco:
+                return self
+            self.write(bloco)
+
+    def fechar(self):
+        if not self._arquivo.closed:
+            self._arquivo.flush()
+            os.fsync(self._arquivo.fileno())
+            self._arquivo.close()
+
+    def descartar(self):
+        self._arquivo.close()
+        try:
+            os.unlink(self.caminho)
+        except FileNotFoundError:
+            pass
+
+
+# --- Itens e anexos ---
+def item_do_usuario(tipo, item_id, usuario_id):
+    """True se a tarefa/lançamento existe (na tabela quente ou no arquivo) e é do usuário."""
+    if tipo not in ITENS:
+        return False
+    return any(modelo.select().where((modelo.id == item_id) & (dono == usuario_id)).exists()
+               for modelo, dono in ITENS[tipo])
+
+def guardar(gravacao, usuario_id, tipo, item_id, nome):
+    """Move o envio para o armazenamento por conteúdo e registra o anexo."""
+    gravacao.fechar()
+    if gravacao.tamanho == 0:
+        gravacao.descartar()
+        raise AnexoInvalido("Arquivo vazio.")
+    hash_ = gravacao.hash
+    try:
+        with db.atomic():
+            # Conferência final da cota (envios simultâneos do mesmo usuário)
+            if usado(usuario_id) + gravacao.tamanho > ANEXOS_COTA_BYTES:
+                raise CotaExcedida("Cota de anexos esgotada.")
+            agora = datetime.now()
+            (Arquivo
+             .insert(hash=hash_, tamanho=gravacao.tamanho, tipo=detectar_tipo(gravacao.inicio),
+                     criado_em=agora)
+             .on_conflict_ignore()
+             .execute())
+            # Conteúdo já conhecido: renova a data para a coleta de órfãos não levá-lo agora
+            Arquivo.update(criado_em=agora).where(Arquivo.hash == hash_).execute()
+            destino = caminho_objeto(hash_)
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            # Conteúdo repetido: o rename sobrescreve com os mesmos bytes (e refaz um objeto perdido)
+            os.replace(gravacao.caminho, destino)
+            return Anexo.create(usuario=usuario_id, nome=_nome_seguro(nome), tamanho=gravacao.tamanho,
+                                arquivo=hash_, **{f"{tipo}_id": item_id})
+    finally:
+        gravacao.descartar()
+
+def listar(tipo, item_id, usuario_id):
+    coluna = getattr(Anexo, f"{tipo}_id")
+    return list(Anexo
+                .select(Anexo, Arquivo.tipo)
+                .join(Arquivo)
+                .where((Anexo.usuario == usuario_id) & (coluna == item_id))
+                .order_by(Anexo.id))
+
+def obter(anexo_id, usuario_id):
+    return (Anexo
+            .select(Anexo, Arquivo)
+            .join(Arquivo)
+            .where((Anexo.id == anexo_id) & (Anexo.usuario == usuario_id))
+            .first())
+
+def remover(anexo_id, usuario_id):
+    """Apaga o anexo; o conteúdo fica para `limpar_orfaos` (pode ser de outro anexo)."""
+    return Anexo.delete().where((Anexo.id == anexo_id) & (Anexo.usuario == usuario_id)).execute()
+
+def remover_do_item(tipo, item_id, usuario_id):
+    coluna = getattr(Anexo, f"{tipo}_id")
+    return Anexo.delete().where((Anexo.usuario == usuario_id) & (coluna == item_id)).execute()
+
+def limpar_orfaos(idade_minutos=60, lote=500):
+    """Apaga conteúdos sem nenhum anexo há mais de `idade_minutos` (e as miniaturas). Retorna a quantidade."""
+    limite = datetime.now() - timedelta(minutes=idade_minutos)
+    sem_anexo = ~fn.EXISTS(Anexo.select(Anexo.id).where(Anexo.arquivo == Arquivo.hash))
+    apagados = 0
+    while True:
+        hashes = [a.hash for a in Arquivo.select(Arquivo.hash)
+                  .where((Arquivo.criado_em < limite) & sem_anexo).limit(lote)]
+        if not hashes:
+            return apagados
+        for hash_ in hashes:
+            # Refaz a condição no DELETE: um envio pode ter reaproveitado o conteúdo nesse meio tempo
+            if Arquivo.delete().where((Arquivo.hash == hash_) & (Arquivo.criado_em < limite)
+                                      & sem_anexo).execute():
+                for caminho in (caminho_objeto(hash_), caminho_miniatura(hash_)):
+                    try:
+                        os.unlink(caminho)
+                    except FileNotFoundError:
+                        pass
+                apagados += 1
+        if len(hashes) < lote:
+            return apagados
+
+
+# --- Miniaturas ---
+def tem_miniatura(tipo):
+    return Image is not None and tipo.startswith("image/")
+
+def _gerar_miniatura(hash_):
+    destino = caminho_miniatura(hash_)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporario = f"{destino}.{threading.get_ident()}.tmp"
+    try:
+        with Image.open(caminho_objeto(hash_)) as imagem:
+            imagem.draft("RGB", (MINIATURA_LADO, MINIATURA_LADO))  # JPEG: decodifica já reduzido
+            imagem = ImageOps.exif_transpose(imagem)
+            imagem.thumbnail((MINIATURA_LADO, MINIATURA_LADO))
+            imagem.convert("RGB").save(temporario, "JPEG", quality=80, optimize=True)
+        os.replace(temporario, destino)
+    except Exception:
+        logger.exception("Falha ao gerar a miniatura de %s", hash_)
+        try:
+            os.unlink(temporario)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class PoolMiniaturas:
+    """Gera miniaturas em segundo plano, sem repetir um hash que já está na fila."""
+
+    def __init__(self, workers=MINIATURAS_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._pendentes = {}
+        self.falhas = set()  # imagens que o Pillow não conseguiu abrir (não tenta de novo)
+        self._lock = threading.Lock()
+
+    def agendar(self, hash_):
+        with self._lock:
+            if hash_ in self._pendentes:
+                return self._pendentes[hash_]
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix="miniaturas")
+            futuro = self._executor.submit(_gerar_miniatura, hash_)
+            self._pendentes[hash_] = futuro
+        futuro.add_done_callback(lambda f: self._concluir(hash_, f))
+        return futuro
+
+    def _concluir(self, hash_, futuro):
+        with self._lock:
+            self._pendentes.pop(hash_, None)
+            if futuro.exception() is not None:
+                self.falhas.add(hash_)
+
+    def parar(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+miniaturas = PoolMiniaturas()
@@ -0,0 +1,185 @@
+"""API JSON assíncrona (ASGI) para as leituras do calendário e das finanças.
+
+    uvicorn api_async:app --host 0.0.0.0 --port 5002
+
+Atende as rotas de `app_mysql.API_JSON` (/api/tarefas, /financas/data,
+/api/financas, /api/busca, /api/relatorios...) com as mesmas funções, os
+mesmos modelos e a mesma sessão da aplicação Flask: o proxy manda esses
+caminhos para cá e o resto (páginas, formulários, escrita) para o gunicorn.
+
+No MySQL as consultas passam pelo pool assíncrono do Peewee
+(playhouse.pwasyncio, driver aiomysql): as funções das rotas continuam
+síncronas, `AsyncMySQLDatabase.run` as executa num greenlet e cada consulta
+devolve o event loop enquanto espera o banco. Uma requisição parada no MySQL
+não segura thread, então um processo atende muitas requisições simultâneas
+do calendário. O cache (Redis, cliente síncrono) é consultado do greenlet por
+uma thread (`BackendEmThread`), para não bloquear o event loop. Com
+SQLITE_PATH (desenvolvimento) as funções rodam em threads.
+"""
+import asyncio
+import logging
+import os
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_cookie, parse_etags
+
+import app_mysql
+import cache
+import fragmentos
+import resumo
+from busca import BuscaInvalida
+from sessao import SessaoBackend
+from modelos import (db, MODELOS, SQLITE_PATH, MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD,
+                     MYSQL_DATABASE)
+
+logger = logging.getLogger("datefy.api_async")
+
+ASYNC_POOL_MAX = int(os.getenv("ASYNC_POOL_MAX", "20"))
+ASYNC_POOL_TIMEOUT = float(os.getenv("ASYNC_POOL_TIMEOUT", "10"))
+
+# Só para a configuração (chave secreta, interface de sessão, JSON); não atende requisições
+flask_app = app_mysql.create_app()
+
+if SQLITE_PATH:
+    banco = None
+
+    async def executar(fn, *args):
+        def rodar():
+            with db.connection_context():
+                return fn(*args)
+        return await asyncio.to_thread(rodar)
+else:
+    from greenlet import getcurrent
+    from playhouse.pwasyncio import AsyncMySQLDatabase, await_
+
+    class BackendEmThread(cache.BackendCache):
+        """Backend de cache para as rotas que rodam no greenlet de `banco.run`.
+
+        O cliente Redis é síncrono: chamado direto do greenlet ele seguraria o
+        event loop durante a ida ao Redis. Aqui cada operação vai para uma
+        thread e o greenlet espera por ela com await_(), como as consultas.
+        Fora do greenlet (threads, configuração) a chamada é direta.
+        """
+
+        def __init__(self, backend):
+            self._backend = backend
+
+        def _chamar(self, fn, *args):
+            if getcurrent().parent is None:
+                return fn(*args)
+            return await_(asyncio.to_thread(fn, *args))
+
+        def obter(self, chave):
+            return self._chamar(self._backend.obter, chave)
+
+        def definir(self, chave, valor, ttl=None):
+            return self._chamar(self._backend.definir, chave, valor, ttl)
+
+        def apagar(self, chave):
+            return self._chamar(self._backend.apagar, chave)
+
+        def incrementar(self, chave):
+            return self._chamar(self._backend.incrementar, chave)
+
+        def estatisticas(self):
+            return self._backend.estatisticas()
+
+    # Caches que as rotas de API_JSON consultam (a sessão já é lida numa thread)
+    _backend_em_thread = BackendEmThread(cache.backend)
+    for _cache in (resumo.cache_resumo, app_mysql.cache_perfil, fragmentos.cache_fragmentos):
+        _cache.backend = _backend_em_thread
+
+    banco = AsyncMySQLDatabase(
+        MYSQL_DATABASE,
+        user=MYSQL_USER,
+        password=MYSQL_PASSWORD,
+        host=MYSQL_HOST,
+        port=MYSQL_PORT,
+        pool_size=ASYNC_POOL_MAX,
+        acquire_timeout=ASYNC_POOL_TIMEOUT,
+    )
+    # Neste processo os modelos consultam pelo pool assíncrono
+    banco.bind(MODELOS)
+
+    async def executar(fn, *args):
+        try:
+            return await banco.run(fn, *args)
+        finally:
+            # Devolve a conexão ao pool assim que a rota termina
+            await banco.aclose()
+
+
+# --- Sessão ---
+class _RequisicaoCookies:
+    """O que a interface de sessão do Flask lê do request: só os cookies."""
+
+    def __init__(self, cabecalho):
+        self.cookies = parse_cookie(cabecalho)
+
+def usuario_da_sessao(cabecalho_cookie):
+    """user_id da sessão do Flask (cookie assinado ou sessão no servidor), ou None."""
+    interface = flask_app.session_interface
+    sessao = interface.open_session(flask_app, _RequisicaoCookies(cabecalho_cookie))
+    user_id = sessao.get("user_id") if sessao is not None else None
+    if user_id and isinstance(interface, SessaoBackend):
+        # Uso da API conta como atividade (expiração deslizante, como no Flask)
+        interface.renovar(sessao)
+    return user_id
+
+
+# --- ASGI ---
+async def _responder(send, status, dados=None, cabecalhos=None, corpo=True):
+    conteudo = b""
+    if status != 304:
+        conteudo = (flask_app.json.dumps(dados, separators=(",", ":")) + "\n").encode()
+    lista = [(b"content-type", b"application/json"), (b"vary", b"Cookie")]
+    if status != 304:
+        lista.append((b"content-length", str(len(conteudo)).encode()))
+    lista += [(k.lower().encode("latin-1"), str(v).encode("latin-1"))
+              for k, v in (cabecalhos or {}).items()]
+    await send({"type": "http.response.start", "status": status, "headers": lista})
+    await send({"type": "http.response.body", "body": conteudo if corpo else b""})
+
+async def _ciclo_de_vida(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif mensagem["type"] == "lifespan.shutdown":
+            if banco is not None:
+                await banco.close_pool()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _ciclo_de_vida(receive, send)
+    if scope["type"] != "http":
+        return
+
+    caminho = scope["path"]
+    if caminho == "/healthz":
+        return await _responder(send, 200, {"status": "ok"})
+    rota = app_mysql.API_JSON.get(caminho)
+    if rota is None:
+        return await _responder(send, 404, {"error": "Não encontrado"})
+    if scope["method"] not in ("GET", "HEAD"):
+        return await _responder(send, 405, {"error": "Método não permitido"}, {"Allow": "GET, HEAD"})
+
+    cabecalhos = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+    # O backend de sessão (Redis) é síncrono: a leitura vai para uma thread
+    user_id = await asyncio.to_thread(usuario_da_sessao, cabecalhos.get("cookie", ""))
+    if not user_id:
+        return await _responder(send, 401, {"error": "Não autorizado"})
+
+    args = MultiDict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+    etags = parse_etags(cabecalhos.get("if-none-match"))
+    try:
+        dados, status, extra = await executar(rota, user_id, args, etags)
+    except BuscaInvalida as e:
+        dados, status, extra = {"error": str(e)}, 400, {}
+    except Exception:
+        logger.exception("Erro em %s", caminho)
+        dados, status, extra = {"error": "Erro interno"}, 500, {}
+    await _responder(send, status, dados, extra, corpo=scope["method"] != "HEAD")
@@ -1,104 +1,113 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from flask_bcrypt import Bcrypt
+from flask import (Flask, Blueprint, current_app, render_template, request, redirect, url_for, flash,
+                   session, jsonify, stream_with_context, send_file)
 import os
+import atexit
+import socket
+import time
+import click
 # --- PEEWEE / MYSQL IMPORTS ---
 from peewee import *
 from playhouse.shortcuts import model_to_dict
+from playhouse.pool import PooledMySQLDatabase
+from werkzeug.formparser import parse_form_data
+from werkzeug.http import http_date, quote_etag
 from decimal import Decimal
-from datetime import datetime
-
-from reset_senha_email import enviar_email
+from datetime import datetime, timedelta
+
+import reset_senha_email
+from reset_senha_email import montar_email
+from fila_email import FilaEmail, PoolSMTP
+from senhas import PoolSenhas, SenhasOcupado, medir as medir_senhas
+import migracoes
+import metricas
+import cache
+import compressao
+import fragmentos
+from sessao import SessaoBackend
+from resumo import obter_resumo, invalidar_resumo, agrupar_por_categoria, cache_resumo
+from saldos import atualizar_saldo, verificar_saldos, reconstruir_saldos
+import parcelamento
+import notificacoes
+import arquivamento
+import anexos
+import compartilhamento
+from relatorios import relatorio_periodo
+from dados_sinteticos import gerar_dados, BENCH_SENHA
+from busca import BuscaInvalida, ler_filtros, filtrar_tarefas, filtrar_financas
+from importacao import (validar_lancamento, LancamentoInvalido, importar, ler_csv, ler_ofx,
+                        abrir_texto, detectar_formato, exportar_csv)
+from modelos import (db, roteador, MYSQL_HOST, MYSQL_PORT, Usuario, Tarefa, Financa, SaldoMensal,
+                     TarefaArquivada, FinancaArquivada, FeedCompartilhado, EmailFalho, create_tables)
 
 # ------------------------------
 
-app = Flask(__name__)
-# A chave secreta é usada para sessões.
-app.secret_key = os.getenv("SECRET_KEY", "minha_chave_segura")
-bcrypt = Bcrypt(app)
-
-# ---------------- CONFIGURAÇÕES DO MYSQL COM PEEWEE ----------------
-MYSQL_HOST = os.getenv("MYSQL_HOST", "datefy_mysql")
-MYSQL_USER = os.getenv("MYSQL_USER", "datefy_user")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "senac")
-MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "datefy_db")
-MYSQL_PORT = int(os.getenv("MYSQL_PORT", "3306"))
-
-# Configuração do banco de dados Peewee (MySQL)
-db = MySQLDatabase(
-    MYSQL_DATABASE,
-    user=MYSQL_USER,
-    password=MYSQL_PASSWORD,
-    host=MYSQL_HOST,
-    port=MYSQL_PORT,
-    ssl=False,
-    connect_timeout=5,
-)
-
-# --- Definição dos Modelos (Mapeamento ORM) ---
-class BaseModel(Model):
-    class Meta:
-        database = db
-
-class Usuario(BaseModel):
-    nome = CharField()
-    email = CharField(unique=True)
-    senha_hash = CharField()
-
-    class Meta:
-        table_name = 'usuarios'
-
-class Tarefa(BaseModel):
-    user = ForeignKeyField(Usuario, backref='tarefas', column_name='user_id')
-    titulo = CharField()
-    descricao = TextField(null=True)
-    data = CharField()  # Formato YYYY-MM-DD
-    categoria = CharField(null=True)
-    status = IntegerField(default=0)  # 0: pendente, 1: concluída
-
-    class Meta:
-        table_name = 'tarefas'
-
-class Financa(BaseModel):
-    usuario = ForeignKeyField(Usuario, backref='financas', column_name='usuario_id')
-    descricao = CharField(null=True)
-    categoria = CharField(null=True)
-    tipo = CharField(max_length=10)  # 'entrada' ou 'saida'
-    valor = FloatField()
-    forma_pagamento = CharField(null=True)
-    parcelas = IntegerField(default=1)
-    data = CharField(null=True)  # YYYY-MM-DD
-
-    class Meta:
-        table_name = 'financas'
+# Importar este módulo não abre conexões nem cria tabelas: a aplicação é montada
+# em create_app() e o schema é criado explicitamente com `flask criar-tabelas`.
+bp = Blueprint("main", __name__, cli_group=None)
+
+def create_app(config=None):
+    """Cria e configura a aplicação Flask."""
+    app = Flask(__name__)
+    # A chave secreta é usada para sessões.
+    app.secret_key = os.getenv("SECRET_KEY", "minha_chave_segura")
+    if config:
+        app.config.update(config)
+
+    app.register_blueprint(bp)
+
+    # Sessão no servidor (backend de cache compartilhado): o cookie leva só o id.
+    # Ligada por padrão quando o cache é o Redis, que é visto por todos os workers.
+    padrao = "1" if isinstance(cache.backend, cache.CacheRedis) else "0"
+    if app.config.get("SESSAO_SERVIDOR", os.getenv("SESSAO_SERVIDOR", padrao) == "1"):
+        app.session_interface = SessaoBackend(cache.backend,
+                                              ttl=int(os.getenv("SESSAO_TTL", "900")))
+
+    # Tag {% cache %} nos templates (fragmentos por usuário) e templates compilados já na subida
+    fragmentos.instalar(app)
+    # ETag forte e gzip/brotli nas respostas HTML/JSON (COMPRESSAO=0 se o proxy já comprime)
+    if app.config.get("COMPRESSAO", os.getenv("COMPRESSAO", "1") == "1"):
+        compressao.instalar(app)
+
+    # Instrumentação opcional: latência por endpoint, consultas por requisição e /metrics
+    if app.config.get("METRICAS", os.getenv("METRICAS", "0") == "1"):
+        metricas.instalar(app, db, limiar_lento_ms=float(os.getenv("METRICAS_LENTO_MS", "500")))
+    return app
 
 # --- Hooks para gerenciamento de conexão (Peewee/Flask) ---
-@app.before_request
-def before_request():
-    """Abre a conexão antes de processar a requisição (se necessário)."""
-    try:
-        if db.is_closed():
-            db.connect()
-    except Exception as e:
-        # evita quebrar a aplicação inteira caso o DB esteja indisponível
-        app.logger.exception("Falha ao conectar ao banco: %s", e)
-
-@app.teardown_request
+# A conexão não é mais aberta no before_request: o Peewee conecta sob demanda
+# na primeira consulta, então rotas que só renderizam templates (ex: /add-tarefa)
+# não pegam conexão do pool.
+@bp.before_app_request
+def escolher_banco_leitura():
+    """Escolhe a réplica (ou o primário) que atende os SELECTs desta requisição."""
+    roteador.iniciar(session.get("escrita_em"))
+
+@bp.after_app_request
+def lembrar_escrita(resposta):
+    # Read-your-writes: as próximas requisições da sessão só leem de réplicas
+    # que já tenham alcançado este instante
+    if roteador.escreveu():
+        session["escrita_em"] = time.time()
+    return resposta
+
+@bp.teardown_app_request
 def teardown_request(exception):
-    """Garante o fechamento da conexão mesmo em exceções."""
+    """Devolve a conexão ao pool (ou fecha) mesmo em exceções."""
     try:
         if not db.is_closed():
             db.close()
     except Exception:
         pass
+    roteador.encerrar()
 
-# --- Criação das tabelas necessárias (apenas durante desenvolvimento) ---
-def create_tables():
-    with db:
-        db.create_tables([Usuario, Tarefa, Financa], safe=True)
+@bp.cli.command("migrar")
+@click.option("--lote", type=int, default=1000, help="Linhas por lote no backfill.")
+def migrar_command(lote):
+    """Aplica as migrações de schema pendentes (índices e tipos de coluna)."""
+    executadas = migracoes.aplicar_migracoes(db, log=click.echo, lote=lote)
+    click.echo(f"{len(executadas)} migração(ões) aplicada(s).")
 
 # Aguarda o DB ficar acessível antes de tentar criar as tabelas
-import socket, time
-
 def wait_for_db(host, port, timeout=60):
     deadline = time.time() + timeout
     while time.time() < deadline:
@@ -110,14 +119,71 @@ def wait_for_db(host, port, timeout=60):
             time.sleep(1)
     return False
 
-if wait_for_db(MYSQL_HOST, MYSQL_PORT, timeout=60):
-    try:
-        create_tables()
-    except Exception as e:
-        app.logger.warning("Não foi possível criar tabelas automaticamente: %s", e)
-else:
-    app.logger.warning("Banco de dados não alcançável em %s:%s — pulando criação automática de tabelas", MYSQL_HOST, MYSQL_PORT)
+@bp.cli.command("criar-tabelas")
+@click.option("--aguardar", type=int, default=0, help="Segundos esperando o MySQL aceitar conexões.")
+def criar_tabelas_command(aguardar):
+    """Cria as tabelas que ainda não existem."""
+    if aguardar and not wait_for_db(MYSQL_HOST, MYSQL_PORT, timeout=aguardar):
+        raise click.ClickException(f"Banco de dados não alcançável em {MYSQL_HOST}:{MYSQL_PORT}")
+    create_tables()
+    click.echo("Tabelas criadas.")
+
+# --- Fila de e-mails (envio em segundo plano) ---
+def registrar_email_falho(mensagem, tentativas, erro):
+    with db.connection_context():
+        EmailFalho.create(
+            destinatario=mensagem["To"],
+            assunto=mensagem["Subject"],
+            mensagem=mensagem.as_string(),
+            tentativas=tentativas,
+            erro=erro,
+        )
 
+fila_email = FilaEmail(
+    PoolSMTP(
+        reset_senha_email.SMTP_HOST,
+        reset_senha_email.SMTP_PORT,
+        usuario=reset_senha_email.SMTP_USER,
+        senha=reset_senha_email.SMTP_PASSWORD,
+        starttls=reset_senha_email.SMTP_STARTTLS,
+        max_conexoes=int(os.getenv("SMTP_POOL_MAX", "2")),
+    ),
+    workers=int(os.getenv("EMAIL_WORKERS", "1")),
+    max_tentativas=int(os.getenv("EMAIL_MAX_TENTATIVAS", "5")),
+    backoff_base=float(os.getenv("EMAIL_BACKOFF_BASE", "2")),
+    ao_falhar=registrar_email_falho,
+)
+atexit.register(fila_email.parar)
+
+# --- Hash de senhas (bcrypt) em pool próprio, com rejeição rápida quando saturado ---
+pool_senhas = PoolSenhas(
+    workers=int(os.getenv("SENHA_WORKERS", "2")),
+    max_fila=int(os.getenv("SENHA_FILA_MAX", "8")),
+    timeout=float(os.getenv("SENHA_TIMEOUT", "10")),
+)
+atexit.register(pool_senhas.parar)
+
+@bp.app_errorhandler(SenhasOcupado)
+def senhas_ocupado(erro):
+    return ("Servidor ocupado, tente novamente em alguns segundos.", 503,
+            {"Retry-After": "2", "Content-Type": "text/plain; charset=utf-8"})
+
+def _salvar_rehash(user_id):
+    def salvar(novo_hash):
+        with db.connection_context():
+            Usuario.update(senha_hash=novo_hash).where(Usuario.id == user_id).execute()
+    return salvar
+
+# --- Cache do perfil (nome/e-mail), compartilhado entre workers ---
+cache_perfil = cache.CacheVersionado(cache.backend, "perfil",
+                                     ttl=float(os.getenv("PERFIL_CACHE_TTL", "300")))
+
+def obter_perfil(user_id):
+    def consultar():
+        user_model = Usuario.get_or_none(Usuario.id == user_id)
+        return model_to_dict(user_model, only=[Usuario.nome, Usuario.email, Usuario.notif_email,
+                                               Usuario.notif_push, Usuario.notif_relatorio]) if user_model else None
+    return cache_perfil.obter_ou_calcular(user_id, consultar)
 
 # --- Categorias ---
 CATEGORIAS = [
@@ -133,12 +199,415 @@ CATEGORIAS = [
     {"key": "lazer", "label": "Lazer", "color": "#FFC107"},
 ]
 
+@bp.cli.command("verificar-saldos")
+@click.option("--usuario", type=int, default=None, help="Verifica apenas um usuário.")
+@click.option("--reparar", is_flag=True, help="Reconstrói os saldos divergentes.")
+def verificar_saldos_command(usuario, reparar):
+    """Compara financas_saldos com a tabela financas."""
+    divergencias = verificar_saldos(usuario)
+    for chave, esperado, gravado in divergencias:
+        click.echo(f"{chave}: esperado={esperado} gravado={gravado}")
+    click.echo(f"{len(divergencias)} divergência(s) encontrada(s).")
+
+    if reparar and divergencias:
+        usuarios = sorted({chave[0] for chave, _, _ in divergencias})
+        for u in usuarios:
+            reconstruir_saldos(u)
+        click.echo(f"Saldos reconstruídos para {len(usuarios)} usuário(s).")
+    elif divergencias:
+        raise SystemExit(1)
+
+def _consultas_diagnostico(user_id):
+    hoje = datetime.now().date()
+    return {
+        "tarefas do dia (dashboard)": (Tarefa.select()
+            .where((Tarefa.user == user_id) & (Tarefa.data == hoje) & (Tarefa.status == 0))),
+        "calendário (/api/tarefas)": (Tarefa.select(Tarefa.titulo, Tarefa.data)
+            .where((Tarefa.user == user_id) & (Tarefa.status == 0))),
+        "vida pessoal": (Tarefa.select()
+            .where(Tarefa.user == user_id).order_by(Tarefa.data.asc())),
+        "lançamentos (/financas)": (Financa.select()
+            .where(Financa.usuario == user_id).order_by(Financa.data.desc())),
+        "saídas por data": (Financa.select()
+            .where((Financa.usuario == user_id) & (Financa.tipo == 'saida'))
+            .order_by(Financa.data.desc())),
+        "totais por categoria": (Financa
+            .select(Financa.categoria, Financa.tipo, fn.SUM(Financa.valor))
+            .where(Financa.usuario == user_id)
+            .group_by(Financa.categoria, Financa.tipo)),
+    }
+
+@bp.cli.command("explicar-consultas")
+@click.option("--usuario", type=int, default=1, help="Usuário usado nas consultas.")
+def explicar_consultas_command(usuario):
+    """Mostra o EXPLAIN das consultas principais (índice usado, filesort etc.)."""
+    for nome, query in _consultas_diagnostico(usuario).items():
+        click.echo(f"== {nome}")
+        for linha in migracoes.explicar(db, query):
+            if "key" in linha:
+                click.echo(f"   tabela={linha.get('table')} tipo={linha.get('type')} "
+                           f"indice={linha.get('key')} linhas={linha.get('rows')} "
+                           f"extra={linha.get('Extra')}")
+            else:
+                click.echo(f"   {linha.get('detail', linha)}")
+
+@bp.cli.command("reconstruir-saldos")
+@click.option("--usuario", type=int, default=None, help="Reconstrói apenas um usuário.")
+def reconstruir_saldos_command(usuario):
+    """Recalcula financas_saldos a partir da tabela financas."""
+    n = reconstruir_saldos(usuario)
+    click.echo(f"{n} linha(s) de saldo gravada(s).")
+
+# --- Paginação por cursor (keyset) em (data, id) ---
+LIMITE_PADRAO = int(os.getenv("LISTAGEM_LIMITE_PADRAO", "50"))
+LIMITE_MAXIMO = 200
+
+def _parse_data(valor):
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date() if valor else None
+    except ValueError:
+        return None
+
+def _ler_cursor(valor):
+    """Cursor no formato 'YYYY-MM-DD_id' ('_id' quando a data é nula)."""
+    if not valor or "_" not in valor:
+        return None
+    data, _, id_ = valor.rpartition("_")
+    if not id_.isdigit():
+        return None
+    return (_parse_data(data), int(id_))
+
+def _parametros_listagem(args=None):
+    """Lê limite, cursor e intervalo de datas (de/ate) da query string."""
+    args = request.args if args is None else args
+    limite = args.get("limite", type=int) or LIMITE_PADRAO
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+    return {
+        "limite": limite,
+        "cursor": _ler_cursor(args.get("cursor")),
+        "de": _parse_data(args.get("de")),
+        "ate": _parse_data(args.get("ate")),
+    }
+
+def _pagina(query, campo_data, campo_id, limite, cursor=None, de=None, ate=None, desc=False):
+    if de:
+        query = query.where(campo_data >= de)
+    if ate:
+        query = query.where(campo_data <= ate)
+
+    if cursor:
+        data, id_ = cursor
+        if desc:
+            if data is None:
+                cond = campo_data.is_null() & (campo_id < id_)
+            else:
+                cond = ((campo_data < data) | campo_data.is_null() |
+                        ((campo_data == data) & (campo_id < id_)))
+        else:
+            if data is None:
+                cond = (campo_data.is_null() & (campo_id > id_)) | campo_data.is_null(False)
+            else:
+                cond = (campo_data >= data) & ((campo_data > data) | (campo_id > id_))
+        query = query.where(cond)
+
+    if desc:
+        query = query.order_by(campo_data.desc(), campo_id.desc())
+    else:
+        query = query.order_by(campo_data.asc(), campo_id.asc())
+    return list(query.limit(limite + 1).dicts())
+
+def paginar(query, campo_data, campo_id, limite, cursor=None, de=None, ate=None, desc=False,
+            arquivo=None):
+    """Aplica filtro de datas e paginação keyset ordenando por (data, id).
+
+    Datas nulas são tratadas como menores que qualquer data (como no MySQL),
+    ou seja, aparecem no começo em ordem crescente e no fim em decrescente.
+    `arquivo` é um (query, campo_data, campo_id) da tabela de arquivo: as duas
+    páginas são lidas com o mesmo cursor e intercaladas (o arquivamento
+    preserva os ids, então o cursor continua único).
+    Retorna (linhas, próximo_cursor); próximo_cursor é None na última página.
+    """
+    linhas = _pagina(query, campo_data, campo_id, limite, cursor, de, ate, desc)
+    if arquivo is not None:
+        linhas += _pagina(*arquivo, limite, cursor, de, ate, desc)
+        linhas.sort(key=lambda l: (l[campo_data.name] is not None, l[campo_data.name] or "",
+                                   l[campo_id.name]), reverse=desc)
+    proximo = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        ultima = linhas[-1]
+        data = ultima[campo_data.name]
+        proximo = f"{data.isoformat() if data else ''}_{ultima[campo_id.name]}"
+    return linhas, proximo
+
+def _serializar(linha):
+    """Converte date/Decimal para tipos JSON."""
+    saida = {}
+    for k, v in linha.items():
+        if hasattr(v, "isoformat"):
+            v = v.isoformat()
+        elif isinstance(v, Decimal):
+            v = float(v)
+        saida[k] = v
+    return saida
+
+def marcar_tarefas_alteradas(user_id):
+    """Incrementa a versão das tarefas do usuário (invalida o ETag do calendário)."""
+    (Usuario
+     .update(tarefas_versao=Usuario.tarefas_versao + 1, tarefas_alterado_em=datetime.now())
+     .where(Usuario.id == user_id)
+     .execute())
+
+def dados_alterados(user_id):
+    """Chamar depois de gravar tarefas ou lançamentos: invalida o resumo e os fragmentos do usuário."""
+    invalidar_resumo(user_id)
+    fragmentos.invalidar(user_id)
+
+def feeds_alterados(destinatarios):
+    """Depois de um fan-out do compartilhamento: invalida os fragmentos de quem recebeu."""
+    for user_id in destinatarios:
+        fragmentos.invalidar(user_id)
+
+def _listar_tarefas(user_id, params, filtros=None):
+    filtros = filtros or {}
+    query = filtrar_tarefas(Tarefa.select().where(Tarefa.user == user_id), filtros)
+    arquivo = None
+    if filtros.get("arquivadas"):
+        arquivo = (filtrar_tarefas(TarefaArquivada.select().where(TarefaArquivada.user == user_id),
+                                   filtros, TarefaArquivada),
+                   TarefaArquivada.data, TarefaArquivada.id)
+    return paginar(query, Tarefa.data, Tarefa.id, arquivo=arquivo, **params)
+
+def _listar_financas(user_id, params, filtros=None):
+    filtros = filtros or {}
+    query = filtrar_financas(Financa.select().where(Financa.usuario == user_id), filtros)
+    arquivo = None
+    if filtros.get("arquivadas"):
+        arquivo = (filtrar_financas(FinancaArquivada.select().where(FinancaArquivada.usuario == user_id),
+                                    filtros, FinancaArquivada),
+                   FinancaArquivada.data, FinancaArquivada.id)
+    return paginar(query, Financa.data, Financa.id, desc=True, arquivo=arquivo, **params)
+
+def _listar_compartilhadas(user_id, params, filtros=None):
+    """Tarefas compartilhadas com o usuário: uma faixa do índice (destinatario, data, tarefa_id) do feed."""
+    query = filtrar_tarefas(
+        FeedCompartilhado
+        .select(FeedCompartilhado.tarefa_id, FeedCompartilhado.dono_nome, FeedCompartilhado.titulo,
+                FeedCompartilhado.descricao, FeedCompartilhado.data, FeedCompartilhado.categoria,
+                FeedCompartilhado.status)
+        .where(FeedCompartilhado.destinatario == user_id),
+        filtros or {}, FeedCompartilhado)
+    return paginar(query, FeedCompartilhado.data, FeedCompartilhado.tarefa_id, **params)
+
+def _filtros_url():
+    """Filtros de busca presentes na URL, para repassar aos links de paginação."""
+    return {k: request.args[k] for k in ("q", "categoria", "status", "tipo", "arquivadas")
+            if request.args.get(k)}
+
+@bp.app_errorhandler(BuscaInvalida)
+def busca_invalida(erro):
+    if request.path.startswith("/api/"):
+        return jsonify({"error": str(erro)}), 400
+    flash(str(erro), "warning")
+    return redirect(request.path)
+
+# ---------------- API JSON (compartilhada com api_async.py) ----------------
+# As rotas JSON de leitura são funções (user_id, args, etags) -> (dados, status, cabeçalhos)
+# que não dependem do request do Flask: as rotas abaixo e a API assíncrona chamam as mesmas.
+def _responder(dados, status=200, cabecalhos=None):
+    resp = current_app.response_class(status=304) if status == 304 else jsonify(dados)
+    resp.status_code = status
+    resp.headers.update(cabecalhos or {})
+    return resp
+
+def json_tarefas(user_id, args, etags):
+    """Tarefas pendentes no intervalo visível do FullCalendar, com ETag pela versão das tarefas."""
+    # Intervalo visível do FullCalendar (ex: 2025-01-26T00:00:00-03:00); 'end' é exclusivo
+    inicio = _parse_data(args.get("start", "")[:10])
+    fim = _parse_data(args.get("end", "")[:10])
+
+    # Responde 304 sem consultar as tarefas se nada mudou desde a última visita
+    versao = (Usuario
+              .select(Usuario.tarefas_versao, Usuario.tarefas_alterado_em)
+              .where(Usuario.id == user_id)
+              .dicts()
+              .first()) or {"tarefas_versao": 0, "tarefas_alterado_em": None}
+    etag = f"t{user_id}-{versao['tarefas_versao']}-{inicio or ''}-{fim or ''}"
+    cabecalhos = {"ETag": quote_etag(etag), "Cache-Control": "private, no-cache"}
+    if compressao.etag_confere(etag, etags):
+        return None, 304, cabecalhos
+
+    tarefas = (Tarefa
+               .select(Tarefa.titulo, Tarefa.data)
+               .where((Tarefa.user == user_id) & (Tarefa.status == 0))
+              )
+    if inicio:
+        tarefas = tarefas.where(Tarefa.data >= inicio)
+    if fim:
+        tarefas = tarefas.where(Tarefa.data < fim)
+
+    # Compartilhadas com o usuário: vêm do feed materializado, sem junção com as tarefas dos donos
+    compartilhadas = (FeedCompartilhado
+                      .select(FeedCompartilhado.titulo, FeedCompartilhado.data, FeedCompartilhado.dono_nome)
+                      .where((FeedCompartilhado.destinatario == user_id) & (FeedCompartilhado.status == 0)))
+    if inicio:
+        compartilhadas = compartilhadas.where(FeedCompartilhado.data >= inicio)
+    if fim:
+        compartilhadas = compartilhadas.where(FeedCompartilhado.data < fim)
+
+    eventos = []
+    for tarefa in tarefas.dicts():
+        # Garante que a data esteja no formato ISO (YYYY-MM-DD)
+        eventos.append({
+            "title": tarefa["titulo"],
+            "start": tarefa["data"].isoformat(),
+            "allDay": True,
+            "color": "#FF5722"
+        })
+    for tarefa in compartilhadas.dicts():
+        eventos.append({
+            "title": f"{tarefa['titulo']} ({tarefa['dono_nome']})",
+            "start": tarefa["data"].isoformat(),
+            "allDay": True,
+            "color": "#3F51B5"
+        })
+
+    if versao["tarefas_alterado_em"]:
+        cabecalhos["Last-Modified"] = http_date(versao["tarefas_alterado_em"])
+    return eventos, 200, cabecalhos
+
+def json_vida_pessoal(user_id, args, etags):
+    tarefas, proximo = _listar_tarefas(user_id, _parametros_listagem(args), ler_filtros(args))
+    return {"itens": [_serializar(t) for t in tarefas], "proximo_cursor": proximo}, 200, {}
+
+def json_compartilhadas(user_id, args, etags):
+    tarefas, proximo = _listar_compartilhadas(user_id, _parametros_listagem(args), ler_filtros(args))
+    return {"itens": [_serializar(t) for t in tarefas], "proximo_cursor": proximo}, 200, {}
+
+def json_financas(user_id, args, etags):
+    registros, proximo = _listar_financas(user_id, _parametros_listagem(args), ler_filtros(args))
+    return {"itens": [_serializar(r) for r in registros], "proximo_cursor": proximo}, 200, {}
+
+def json_financas_fluxo(user_id, args, etags):
+    """Entradas/saídas por mês, com as parcelas distribuídas nos meses em que vencem."""
+    hoje = datetime.now().date()
+    de = _parse_data(args.get("de", "")) or hoje.replace(day=1)
+    ate = _parse_data(args.get("ate", "")) or parcelamento.somar_meses(de, 12) - timedelta(days=1)
+    if ate < de or parcelamento.somar_meses(de, 120) <= ate:
+        return {"error": "Intervalo inválido (máximo de 10 anos)."}, 400, {}
+
+    return {"de": de.isoformat(), "ate": ate.isoformat(),
+            "meses": parcelamento.fluxo_mensal(user_id, de, ate)}, 200, {}
+
+def json_financas_calendario(user_id, args, etags):
+    """Vencimentos (lançamentos e parcelas) no intervalo visível do FullCalendar."""
+    inicio = _parse_data(args.get("start", "")[:10])
+    fim = _parse_data(args.get("end", "")[:10])
+    if not inicio or not fim:
+        return [], 200, {}
+
+    eventos = []
+    # 'end' do FullCalendar é exclusivo
+    for v in parcelamento.vencimentos(user_id, inicio, fim - timedelta(days=1)):
+        titulo = v["descricao"] or "Lançamento"
+        if (v["parcelas"] or 1) > 1:
+            titulo += f" ({v['numero']}/{v['parcelas']})"
+        eventos.append({
+            "title": f"{titulo} R$ {Decimal(str(v['valor'])):.2f}",
+            "start": str(v["data"])[:10],
+            "allDay": True,
+            "color": "#4CAF50" if v["tipo"] == "entrada" else "#795548",
+        })
+    return eventos, 200, {}
+
+def json_busca(user_id, args, etags):
+    """Busca em tarefas ou lançamentos (em=tarefas|financas), paginada.
+
+    Aceita q (texto), categoria, status (tarefas), tipo (finanças), de/ate,
+    arquivadas (inclui o arquivo), limite e cursor. O total de resultados vem na primeira página (sem cursor);
+    as seguintes reaproveitam o que o cliente já recebeu.
+    """
+    em = args.get("em", "tarefas")
+    if em not in ("tarefas", "financas"):
+        return {"error": "Parâmetro 'em' deve ser 'tarefas' ou 'financas'."}, 400, {}
+
+    params = _parametros_listagem(args)
+    filtros = ler_filtros(args)
+    if em == "tarefas":
+        modelos_busca = [Tarefa] + ([TarefaArquivada] if filtros["arquivadas"] else [])
+        bases = [filtrar_tarefas(m.select().where(m.user == user_id), filtros, m) for m in modelos_busca]
+    else:
+        modelos_busca = [Financa] + ([FinancaArquivada] if filtros["arquivadas"] else [])
+        bases = [filtrar_financas(m.select().where(m.usuario == user_id), filtros, m)
+                 for m in modelos_busca]
+    arquivo = (bases[1], modelos_busca[1].data, modelos_busca[1].id) if len(bases) > 1 else None
+    itens, proximo = paginar(bases[0], modelos_busca[0].data, modelos_busca[0].id, desc=True,
+                             arquivo=arquivo, **params)
+
+    total = None
+    if not params["cursor"]:
+        total = 0
+        for modelo, base in zip(modelos_busca, bases):
+            if params["de"]:
+                base = base.where(modelo.data >= params["de"])
+            if params["ate"]:
+                base = base.where(modelo.data <= params["ate"])
+            total += base.count()
+
+    return {"itens": [_serializar(i) for i in itens], "proximo_cursor": proximo,
+            "total": total}, 200, {}
+
+def json_relatorios(user_id, args, etags):
+    """Relatório do período: mês a mês, categoria x mês, saldo acumulado e médias móveis."""
+    hoje = datetime.now().date()
+    ate = _parse_data(args.get("ate", "")) or hoje
+    de = _parse_data(args.get("de", "")) or parcelamento.somar_meses(ate.replace(day=1), -11)
+    janela = args.get("janela", 3, type=int)
+    if ate < de or not 1 <= janela <= 24:
+        return {"error": "Parâmetros inválidos."}, 400, {}
+
+    try:
+        return relatorio_periodo(user_id, de, ate, CATEGORIAS, janela=janela), 200, {}
+    except ValueError as e:
+        return {"error": str(e)}, 400, {}
+
+def json_financas_data(user_id, args, etags):
+    resumo = obter_resumo(user_id)
+    tot_dict = resumo["totais"]
+    por_categoria = agrupar_por_categoria(resumo["categorias"], CATEGORIAS)
+
+    return {"totais": tot_dict, "por_categoria": por_categoria}, 200, {}
+
+def json_resumo(user_id, args, etags):
+    """Resumo do dashboard (totais, saldo, por categoria e tarefas do dia) em uma chamada."""
+    resumo = obter_resumo(user_id)
+    totais = resumo["totais"]
+    return {
+        "totais": totais,
+        "saldo": round(totais["entrada"] - totais["saida"], 2),
+        "tarefas_hoje": resumo["tarefas_hoje"],
+        "por_categoria": agrupar_por_categoria(resumo["categorias"], CATEGORIAS),
+    }, 200, {}
+
+API_JSON = {
+    "/api/tarefas": json_tarefas,
+    "/api/vida-pessoal": json_vida_pessoal,
+    "/api/compartilhadas": json_compartilhadas,
+    "/api/financas": json_financas,
+    "/api/financas/fluxo": json_financas_fluxo,
+    "/api/financas/calendario": json_financas_calendario,
+    "/api/busca": json_busca,
+    "/api/relatorios": json_relatorios,
+    "/financas/data": json_financas_data,
+    "/api/resumo": json_resumo,
+}
+
 # ---------------- ROTAS AUTENTICAÇÃO ----------------
-@app.route("/")
+@bp.route("/")
 def index():
-    return redirect(url_for("login"))
+    return redirect(url_for("main.login"))
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         email = request.form.get("email", "").strip()
@@ -149,18 +618,21 @@ def login():
         except DoesNotExist:
             user_model = None
 
-        if user_model and bcrypt.check_password_hash(user_model.senha_hash, senha):
+        if user_model and pool_senhas.verificar(user_model.senha_hash, senha):
+            if pool_senhas.precisa_rehash(user_model.senha_hash):
+                # BCRYPT_CUSTO mudou: refaz o hash sem atrasar o login
+                pool_senhas.rehash_em_segundo_plano(senha, _salvar_rehash(user_model.id))
             session["user_id"] = user_model.id
             session["nome"] = user_model.nome
             flash("Login realizado com sucesso!", "success")
-            return redirect(url_for("dashboard"))
+            return redirect(url_for("main.dashboard"))
 
         flash("E-mail ou senha incorretos.", "danger")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     return render_template("login.html")
 
-@app.route("/criar-conta", methods=["GET", "POST"])
+@bp.route("/criar-conta", methods=["GET", "POST"])
 def criar_conta():
     if request.method == "POST":
         nome = request.form.get("full-name", "").strip()
@@ -170,9 +642,9 @@ def criar_conta():
 
         if senha != confirmar:
             flash("As senhas não coincidem.", "danger")
-            return redirect(url_for("criar_conta"))
+            return redirect(url_for("main.criar_conta"))
 
-        senha_hash = bcrypt.generate_password_hash(senha).decode("utf-8")
+        senha_hash = pool_senhas.gerar(senha)
 
         try:
             Usuario.create(
@@ -181,81 +653,80 @@ def criar_conta():
                 senha_hash=senha_hash
             )
             flash("Conta criada com sucesso! Faça login.", "success")
-            return redirect(url_for("login"))
+            return redirect(url_for("main.login"))
         except IntegrityError:
             flash("E-mail já registrado.", "warning")
-            return redirect(url_for("criar_conta"))
+            return redirect(url_for("main.criar_conta"))
         except Exception as e:
-            app.logger.exception("Erro ao criar conta: %s", e)
+            current_app.logger.exception("Erro ao criar conta: %s", e)
             flash("Erro ao criar conta.", "danger")
-            return redirect(url_for("criar_conta"))
+            return redirect(url_for("main.criar_conta"))
 
     return render_template("criar_conta.html")
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     session.clear()
     flash("Você saiu da conta.", "info")
-    return redirect(url_for("login"))
+    return redirect(url_for("main.login"))
 
 # ---------------- API PARA TAREFAS (CALENDÁRIO) ----------------
-@app.route("/api/tarefas")
+@bp.route("/api/tarefas")
 def api_tarefas():
     if "user_id" not in session:
         return jsonify({"error": "Não autorizado"}), 401
-
-    user_id = session["user_id"]
-
-    tarefas = (Tarefa
-               .select(Tarefa.titulo, Tarefa.data)
-               .where((Tarefa.user == user_id) & (Tarefa.status == 0))
-               .dicts()
-              )
-
-    eventos = []
-    for tarefa in tarefas:
-        # Garante que a data esteja no formato ISO (YYYY-MM-DD)
-        eventos.append({
-            "title": tarefa["titulo"],
-            "start": tarefa["data"],
-            "allDay": True,
-            "color": "#FF5722"
-        })
-
-    return jsonify(eventos)
+    return _responder(*json_tarefas(session["user_id"], request.args, request.if_none_match))
+
+# ---------------- SAÚDE (LIVENESS / READINESS) ----------------
+READYZ_CACHE_SEGUNDOS = float(os.getenv("READYZ_CACHE_SEGUNDOS", "2"))
+_readyz_cache = {"em": 0.0, "ok": False, "erro": None}
+
+@bp.route("/healthz")
+def healthz():
+    """O processo está de pé (não toca no banco)."""
+    return jsonify({"status": "ok"})
+
+@bp.route("/readyz")
+def readyz():
+    """O banco responde; o resultado fica em cache por alguns segundos."""
+    agora = time.monotonic()
+    if agora - _readyz_cache["em"] > READYZ_CACHE_SEGUNDOS:
+        try:
+            # sonda rápida antes de esperar pelo connect_timeout do driver
+            if isinstance(db, MySQLDatabase):
+                socket.create_connection((MYSQL_HOST, MYSQL_PORT), 0.5).close()
+            db.execute_sql("SELECT 1")
+            _readyz_cache.update(ok=True, erro=None)
+        except Exception as e:
+            _readyz_cache.update(ok=False, erro=str(e))
+        _readyz_cache["em"] = agora
+
+    if _readyz_cache["ok"]:
+        return jsonify({"status": "ok"})
+    return jsonify({"status": "indisponivel", "erro": _readyz_cache["erro"]}), 503
+
+# ---------------- ESTATÍSTICAS DO POOL ----------------
+@bp.route("/api/db/pool")
+def db_pool_stats():
+    # Expõe hosts e atraso das réplicas: só com o token das rotas operacionais
+    if not metricas.acesso_operacional():
+        return metricas.acesso_negado()
+    if not isinstance(db, PooledMySQLDatabase):
+        return jsonify({"pool": False, "leitura": roteador.estatisticas()})
+    return jsonify({"pool": True, **db.estatisticas(), "leitura": roteador.estatisticas()})
 
 # ---------------- ROTAS PRINCIPAIS ----------------
-@app.route("/dashboard")
+@bp.route("/dashboard")
 def dashboard():
     if "user_id" not in session:
-        return redirect(url_for("login"))
-
-    user_id = session["user_id"]
-
-    # Soma das saídas
-    saidas = (Financa
-               .select(fn.SUM(Financa.valor))
-               .where((Financa.usuario == user_id) & (Financa.tipo == 'saida'))
-               .scalar())
-
-    # Soma das entradas
-    entradas = (Financa
-               .select(fn.SUM(Financa.valor))
-               .where((Financa.usuario == user_id) & (Financa.tipo == 'entrada'))
-               .scalar())
-
-    # Normaliza None para 0
-    entradas = float(entradas) if entradas is not None else 0.0
-    saidas = float(saidas) if saidas is not None else 0.0
+        return redirect(url_for("main.login"))
 
+    # Totais e tarefas do dia: uma consulta só, servida do cache por usuário
+    resumo = obter_resumo(session["user_id"])
+    entradas = resumo["totais"]["entrada"]
+    saidas = resumo["totais"]["saida"]
     totalGastos = entradas - saidas
-
-    # tarefasDoDia: exemplo simples contando tarefas pendentes com a data de hoje
-    hoje = datetime.now().date().isoformat()
-    tarefasDoDia = (Tarefa
-                    .select()
-                    .where((Tarefa.user == user_id) & (Tarefa.data == hoje) & (Tarefa.status == 0))
-                    .count())
+    tarefasDoDia = resumo["tarefas_hoje"]
 
     return render_template(
         "dashboard.html",
@@ -266,47 +737,57 @@ def dashboard():
         saidas=saidas
     )
 
-@app.route("/perfil")
+@bp.route("/perfil")
 def perfil():
     if "user_id" not in session:
-        return redirect(url_for("login"))
-
-    user_id = session["user_id"]
-    try:
-        user_model = Usuario.get_by_id(user_id)
-        usuario = model_to_dict(user_model, only=[Usuario.nome, Usuario.email])
-    except DoesNotExist:
-        usuario = None
+        return redirect(url_for("main.login"))
 
+    usuario = obter_perfil(session["user_id"])
     return render_template("perfil.html", usuario=usuario)
 
 # ---------------- VIDA PESSOAL / TAREFAS ----------------
-@app.route("/vida-pessoal")
+@bp.route("/vida-pessoal")
 def vida_pessoal():
     if "user_id" not in session:
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     user_id = session["user_id"]
+    params = _parametros_listagem()
+    filtros = ler_filtros(request.args)
+    # A consulta só roda se o fragmento da lista não estiver no cache
+    listagem = fragmentos.Preguicoso(lambda: _listar_tarefas(user_id, params, filtros))
+    destinatarios = fragmentos.Preguicoso(lambda: compartilhamento.destinatarios_por_tarefa(
+        [t["id"] for t in listagem.valor[0]], user_id))
+    # As compartilhadas comigo paginam com o próprio cursor
+    params_comp = dict(params, cursor=_ler_cursor(request.args.get("cursor_compartilhadas")))
+    compartilhadas = fragmentos.Preguicoso(lambda: _listar_compartilhadas(user_id, params_comp, filtros))
+
+    return render_template("vida_pessoal.html", listagem=listagem, destinatarios=destinatarios,
+                           compartilhadas=compartilhadas, dono=user_id, filtros=params,
+                           filtros_comp=params_comp, busca=_filtros_url())
+
+@bp.route("/api/vida-pessoal")
+def api_vida_pessoal():
+    if "user_id" not in session:
+        return jsonify({"error": "Não autorizado"}), 401
+    return _responder(*json_vida_pessoal(session["user_id"], request.args, request.if_none_match))
 
-    tarefas = (Tarefa
-               .select()
-               .where(Tarefa.user == user_id)
-               .order_by(Tarefa.data.asc())
-               .dicts()
-              )
-
-    return render_template("vida_pessoal.html", tarefas=tarefas)
+@bp.route("/api/compartilhadas")
+def api_compartilhadas():
+    if "user_id" not in session:
+        return jsonify({"error": "Não autorizado"}), 401
+    return _responder(*json_compartilhadas(session["user_id"], request.args, request.if_none_match))
 
-@app.route("/add-tarefa")
+@bp.route("/add-tarefa")
 def add_tarefa():
     if "user_id" not in session:
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
     return render_template("tarefas.html")
 
-@app.route("/salvar-tarefa", methods=["POST"])
+@bp.route("/salvar-tarefa", methods=["POST"])
 def salvar_tarefa():
     if "user_id" not in session:
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     user_id = session["user_id"]
     titulo = request.form.get("titulo", "").strip()
@@ -314,145 +795,346 @@ def salvar_tarefa():
     data = request.form.get("data", "").strip()
     categoria = request.form.get("categoria", "").strip()
 
-    Tarefa.create(
-        user=user_id,
-        titulo=titulo,
-        descricao=descricao,
-        data=data,
-        categoria=categoria
-    )
+    try:
+        data = datetime.strptime(data, "%Y-%m-%d").date()
+    except ValueError:
+        flash("Data inválida.", "danger")
+        return redirect(url_for("main.add_tarefa"))
+
+    with db.atomic():
+        Tarefa.create(
+            user=user_id,
+            titulo=titulo,
+            descricao=descricao,
+            data=data,
+            categoria=categoria
+        )
+        marcar_tarefas_alteradas(user_id)
+    dados_alterados(user_id)
 
     flash("Tarefa adicionada com sucesso!", "success")
-    return redirect(url_for("vida_pessoal"))
+    return redirect(url_for("main.vida_pessoal"))
 
-@app.route("/concluir-tarefa/<int:id>")
+@bp.route("/concluir-tarefa/<int:id>")
 def concluir_tarefa(id):
     if "user_id" not in session:
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     user_id = session["user_id"]
     query = Tarefa.update(status=1).where((Tarefa.id == id) & (Tarefa.user == user_id))
-    query.execute()
+    if query.execute():
+        marcar_tarefas_alteradas(user_id)
+        dados_alterados(user_id)
+        feeds_alterados(compartilhamento.propagar(id))
 
     flash("Tarefa concluída!", "success")
-    return redirect(url_for("vida_pessoal"))
+    return redirect(url_for("main.vida_pessoal"))
 
-@app.route("/desfazer-tarefa/<int:id>")
+@bp.route("/desfazer-tarefa/<int:id>")
 def desfazer_tarefa(id):
     if "user_id" not in session:
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     user_id = session["user_id"]
-    query = Tarefa.update(status=0).where((Tarefa.id == id) & (Tarefa.user == user_id))
-    query.execute()
+    with db.atomic():
+        # Tarefa já arquivada volta para a tabela quente antes de reabrir
+        arquivamento.restaurar_tarefa(id, user_id)
+        alteradas = Tarefa.update(status=0).where((Tarefa.id == id) & (Tarefa.user == user_id)).execute()
+    if alteradas:
+        marcar_tarefas_alteradas(user_id)
+        dados_alterados(user_id)
+        feeds_alterados(compartilhamento.propagar(id))
 
     flash("Tarefa marcada como pendente.", "warning")
-    return redirect(url_for("vida_pessoal"))
+    return redirect(url_for("main.vida_pessoal"))
+
+@bp.route("/compartilhar-tarefa/<int:id>", methods=["POST"])
+def compartilhar_tarefa(id):
+    if "user_id" not in session:
+        return redirect(url_for("main.login"))
+
+    user_id = session["user_id"]
+    try:
+        emails = compartilhamento.ler_emails(request.form.get("emails"))
+        destinatarios, desconhecidos = compartilhamento.compartilhar(id, user_id, emails)
+    except compartilhamento.CompartilhamentoInvalido as e:
+        flash(str(e), "danger")
+        return redirect(url_for("main.vida_pessoal"))
+
+    dados_alterados(user_id)
+    feeds_alterados(destinatarios)
+    if destinatarios:
+        flash(f"Tarefa compartilhada com {len(destinatarios)} pessoa(s).", "success")
+    if desconhecidos:
+        flash(f"Nenhuma conta encontrada para: {', '.join(desconhecidos)}.", "warning")
+    return redirect(url_for("main.vida_pessoal"))
+
+@bp.route("/descompartilhar-tarefa/<int:id>/<int:destinatario>", methods=["POST"])
+def descompartilhar_tarefa(id, destinatario):
+    if "user_id" not in session:
+        return redirect(url_for("main.login"))
+
+    user_id = session["user_id"]
+    afetados = compartilhamento.descompartilhar(id, user_id, destinatario)
+    if afetados:
+        dados_alterados(user_id)
+        feeds_alterados(afetados)
+
+    flash("Compartilhamento removido.", "warning")
+    return redirect(url_for("main.vida_pessoal"))
 
 # ---------------- FINANÇAS ----------------
-@app.route("/financas", methods=["GET", "POST"]) 
+@bp.route("/financas", methods=["GET", "POST"]) 
 def financas():
     if "user_id" not in session:
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     user_id = session["user_id"]
 
     if request.method == "POST":
-        descricao = request.form.get("descricao", "").strip()
-        categoria = request.form.get("categoria")
-        tipo = request.form.get("tipo")
-        valor_raw = request.form.get("valor", "0").replace(",", ".").strip()
-        forma = request.form.get("forma_pagamento", "")
-        parcelas = request.form.get("parcelas") or 1
-        data = request.form.get("data") or ""
-
         try:
-            valor = float(Decimal(valor_raw))
-            parcelas = int(parcelas)
-        except Exception:
-            flash("Valor ou parcelas inválidos.", "danger")
-            return redirect(url_for("financas"))
-
-        Financa.create(
-            usuario=user_id,
-            descricao=descricao,
-            categoria=categoria,
-            tipo=tipo,
-            valor=valor,
-            forma_pagamento=forma,
-            parcelas=parcelas,
-            data=data
-        )
+            lancamento = validar_lancamento(request.form)
+        except LancamentoInvalido as e:
+            flash(str(e), "danger")
+            return redirect(url_for("main.financas"))
+
+        with db.atomic():
+            registro = Financa.create(usuario=user_id, **lancamento)
+            parcelamento.regenerar(registro)
+            atualizar_saldo(user_id, lancamento["tipo"], lancamento["categoria"],
+                            lancamento["data"], lancamento["valor"])
+        dados_alterados(user_id)
 
         flash("Registro financeiro salvo.", "success")
-        return redirect(url_for("financas"))
+        return redirect(url_for("main.financas"))
 
-    registros = (Financa
-                 .select()
-                 .where(Financa.usuario == user_id)
-                 .order_by(Financa.data.desc())
-                 .dicts()
-                )
+    params = _parametros_listagem()
+    filtros = ler_filtros(request.args)
+    listagem = fragmentos.Preguicoso(lambda: _listar_financas(user_id, params, filtros))
 
-    return render_template("financas.html", registros=registros, categorias=CATEGORIAS)
+    return render_template("financas.html", listagem=listagem, dono=user_id, categorias=CATEGORIAS,
+                           filtros=params, busca=_filtros_url())
 
-@app.route("/financas/data")
-def financas_data():
+@bp.route("/financas/importar", methods=["POST"])
+def importar_financas():
     if "user_id" not in session:
-        return jsonify({"error": "unauthorized"}), 401
-
-    user_id = session["user_id"]
-
-    # 1. Totais de Entrada e Saída
-    totals = (Financa
-              .select(Financa.tipo, fn.SUM(Financa.valor).alias('total'))
-              .where(Financa.usuario == user_id)
-              .group_by(Financa.tipo)
-              .dicts()
-             )
+        return redirect(url_for("main.login"))
+
+    arquivo = request.files.get("arquivo")
+    if not arquivo or not arquivo.filename:
+        flash("Selecione um arquivo CSV ou OFX.", "danger")
+        return redirect(url_for("main.financas"))
+
+    formato = request.form.get("formato") or detectar_formato(arquivo.filename)
+    texto = abrir_texto(arquivo.stream)
+    linhas = ler_ofx(texto) if formato == "ofx" else ler_csv(texto)
+    resumo = importar(session["user_id"], linhas)
+    dados_alterados(session["user_id"])
+
+    flash(f"{resumo['importados']} lançamento(s) importado(s).", "success")
+    for numero, erro in resumo["erros"][:5]:
+        flash(f"Linha {numero}: {erro}", "warning")
+    if len(resumo["erros"]) > 5:
+        flash(f"... e mais {len(resumo['erros']) - 5} linha(s) com erro.", "warning")
+    return redirect(url_for("main.financas"))
+
+@bp.route("/financas/exportar.csv")
+def exportar_financas():
+    if "user_id" not in session:
+        return redirect(url_for("main.login"))
+
+    params = _parametros_listagem()
+    gerador = exportar_csv(session["user_id"], de=params["de"], ate=params["ate"],
+                           arquivadas=ler_filtros(request.args)["arquivadas"])
+    # stream_with_context mantém a requisição (e a conexão do banco) até o fim do arquivo
+    return current_app.response_class(
+        stream_with_context(gerador),
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment; filename=financas.csv"},
+    )
 
-    tot_dict = {"entrada": 0.0, "saida": 0.0}
-    for row in totals:
-        tot_dict[row["tipo"]] = float(row["total"]) if row["total"] is not None else 0.0
+@bp.cli.command("importar-financas")
+@click.argument("arquivo", type=click.File("rb"))
+@click.option("--usuario", type=int, required=True, help="Dono dos lançamentos.")
+@click.option("--formato", type=click.Choice(["csv", "ofx"]), default=None)
+@click.option("--lote", type=int, default=500, help="Linhas por INSERT.")
+def importar_financas_command(arquivo, usuario, formato, lote):
+    """Importa um CSV ou extrato OFX para a tabela financas."""
+    formato = formato or detectar_formato(arquivo.name)
+    texto = abrir_texto(arquivo)
+    linhas = ler_ofx(texto) if formato == "ofx" else ler_csv(texto)
+    resumo = importar(usuario, linhas, lote=lote)
+    for numero, erro in resumo["erros"]:
+        click.echo(f"linha {numero}: {erro}", err=True)
+    click.echo(f"{resumo['importados']} lançamento(s) importado(s).")
+
+@bp.cli.command("exportar-financas")
+@click.option("--usuario", type=int, required=True)
+@click.option("--saida", type=click.File("w"), default="-", help="Arquivo de saída (padrão: stdout).")
+@click.option("--arquivadas", is_flag=True, help="Inclui os lançamentos arquivados.")
+def exportar_financas_command(usuario, saida, arquivadas):
+    """Exporta os lançamentos de um usuário em CSV."""
+    with db.connection_context():
+        for pedaco in exportar_csv(usuario, arquivadas=arquivadas):
+            saida.write(pedaco)
+
+@bp.cli.command("regenerar-parcelas")
+@click.option("--usuario", type=int, default=None, help="Apenas um usuário.")
+@click.option("--tudo", is_flag=True, help="Apaga e recria todas as parcelas (não só as que faltam).")
+def regenerar_parcelas_command(usuario, tudo):
+    """Materializa as parcelas dos lançamentos parcelados em financas_ocorrencias."""
+    with db.connection_context():
+        n = parcelamento.reconstruir(usuario) if tudo else parcelamento.materializar_pendentes(usuario)
+    click.echo(f"{n} lançamento(s) parcelado(s) expandido(s).")
+
+@bp.cli.command("notificacoes")
+@click.option("--uma-vez", is_flag=True, help="Executa um único ciclo e sai.")
+@click.option("--intervalo", type=float, default=60.0, help="Segundos entre ciclos.")
+@click.option("--antecedencia", type=int, default=1, help="Dias de antecedência dos lembretes.")
+@click.option("--taxa", type=float, default=float(os.getenv("NOTIFICACOES_TAXA", "5")),
+              help="Máximo de e-mails por segundo.")
+@click.option("--lote", type=int, default=200, help="Notificações reservadas por vez.")
+def notificacoes_command(uma_vez, intervalo, antecedencia, taxa, lote):
+    """Agenda e envia os lembretes de tarefas e vencimentos e o resumo mensal."""
+    limite = notificacoes.LimiteTaxa(taxa)
+    while True:
+        try:
+            with db.connection_context():
+                planejadas, reservadas = notificacoes.ciclo(
+                    fila_email, limite, reset_senha_email.EMAIL_REMETENTE, CATEGORIAS,
+                    antecedencia=antecedencia, lote=lote)
+            click.echo(f"{datetime.now():%H:%M:%S} {planejadas} item(ns) avaliado(s), "
+                       f"{reservadas} notificação(ões) entregue(s) à fila.")
+        except Exception as e:
+            if uma_vez:
+                raise
+            click.echo(f"Falha no ciclo de notificações: {e}", err=True)
+        if uma_vez:
+            fila_email.parar()
+            return
+        time.sleep(intervalo)
+
+@bp.cli.command("arquivar")
+@click.option("--uma-vez", is_flag=True, help="Executa um único passe e sai.")
+@click.option("--intervalo", type=float, default=3600.0, help="Segundos entre passes.")
+@click.option("--lote", type=int, default=arquivamento.ARQUIVO_LOTE, help="Linhas por transação.")
+@click.option("--pausa", type=float, default=0.2, help="Segundos de espera entre lotes.")
+@click.option("--simular", is_flag=True, help="Só mostra quantas linhas seriam arquivadas.")
+def arquivar_command(uma_vez, intervalo, lote, pausa, simular):
+    """Move tarefas concluídas e lançamentos antigos para as tabelas de arquivo."""
+    if simular:
+        with db.connection_context():
+            pendentes = arquivamento.pendentes()
+        click.echo(f"{pendentes['tarefas']} tarefa(s) e {pendentes['financas']} lançamento(s) "
+                   f"a arquivar (cortes: {arquivamento.corte_tarefas()} e {arquivamento.corte_financas()}).")
+        return
+    while True:
+        try:
+            with db.connection_context():
+                resultado = arquivamento.ciclo(lote=lote, pausa=pausa)
+            # As listagens em cache desses usuários ainda mostram as linhas movidas
+            for user_id in resultado["usuarios"]:
+                dados_alterados(user_id)
+            click.echo(f"{datetime.now():%H:%M:%S} {resultado['tarefas']} tarefa(s) e "
+                       f"{resultado['financas']} lançamento(s) arquivado(s).")
+        except Exception as e:
+            if uma_vez:
+                raise
+            click.echo(f"Falha no arquivamento: {e}", err=True)
+        if uma_vez:
+            return
+        time.sleep(intervalo)
+
+@bp.cli.command("anexos-limpar")
+@click.option("--idade", type=int, default=60, help="Minutos sem nenhum anexo antes de apagar o conteúdo.")
+def anexos_limpar_command(idade):
+    """Apaga do disco os conteúdos de anexo que não são mais usados."""
+    with db.connection_context():
+        n = anexos.limpar_orfaos(idade_minutos=idade)
+    click.echo(f"{n} conteúdo(s) órfão(s) apagado(s).")
+
+@bp.cli.command("gerar-dados")
+@click.option("--usuarios", type=int, default=10, help="Usuários de benchmark a criar.")
+@click.option("--tarefas", type=int, default=500, help="Tarefas por usuário.")
+@click.option("--financas", type=int, default=2000, help="Lançamentos por usuário.")
+@click.option("--dias", type=int, default=730, help="Dias de histórico.")
+@click.option("--inicio", type=int, default=1, help="Número do primeiro usuário (bench<N>@datefy.test).")
+@click.option("--semente", type=int, default=42)
+def gerar_dados_command(usuarios, tarefas, financas, dias, inicio, semente):
+    """Preenche o banco com dados sintéticos para benchmarks."""
+    categorias = [c["key"] for c in CATEGORIAS if c["key"] != "salario"]
+    inicio_t = time.perf_counter()
+    with db.connection_context():
+        gerar_dados(usuarios, tarefas, financas, categorias, semente=semente, dias=dias,
+                    inicio=inicio, log=click.echo)
+    click.echo(f"Concluído em {time.perf_counter() - inicio_t:.1f}s "
+               f"(senha dos usuários: {BENCH_SENHA}).")
+
+@bp.cli.command("benchmark-senhas")
+@click.option("--custos", default="10,11,12,13", help="Custos do bcrypt a medir, separados por vírgula.")
+@click.option("--segundos", type=float, default=2.0, help="Duração da medição por custo.")
+def benchmark_senhas_command(custos, segundos):
+    """Mede logins/s por núcleo (verificações bcrypt em uma thread) em cada custo."""
+    click.echo(f"custo atual (BCRYPT_CUSTO): {pool_senhas.custo}")
+    click.echo("custo  ms/login  logins/s/núcleo")
+    for custo in (int(c) for c in custos.split(",") if c.strip()):
+        r = medir_senhas(custo, segundos)
+        click.echo(f"{r['custo']:>5}  {r['ms_por_login']:>8}  {r['logins_por_segundo']:>15}")
+
+@bp.route("/api/financas")
+def api_financas():
+    if "user_id" not in session:
+        return jsonify({"error": "Não autorizado"}), 401
+    return _responder(*json_financas(session["user_id"], request.args, request.if_none_match))
 
-    # 2. Totais por Categoria
-    cat_rows = (Financa
-                .select(Financa.categoria, Financa.tipo, fn.SUM(Financa.valor).alias('total'))
-                .where(Financa.usuario == user_id)
-                .group_by(Financa.categoria, Financa.tipo)
-                .dicts()
-               )
+# ---------------- PROJEÇÃO / CALENDÁRIO FINANCEIRO ----------------
+@bp.route("/api/financas/fluxo")
+def api_financas_fluxo():
+    if "user_id" not in session:
+        return jsonify({"error": "Não autorizado"}), 401
+    return _responder(*json_financas_fluxo(session["user_id"], request.args, request.if_none_match))
 
-    cat_map = {}
-    for c in CATEGORIAS:
-        cat_map[c["key"]] = {"label": c["label"], "color": c["color"], "total": 0.0}
+@bp.route("/api/financas/calendario")
+def api_financas_calendario():
+    if "user_id" not in session:
+        return jsonify({"error": "Não autorizado"}), 401
+    return _responder(*json_financas_calendario(session["user_id"], request.args, request.if_none_match))
 
-    for r in cat_rows:
-        key = r["categoria"] or "outras"
-        if key not in cat_map:
-            cat_map[key] = {"label": key, "color": "#999999", "total": 0.0}
+@bp.route("/api/busca")
+def api_busca():
+    if "user_id" not in session:
+        return jsonify({"error": "Não autorizado"}), 401
+    return _responder(*json_busca(session["user_id"], request.args, request.if_none_match))
 
-        valor_total = float(r["total"]) if r["total"] is not None else 0.0
+@bp.route("/api/relatorios")
+def api_relatorios():
+    if "user_id" not in session:
+        return jsonify({"error": "Não autorizado"}), 401
+    return _responder(*json_relatorios(session["user_id"], request.args, request.if_none_match))
 
-        if r["tipo"] == "entrada":
-            cat_map[key]["total"] += valor_total
-        else:
-            cat_map[key]["total"] -= valor_total
+@bp.route("/financas/data")
+def financas_data():
+    if "user_id" not in session:
+        return jsonify({"error": "unauthorized"}), 401
+    return _responder(*json_financas_data(session["user_id"], request.args, request.if_none_match))
 
-    labels, values, colors = [], [], []
-    for k, v in cat_map.items():
-        if abs(v["total"]) > 0:
-            labels.append(v["label"])
-            values.append(round(v["total"], 2))
-            colors.append(v["color"])
+@bp.route("/api/resumo")
+def api_resumo():
+    if "user_id" not in session:
+        return jsonify({"error": "Não autorizado"}), 401
+    return _responder(*json_resumo(session["user_id"], request.args, request.if_none_match))
 
-    return jsonify({"totais": tot_dict, "por_categoria": {"labels": labels, "values": values, "colors": colors}})
+@bp.route("/api/resumo/cache")
+def api_resumo_cache():
+    if not metricas.acesso_operacional():
+        return metricas.acesso_negado()
+    return jsonify(cache_resumo.estatisticas())
 
 
-@app.route("/editar_perfil", methods=["GET", "POST"])
+@bp.route("/editar_perfil", methods=["GET", "POST"])
 def editar_perfil():
     if "user_id" not in session:
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     user_id = session["user_id"]
 
@@ -462,68 +1144,231 @@ def editar_perfil():
 
         query = Usuario.update(nome=nome, email=email).where(Usuario.id == user_id)
         query.execute()
+        cache_perfil.invalidar(user_id)
+        # O nome do dono aparece nas tarefas compartilhadas
+        feeds_alterados(compartilhamento.propagar_dono(user_id))
 
         session["nome"] = nome
         flash("Perfil atualizado com sucesso!", "success")
-        return redirect(url_for("perfil"))
+        return redirect(url_for("main.perfil"))
 
+    usuario = obter_perfil(user_id)
+    return render_template("editar_perfil.html", usuario=usuario)
+
+# ----------------- ANEXOS (RF16) -----------------
+# Anexos são imutáveis: a URL de um anexo serve sempre os mesmos bytes, então o
+# navegador pode guardá-lo por um ano sem revalidar.
+CACHE_ANEXO = 365 * 24 * 3600
+# Atrás do nginx: ANEXOS_X_ACCEL=/_anexos/ (location internal apontando para ANEXOS_DIR/objetos)
+ANEXOS_X_ACCEL = os.getenv("ANEXOS_X_ACCEL")
+
+def _anexo_json(anexo, tipo):
+    return {
+        "id": anexo.id,
+        "nome": anexo.nome,
+        "tamanho": anexo.tamanho,
+        "tipo": tipo,
+        "url": url_for("main.baixar_anexo", id=anexo.id),
+        "miniatura": url_for("main.miniatura_anexo", id=anexo.id) if anexos.tem_miniatura(tipo) else None,
+    }
+
+def _receber_envio(limite):
+    """Grava o corpo da requisição (multipart com o campo 'arquivo', ou o arquivo cru) em disco.
+
+    Retorna (gravacao, nome). O multipart é lido pelo parser do Werkzeug com a
+    gravação como destino, em vez de um SpooledTemporaryFile.
+    """
+    if request.mimetype == "multipart/form-data":
+        gravacoes = []
+
+        def destino(*args, **kwargs):
+            gravacoes.append(anexos.Gravacao(limite))
+            return gravacoes[-1]
+
+        try:
+            _, _, arquivos = parse_form_data(
+                request.environ, stream_factory=destino, silent=False,
+                max_form_memory_size=current_app.config["MAX_FORM_MEMORY_SIZE"])
+        except Exception as e:
+            for g in gravacoes:
+                g.descartar()
+            if isinstance(e, ValueError) and not isinstance(e, anexos.AnexoInvalido):
+                raise anexos.AnexoInvalido("Envio malformado.") from e
+            raise
+        enviado = arquivos.get("arquivo")
+        for g in gravacoes:
+            if enviado is None or g is not enviado.stream:
+                g.descartar()
+        if enviado is None:
+            raise anexos.AnexoInvalido("Envie o arquivo no campo 'arquivo'.")
+        return enviado.stream, enviado.filename
+
+    gravacao = anexos.Gravacao(limite)
     try:
-        user_model = Usuario.get_by_id(user_id)
-        usuario = model_to_dict(user_model, only=[Usuario.nome, Usuario.email])
-    except DoesNotExist:
-        usuario = None
+        gravacao.copiar_de(request.stream)
+    except Exception:
+        gravacao.descartar()
+        raise
+    return gravacao, request.args.get("nome") or request.headers.get("X-Nome-Arquivo")
 
-    return render_template("editar_perfil.html", usuario=usuario)
+@bp.route("/api/anexos/<tipo>/<int:item_id>", methods=["GET", "POST"])
+def anexos_do_item(tipo, item_id):
+    if "user_id" not in session:
+        return jsonify({"error": "Não autorizado"}), 401
+    user_id = session["user_id"]
+    if not anexos.item_do_usuario(tipo, item_id, user_id):
+        return jsonify({"error": "Item não encontrado."}), 404
+
+    if request.method == "GET":
+        return jsonify([_anexo_json(a, a.arquivo.tipo) for a in anexos.listar(tipo, item_id, user_id)])
+
+    limite = anexos.limite_envio(user_id)
+    # Recusa antes de ler o corpo quando o tamanho declarado já passa do limite
+    # (a folga cobre os cabeçalhos do multipart)
+    if request.content_length is not None and request.content_length > limite + 16 * 1024:
+        return jsonify({"error": f"Arquivo maior que o permitido ({limite // 1024} KB disponíveis)."}), 413
+    try:
+        gravacao, nome = _receber_envio(limite)
+        anexo = anexos.guardar(gravacao, user_id, tipo, item_id, nome)
+    except anexos.CotaExcedida as e:
+        return jsonify({"error": str(e)}), 413
+    except anexos.AnexoInvalido as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(_anexo_json(anexo, anexos.detectar_tipo(gravacao.inicio))), 201
+
+@bp.route("/anexos/<int:id>")
+def baixar_anexo(id):
+    if "user_id" not in session:
+        return redirect(url_for("main.login"))
+    anexo = anexos.obter(id, session["user_id"])
+    if anexo is None:
+        return jsonify({"error": "Anexo não encontrado."}), 404
+
+    tipo = anexo.arquivo.tipo
+    if ANEXOS_X_ACCEL:
+        # O nginx entrega o arquivo (sendfile e Range) a partir do caminho interno
+        resp = current_app.response_class(mimetype=tipo)
+        hash_ = anexo.arquivo.hash
+        resp.headers["X-Accel-Redirect"] = f"{ANEXOS_X_ACCEL}{hash_[:2]}/{hash_[2:4]}/{hash_}"
+        resp.set_etag(hash_)
+    else:
+        # send_file entrega o arquivo pelo wsgi.file_wrapper (sendfile no gunicorn) e
+        # responde a Range/If-None-Match com 206/304
+        resp = send_file(anexos.caminho_objeto(anexo.arquivo.hash), mimetype=tipo,
+                         as_attachment=tipo not in anexos.EM_LINHA, download_name=anexo.nome,
+                         etag=anexo.arquivo.hash, conditional=True, max_age=CACHE_ANEXO)
+    resp.cache_control.public = False
+    resp.cache_control.private = True
+    resp.cache_control.max_age = CACHE_ANEXO
+    resp.cache_control.immutable = True
+    resp.headers["X-Content-Type-Options"] = "nosniff"
+    return resp
+
+@bp.route("/anexos/<int:id>/miniatura")
+def miniatura_anexo(id):
+    if "user_id" not in session:
+        return redirect(url_for("main.login"))
+    anexo = anexos.obter(id, session["user_id"])
+    if (anexo is None or not anexos.tem_miniatura(anexo.arquivo.tipo)
+            or anexo.arquivo.hash in anexos.miniaturas.falhas):
+        return jsonify({"error": "Miniatura indisponível."}), 404
+
+    caminho = anexos.caminho_miniatura(anexo.arquivo.hash)
+    if not os.path.exists(caminho):
+        # Gerada em segundo plano; o cliente tenta de novo em instantes
+        anexos.miniaturas.agendar(anexo.arquivo.hash)
+        return jsonify({"status": "gerando"}), 202, {"Retry-After": "1"}
+    resp = send_file(caminho, mimetype="image/jpeg", etag=anexo.arquivo.hash + "-m", conditional=True,
+                     max_age=CACHE_ANEXO)
+    resp.cache_control.public = False
+    resp.cache_control.private = True
+    resp.cache_control.immutable = True
+    return resp
+
+@bp.route("/anexos/<int:id>/excluir", methods=["POST"])
+def excluir_anexo(id):
+    if "user_id" not in session:
+        return jsonify({"error": "Não autorizado"}), 401
+    if not anexos.remover(id, session["user_id"]):
+        return jsonify({"error": "Anexo não encontrado."}), 404
+    return jsonify({"ok": True})
 
 # ----------------- APAGAR FINANCA -----------------
-@app.route("/apagar/<int:id>", methods=["POST"])
+@bp.route("/apagar/<int:id>", methods=["POST"])
 def apagar_registro(id):
+    if "user_id" not in session:
+        return redirect(url_for("main.login"))
+
+    user_id = session["user_id"]
     try:
-        # Tenta apagar o registro pelo ID
-        query = Financa.delete().where(Financa.id == id)
-        query.execute()
+        # Tenta apagar o registro pelo ID (e desconta do saldo mensal)
+        with db.atomic():
+            registro = (Financa.get_or_none((Financa.id == id) & (Financa.usuario == user_id))
+                        or arquivamento.restaurar_financa(id, user_id))
+            if registro:
+                parcelamento.remover(registro.id)
+                anexos.remover_do_item("financa", registro.id, user_id)
+                apagados = Financa.delete().where(Financa.id == registro.id).execute()
+                # Duas exclusões simultâneas passam pelo get_or_none (ou pela restauração);
+                # só a que de fato apagou a linha desconta do saldo
+                if apagados == 1:
+                    atualizar_saldo(user_id, registro.tipo, registro.categoria, registro.data,
+                                    registro.valor, sinal=-1)
+        dados_alterados(user_id)
 
         flash("Registro apagado com sucesso!", "success")
 
     except Exception as e:
         flash(f"Erro ao apagar o registro: {e}", "danger")
 
-    return redirect(url_for("financas"))
+    return redirect(url_for("main.financas"))
 
 
 # ----------------- APAGAR TAREFAS -----------------
 
-@app.route("/excluir_tarefa/<int:id>")
+@bp.route("/excluir_tarefa/<int:id>")
 def excluir_tarefa(id):
+    if "user_id" not in session:
+        return redirect(url_for("main.login"))
+
+    user_id = session["user_id"]
     try:
-        Tarefa.delete().where(Tarefa.id == id).execute()
+        with db.atomic():
+            anexos.remover_do_item("tarefa", id, user_id)
+            destinatarios = compartilhamento.descompartilhar(id, user_id)
+            if Tarefa.delete().where((Tarefa.id == id) & (Tarefa.user == user_id)).execute():
+                marcar_tarefas_alteradas(user_id)
+            else:
+                (TarefaArquivada.delete()
+                 .where((TarefaArquivada.id == id) & (TarefaArquivada.user == user_id))
+                 .execute())
+        dados_alterados(user_id)
+        feeds_alterados(destinatarios)
         flash("Tarefa excluída com sucesso!", "success")
     except Exception as e:
         flash(f"Erro ao excluir a tarefa: {e}", "danger")
 
-    return redirect(url_for("vida_pessoal"))
+    return redirect(url_for("main.vida_pessoal"))
 
 # ---------------- TESTE NOTICAÇÕES ----------------
-@app.route("/salvar_preferencias", methods=["GET","POST"])
+@bp.route("/salvar_preferencias", methods=["GET","POST"])
 def salvar_preferencias():
     if "user_id" not in session:
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     user_id = session["user_id"]
     user = Usuario.get_or_none(Usuario.id == user_id)
 
     if not user:
         flash("Usuário não encontrado.", "error")
-        return redirect(url_for("perfil"))
+        return redirect(url_for("main.perfil"))
 
     # DADOS PESSOAIS
     user.nome = request.form.get("nome")
     user.email = request.form.get("email")
-
-    # NOTIFICAÇÕES
-    user.notif_email = "email_alertas" in request.form
-    user.notif_push = "push_alertas" in request.form
-    user.notif_relatorio = "mensal_relatorio" in request.form
+    # Só as colunas do formulário: o resto da linha (tarefas_versao, notif_*) pode ter
+    # vindo de uma réplica ou mudado depois da leitura
+    campos = [Usuario.nome, Usuario.email]
 
     # SENHAS
     senha_atual = request.form.get("senha_atual")
@@ -532,15 +1377,38 @@ def salvar_preferencias():
 
     # Alterar senha se os campos estiverem preenchidos corretamente 
     if senha_atual and nova_senha and nova_senha == confirmar:
-        if bcrypt.check_password_hash(user.senha_hash, senha_atual):
-            user.senha_hash = bcrypt.generate_password_hash(nova_senha).decode("utf-8")
+        if pool_senhas.verificar(user.senha_hash, senha_atual):
+            user.senha_hash = pool_senhas.gerar(nova_senha)
+            campos.append(Usuario.senha_hash)
 
-    user.save()
+    user.save(only=campos)
+    cache_perfil.invalidar(user_id)
+    feeds_alterados(compartilhamento.propagar_dono(user_id))
+    session["nome"] = user.nome
 
     flash("Preferências e perfil atualizados!", "success")
-    return redirect(url_for("perfil"))
+    return redirect(url_for("main.perfil"))
+
+@bp.route("/salvar_notificacoes", methods=["POST"])
+def salvar_notificacoes():
+    # Formulário próprio: as caixas desmarcadas não são enviadas, então não podem
+    # ser lidas junto com o formulário de dados pessoais
+    if "user_id" not in session:
+        return redirect(url_for("main.login"))
 
-@app.route("/alterar-senha-email", methods=["GET","POST"])
+    user_id = session["user_id"]
+    (Usuario
+     .update(notif_email="email_alertas" in request.form,
+             notif_push="push_alertas" in request.form,
+             notif_relatorio="mensal_relatorio" in request.form)
+     .where(Usuario.id == user_id)
+     .execute())
+    cache_perfil.invalidar(user_id)
+
+    flash("Preferências de notificação atualizadas!", "success")
+    return redirect(url_for("main.perfil"))
+
+@bp.route("/alterar-senha-email", methods=["GET","POST"])
 def alterar_senha_email(): 
     #receber emailo como query partamms
     email = request.args.get("email", "").strip()
@@ -549,39 +1417,40 @@ def alterar_senha_email():
 
         try:
             user = Usuario.get(Usuario.email == email)
-            user.senha_hash = bcrypt.generate_password_hash(nova_senha).decode("utf-8")
-            user.save()
+            user.senha_hash = pool_senhas.gerar(nova_senha)
+            user.save(only=[Usuario.senha_hash])
             flash("Senha alterada com sucesso!", "success")
-            return redirect(url_for("login"))
+            return redirect(url_for("main.login"))
         except DoesNotExist:
             flash("Usuário não encontrado.", "danger")
-            return redirect(url_for("login"))
+            return redirect(url_for("main.login"))
 
     return render_template("resetar_senha.html", email=email)
 
-@app.route('/recuperar_senha', methods=['GET', 'POST'])
+@bp.route('/recuperar_senha', methods=['GET', 'POST'])
 def recuperar_senha():
-    teste = 'hgfdhg'
     if request.method == 'POST':
         email_destino = request.form.get('email')
 
         if not email_destino:
             flash('Digite um e-mail válido.', 'error')
-            return redirect(url_for('recuperar_senha'))
+            return redirect(url_for('main.recuperar_senha'))
 
+        # O envio acontece em segundo plano (fila_email); a requisição não espera o SMTP
         try:
-            enviar_email(email_destino)
+            fila_email.enfileirar(montar_email(email_destino))
             flash(f'E-mail de recuperação enviado para {email_destino}', 'success')
         except Exception as e:
-            print("Erro ao enviar e-mail:", e)
-            flash('Erro ao enviar o e-mail. Verifique o SMTP.', 'error')
+            current_app.logger.exception("Erro ao enfileirar e-mail: %s", e)
+            flash('Erro ao enviar o e-mail. Tente novamente.', 'error')
 
-        return redirect(url_for('recuperar_senha'))
+        return redirect(url_for('main.recuperar_senha'))
 
     return render_template('recuperar_senha.html')
 
 
 # Correção final da execução Flask com 'port' como inteiro
 if __name__ == '__main__':
+    # Servidor de desenvolvimento; em produção use o gunicorn (ver wsgi.py)
     port = int(os.environ.get('PORT', 5001))
-    app.run(debug=True, host='0.0.0.0', port=port)
+    create_app().run(debug=os.environ.get('FLASK_DEBUG', '1') == '1', host='0.0.0.0', port=port)
@@ -0,0 +1,155 @@
+"""Arquivamento quente/frio: tarefas concluídas e lançamentos antigos saem das tabelas principais.
+
+Pela regra R2 lembretes não são apagados, e o histórico de finanças só
+cresce; sem arquivamento toda listagem, busca e agregação por usuário
+percorre anos de linhas que quase ninguém abre. Aqui as linhas frias vão
+para `tarefas_arquivo` e `financas_arquivo` (mesmas colunas e os mesmos
+ids), em lotes pequenos, cada um numa transação curta:
+
+- tarefas concluídas com data anterior a ARQUIVO_TAREFAS_DIAS dias;
+- lançamentos com data anterior a ARQUIVO_FINANCAS_DIAS dias e sem parcela
+  que vença depois disso (as parcelas materializadas são apagadas junto e
+  refeitas se o lançamento voltar).
+
+As consultas normais continuam em `Tarefa` / `Financa` e só veem o conjunto
+quente. As listagens, a busca e a exportação aceitam `arquivadas=1` para
+juntar o arquivo. Os saldos mensais (e, portanto, o dashboard e os
+relatórios) continuam contando os lançamentos arquivados.
+
+Foram usadas tabelas de arquivo, e não partições por data no MySQL, porque
+tabelas particionadas não aceitam as chaves estrangeiras do schema e o
+SQLite de desenvolvimento não tem partições.
+"""
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from peewee import fn, MySQLDatabase, Value
+
+from modelos import db, Tarefa, Financa, FinancaOcorrencia, TarefaArquivada, FinancaArquivada
+import compartilhamento
+import parcelamento
+
+ARQUIVO_TAREFAS_DIAS = int(os.getenv("ARQUIVO_TAREFAS_DIAS", "30"))
+ARQUIVO_FINANCAS_DIAS = int(os.getenv("ARQUIVO_FINANCAS_DIAS", "730"))
+ARQUIVO_LOTE = int(os.getenv("ARQUIVO_LOTE", "500"))
+
+COLUNAS_TAREFA = ("id", "user", "titulo", "descricao", "data", "categoria", "status")
+COLUNAS_FINANCA = ("id", "usuario", "descricao", "categoria", "tipo", "valor", "forma_pagamento",
+                   "parcelas", "data")
+
+
+def corte_tarefas(hoje=None):
+    return (hoje or date.today()) - timedelta(days=ARQUIVO_TAREFAS_DIAS)
+
+def corte_financas(hoje=None):
+    return (hoje or date.today()) - timedelta(days=ARQUIVO_FINANCAS_DIAS)
+
+def _frias_tarefas(corte):
+    return (Tarefa.status == 1) & (Tarefa.data < corte)
+
+def _frias_financas(corte):
+    ainda_vence = (FinancaOcorrencia
+                   .select(FinancaOcorrencia.id)
+                   .where((FinancaOcorrencia.financa == Financa.id) & (FinancaOcorrencia.data >= corte)))
+    return (Financa.data < corte) & ~fn.EXISTS(ainda_vence)
+
+
+# --- Movimentação (sempre dentro de db.atomic) ---
+def _travar(modelo, condicao, campo_usuario, lote=None):
+    """(id, usuário) das linhas que atendem `condicao`, travadas até o fim da transação."""
+    query = modelo.select(modelo.id, campo_usuario).where(condicao)
+    if lote:
+        query = query.limit(lote)
+    if isinstance(db, MySQLDatabase):
+        query = query.for_update()
+    return list(query.tuples())
+
+def _mover(origem, destino, colunas, ids, arquivando):
+    """Copia as linhas `ids` de `origem` para `destino` (INSERT ... SELECT) e apaga as originais."""
+    campos = [getattr(origem, c) for c in colunas]
+    alvo = [getattr(destino, c) for c in colunas]
+    if arquivando:
+        campos.append(Value(datetime.now()))
+        alvo.append(destino.arquivada_em)
+    destino.insert_from(origem.select(*campos).where(origem.id.in_(ids)), alvo).execute()
+    origem.delete().where(origem.id.in_(ids)).execute()
+
+def _arquivar(origem, destino, colunas, condicao, campo_usuario, lote, pausa, antes=None):
+    movidas, usuarios = 0, set()
+    while True:
+        with db.atomic():
+            linhas = _travar(origem, condicao, campo_usuario, lote)
+            ids = [i for i, _ in linhas]
+            if ids:
+                if antes:
+                    antes(ids)
+                _mover(origem, destino, colunas, ids, arquivando=True)
+        movidas += len(ids)
+        usuarios.update(u for _, u in linhas)
+        if len(ids) < lote:
+            return movidas, usuarios
+        # Dá folga ao primário (e às réplicas) entre um lote e outro
+        time.sleep(pausa)
+
+def arquivar_tarefas(hoje=None, lote=ARQUIVO_LOTE, pausa=0.0):
+    """Arquiva as tarefas concluídas antes do corte. Retorna (quantidade, ids dos usuários).
+
+    Os usuários incluem os destinatários das tarefas compartilhadas, que saem do feed deles.
+    """
+    destinatarios = set()
+
+    def fora_do_feed(ids):
+        destinatarios.update(compartilhamento.retirar_do_feed(ids))
+
+    movidas, usuarios = _arquivar(Tarefa, TarefaArquivada, COLUNAS_TAREFA,
+                                  _frias_tarefas(corte_tarefas(hoje)), Tarefa.user, lote, pausa,
+                                  antes=fora_do_feed)
+    return movidas, usuarios | destinatarios
+
+def arquivar_financas(hoje=None, lote=ARQUIVO_LOTE, pausa=0.0):
+    """Arquiva os lançamentos antigos já quitados. Retorna (quantidade, ids dos usuários)."""
+    def sem_parcelas(ids):
+        FinancaOcorrencia.delete().where(FinancaOcorrencia.financa.in_(ids)).execute()
+
+    return _arquivar(Financa, FinancaArquivada, COLUNAS_FINANCA, _frias_financas(corte_financas(hoje)),
+                     Financa.usuario, lote, pausa, antes=sem_parcelas)
+
+def ciclo(hoje=None, lote=ARQUIVO_LOTE, pausa=0.0):
+    """Um passe completo do arquivamento: {"tarefas": n, "financas": n, "usuarios": {ids}}."""
+    tarefas, usuarios_t = arquivar_tarefas(hoje, lote=lote, pausa=pausa)
+    financas, usuarios_f = arquivar_financas(hoje, lote=lote, pausa=pausa)
+    return {"tarefas": tarefas, "financas": financas, "usuarios": usuarios_t | usuarios_f}
+
+def pendentes(hoje=None):
+    """Quantas linhas o próximo passe arquivaria (para `flask arquivar --simular`)."""
+    return {
+        "tarefas": Tarefa.select().where(_frias_tarefas(corte_tarefas(hoje))).count(),
+        "financas": Financa.select().where(_frias_financas(corte_financas(hoje))).count(),
+    }
+
+
+# --- Volta para a tabela quente ---
+def restaurar_tarefa(tarefa_id, user_id):
+    """Devolve uma tarefa arquivada à tabela quente; False se ela não está no arquivo.
+
+    Se ela estava compartilhada, quem chama devolve a cópia ao feed dos destinatários
+    com compartilhamento.propagar (depois de terminar de alterá-la).
+    """
+    with db.atomic():
+        condicao = (TarefaArquivada.id == tarefa_id) & (TarefaArquivada.user == user_id)
+        if not _travar(TarefaArquivada, condicao, TarefaArquivada.user):
+            return False
+        _mover(TarefaArquivada, Tarefa, COLUNAS_TAREFA, [tarefa_id], arquivando=False)
+    return True
+
+def restaurar_financa(financa_id, usuario_id):
+    """Devolve um lançamento arquivado (com as parcelas refeitas); None se não está no arquivo."""
+    with db.atomic():
+        condicao = (FinancaArquivada.id == financa_id) & (FinancaArquivada.usuario == usuario_id)
+        if not _travar(FinancaArquivada, condicao, FinancaArquivada.usuario):
+            return None
+        _mover(FinancaArquivada, Financa, COLUNAS_FINANCA, [financa_id], arquivando=False)
+        financa = Financa.get_by_id(financa_id)
+        parcelamento.regenerar(financa)
+    return financa
@@ -0,0 +1,362 @@
+"""Benchmark das rotas principais com clientes concorrentes.
+
+Cada cliente faz login como um usuário de benchmark (`flask gerar-dados`)
+e percorre as rotas em ordem aleatória (reprodutível pela semente) durante
+o tempo pedido. O relatório traz p50/p95/p99, média e vazão por rota; com
+--saida o resultado é gravado em JSON e, com --comparar, confrontado com
+uma execução anterior (código de saída 1 se alguma rota regrediu).
+
+Exemplos:
+    # em processo, SQLite local
+    SQLITE_PATH=bench.db flask --app app_mysql criar-tabelas
+    SQLITE_PATH=bench.db flask --app app_mysql gerar-dados --usuarios 20
+    SQLITE_PATH=bench.db python benchmark.py --clientes 8 --saida base.json
+
+    # contra o servidor de verdade (gunicorn + MySQL do docker-compose)
+    python benchmark.py --url http://localhost:5001 --clientes 16 --comparar base.json
+
+    # rotas JSON na API assíncrona (uvicorn api_async:app), login no gunicorn
+    python benchmark.py --url http://localhost:5001 --url-api http://localhost:5002 \
+        --rotas api_tarefas,financas_data,api_financas --clientes 64
+
+    # latência das leituras do destinatário conforme cresce o número de
+    # tarefas compartilhadas com ele (feed materializado; ver compartilhamento.py).
+    # bench1..bench10 são medidos; bench11..15 são os donos das tarefas compartilhadas
+    SQLITE_PATH=bench.db flask --app app_mysql gerar-dados --usuarios 5 --inicio 11 --tarefas 5000
+    SQLITE_PATH=bench.db FRAGMENTOS_CACHE=0 python benchmark.py \
+        --escala-compartilhamento 0,1000,5000,20000 --clientes 4 --duracao 5 --tolerancia 25
+
+No modo em processo os clientes dividem o GIL com a aplicação: serve para
+comparar execuções entre si; números absolutos, só com --url.
+
+Na escala de compartilhamento os compartilhamentos são gravados direto no
+banco do ambiente (também com --url, apontando para o mesmo banco) antes de
+cada rodada; o servidor deve rodar com FRAGMENTOS_CACHE=0 para que a
+listagem seja de fato consultada. O código de saída é 1 se o p95 de uma rota
+paginada na maior escala passar a tolerância em relação à primeira.
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, datetime
+
+from dados_sinteticos import BENCH_DOMINIO, BENCH_SENHA, email_bench
+
+ROTAS = {
+    "dashboard": "/dashboard",
+    "vida_pessoal": "/vida-pessoal",
+    "financas": "/financas",
+    "api_tarefas": "/api/tarefas?start={inicio_mes}&end={fim_mes}",
+    "api_resumo": "/api/resumo",
+    "financas_data": "/financas/data",
+    "api_financas": "/api/financas",
+    "api_financas_fluxo": "/api/financas/fluxo",
+    "api_relatorios": "/api/relatorios",
+    "api_compartilhadas": "/api/compartilhadas",
+}
+# Caminhos atendidos também pela API assíncrona (app_mysql.API_JSON)
+CAMINHOS_API = {"/api/tarefas", "/api/vida-pessoal", "/api/financas", "/api/financas/fluxo",
+                "/api/financas/calendario", "/api/busca", "/api/relatorios", "/financas/data",
+                "/api/resumo", "/api/compartilhadas"}
+# Rotas medidas em --escala-compartilhamento; só as paginadas entram na verificação,
+# porque o calendário devolve todos os eventos do mês e cresce com eles
+ROTAS_COMPARTILHAMENTO = ["api_compartilhadas", "vida_pessoal", "api_tarefas"]
+ROTAS_PAGINADAS = {"api_compartilhadas", "vida_pessoal"}
+
+
+# --- Clientes ---
+class ClienteHTTP:
+    """Cliente contra um servidor rodando (cookies por cliente, sem seguir o ETag).
+
+    Com `url_api`, as rotas JSON vão para a API assíncrona com o mesmo cookie de sessão.
+    """
+
+    def __init__(self, url, url_api=None):
+        self.url = url.rstrip("/")
+        self.url_api = (url_api or url).rstrip("/")
+        self.abridor = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def login(self, email, senha):
+        dados = urllib.parse.urlencode({"email": email, "password": senha}).encode()
+        with self.abridor.open(self.url + "/login", dados, timeout=30) as r:
+            r.read()
+            return r.url.endswith("/dashboard")
+
+    def get(self, caminho):
+        base = self.url_api if caminho.split("?")[0] in CAMINHOS_API else self.url
+        try:
+            with self.abridor.open(base + caminho, timeout=30) as r:
+                r.read()
+                return r.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class ClienteLocal:
+    """Cliente em processo (Flask test client), com o banco configurado no ambiente."""
+
+    def __init__(self, app):
+        self.cliente = app.test_client()
+
+    def login(self, email, senha):
+        r = self.cliente.post("/login", data={"email": email, "password": senha})
+        return r.status_code == 302 and r.location.endswith("/dashboard")
+
+    def get(self, caminho):
+        r = self.cliente.get(caminho)
+        r.close()
+        return r.status_code
+
+
+# --- Estatística ---
+def percentil(ordenados, p):
+    """Percentil pelo método nearest-rank (lista já ordenada)."""
+    if not ordenados:
+        return None
+    k = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[k]
+
+def resumir(amostras, erros, duracao):
+    ordenados = sorted(amostras)
+    ms = lambda v: None if v is None else round(v * 1000, 2)
+    return {
+        "n": len(ordenados),
+        "erros": erros,
+        "rps": round(len(ordenados) / duracao, 1) if duracao else 0.0,
+        "media_ms": ms(sum(ordenados) / len(ordenados)) if ordenados else None,
+        "p50_ms": ms(percentil(ordenados, 50)),
+        "p95_ms": ms(percentil(ordenados, 95)),
+        "p99_ms": ms(percentil(ordenados, 99)),
+        "max_ms": ms(ordenados[-1]) if ordenados else None,
+    }
+
+
+# --- Execução ---
+def executar(criar_cliente, rotas, clientes, usuarios, duracao, aquecimento, semente):
+    hoje = date.today()
+    params = {"inicio_mes": hoje.replace(day=1).isoformat(),
+              "fim_mes": date(hoje.year + hoje.month // 12, hoje.month % 12 + 1, 1).isoformat()}
+    caminhos = {nome: ROTAS[nome].format(**params) for nome in rotas}
+
+    amostras = {nome: [] for nome in rotas}
+    erros = {nome: 0 for nome in rotas}
+    lock = threading.Lock()
+    pronto = threading.Barrier(clientes + 1)
+    falhas_login = []
+
+    def trabalhar(i):
+        cliente = criar_cliente()
+        email = email_bench(i % usuarios + 1)
+        if not cliente.login(email, BENCH_SENHA):
+            falhas_login.append(email)
+        rnd = random.Random(semente + i)
+        pronto.wait()
+        inicio_medicao = time.perf_counter() + aquecimento
+        fim = inicio_medicao + duracao
+        locais = {nome: [] for nome in rotas}
+        erros_locais = {nome: 0 for nome in rotas}
+        while True:
+            nome = rnd.choice(rotas)
+            t0 = time.perf_counter()
+            if t0 >= fim:
+                break
+            try:
+                status = cliente.get(caminhos[nome])
+            except Exception:
+                status = 599
+            t1 = time.perf_counter()
+            if t0 < inicio_medicao:
+                continue
+            if status >= 400:
+                erros_locais[nome] += 1
+            else:
+                locais[nome].append(t1 - t0)
+        with lock:
+            for nome in rotas:
+                amostras[nome] += locais[nome]
+                erros[nome] += erros_locais[nome]
+
+    threads = [threading.Thread(target=trabalhar, args=(i,), daemon=True) for i in range(clientes)]
+    for t in threads:
+        t.start()
+    pronto.wait()
+    for t in threads:
+        t.join()
+    if falhas_login:
+        raise SystemExit(f"Login falhou para {sorted(set(falhas_login))[:3]}... "
+                         "Rode `flask gerar-dados` no mesmo banco.")
+
+    resultado = {nome: resumir(amostras[nome], erros[nome], duracao) for nome in rotas}
+    todas = [a for nome in rotas for a in amostras[nome]]
+    resultado["_total"] = resumir(todas, sum(erros.values()), duracao)
+    return resultado
+
+
+def comparar(base, atual, tolerancia):
+    """Lista (rota, métrica, antes, depois, variação %) das regressões acima da tolerância."""
+    regressoes = []
+    # A vazão por rota depende da mistura de rotas: só é comparável com o mesmo conjunto
+    mesma_mistura = set(base.get("rotas", {})) == set(atual["rotas"])
+    for nome, r in atual["rotas"].items():
+        anterior = base.get("rotas", {}).get(nome)
+        if not anterior:
+            continue
+        for metrica in ("p50_ms", "p95_ms", "p99_ms"):
+            antes, depois = anterior.get(metrica), r.get(metrica)
+            # ignora variações abaixo de 1 ms (ruído de medição)
+            if antes and depois and depois - antes > 1 and (depois / antes - 1) * 100 > tolerancia:
+                regressoes.append((nome, metrica, antes, depois, round((depois / antes - 1) * 100, 1)))
+        antes, depois = anterior.get("rps"), r.get("rps")
+        if mesma_mistura and antes and depois is not None and (1 - depois / antes) * 100 > tolerancia:
+            regressoes.append((nome, "rps", antes, depois, round((depois / antes - 1) * 100, 1)))
+    return regressoes
+
+
+def escala_compartilhamento(criar_cliente, niveis, clientes, usuarios, duracao, aquecimento, semente,
+                            log=print):
+    """Roda as rotas do destinatário com 0..N tarefas compartilhadas. Retorna {nível: resultado}."""
+    from dados_sinteticos import gerar_compartilhamentos
+    from modelos import db, Usuario
+
+    medidos = [email_bench(n) for n in range(1, usuarios + 1)]
+    with db.connection_context():
+        ids = [u.id for u in Usuario.select(Usuario.id).where(Usuario.email.in_(medidos))]
+        # Quem compartilha são os outros usuários bench: as tarefas dos medidos ficam sem
+        # destinatários e as páginas deles só mudam pelo que recebem
+        donos = [u.id for u in Usuario.select(Usuario.id)
+                 .where(Usuario.email.endswith(f"@{BENCH_DOMINIO}") & Usuario.email.not_in(medidos))]
+    if not donos:
+        raise SystemExit(f"Nenhum usuário bench além dos {usuarios} medidos para compartilhar tarefas. "
+                         f"Rode `flask gerar-dados --inicio {usuarios + 1}`.")
+    resultados = {}
+    for nivel in niveis:
+        with db.connection_context():
+            recebidas = min(gerar_compartilhamentos(user_id, nivel, donos, log=log) for user_id in ids)
+        log(f"\n== {nivel} compartilhada(s) por usuário ({recebidas} gravada(s)) ==")
+        # Uma rota por vez: no modo em processo uma rota pesada (o calendário cheio)
+        # roubaria tempo das outras e mascararia o resultado
+        resultados[nivel] = {nome: executar(criar_cliente, [nome], clientes, usuarios, duracao,
+                                            aquecimento, semente)[nome]
+                             for nome in ROTAS_COMPARTILHAMENTO}
+        imprimir(resultados[nivel])
+    return resultados
+
+def variacao_escala(resultados, tolerancia):
+    """(rota, p95 na menor escala, p95 na maior, variação %) das rotas paginadas que cresceram demais."""
+    niveis = sorted(resultados)
+    primeiro, ultimo = resultados[niveis[0]], resultados[niveis[-1]]
+    regressoes = []
+    for nome in ROTAS_PAGINADAS:
+        antes, depois = primeiro[nome]["p95_ms"], ultimo[nome]["p95_ms"]
+        # mesma folga de 1 ms de comparar()
+        if antes and depois and depois - antes > 1 and (depois / antes - 1) * 100 > tolerancia:
+            regressoes.append((nome, antes, depois, round((depois / antes - 1) * 100, 1)))
+    return regressoes
+
+
+def imprimir(resultado):
+    print(f"{'rota':<22}{'n':>8}{'erros':>7}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for nome, r in resultado.items():
+        valores = [r[k] if r[k] is not None else "-" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{nome:<22}{r['n']:>8}{r['erros']:>7}{r['rps']:>9}" + "".join(f"{v:>9}" for v in valores))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--url", help="Servidor a testar (padrão: aplicação em processo).")
+    parser.add_argument("--url-api", help="API assíncrona para as rotas JSON (requer --url).")
+    parser.add_argument("--clientes", type=int, default=4, help="Clientes concorrentes.")
+    parser.add_argument("--usuarios", type=int, default=10, help="Quantos usuários bench<N> usar.")
+    parser.add_argument("--duracao", type=float, default=10.0, help="Segundos de medição.")
+    parser.add_argument("--aquecimento", type=float, default=2.0, help="Segundos descartados no início.")
+    parser.add_argument("--rotas", default=",".join(ROTAS), help="Rotas, separadas por vírgula.")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", help="Grava o resultado em JSON.")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para detectar regressões.")
+    parser.add_argument("--tolerancia", type=float, default=10.0, help="Piora aceitável, em %%.")
+    parser.add_argument("--escala-compartilhamento",
+                        help="Níveis de tarefas compartilhadas por usuário, ex: 0,1000,10000.")
+    args = parser.parse_args(argv)
+
+    rotas = [r.strip() for r in args.rotas.split(",") if r.strip()]
+    desconhecidas = [r for r in rotas if r not in ROTAS]
+    if desconhecidas:
+        parser.error(f"rotas desconhecidas: {desconhecidas} (disponíveis: {', '.join(ROTAS)})")
+
+    if args.url_api and not args.url:
+        parser.error("--url-api requer --url (o login é feito na aplicação Flask)")
+    if args.url:
+        criar_cliente = lambda: ClienteHTTP(args.url, args.url_api)
+        banco = args.url + (f" + {args.url_api}" if args.url_api else "")
+    else:
+        if args.escala_compartilhamento:
+            # a listagem precisa ir ao banco em toda requisição
+            os.environ.setdefault("FRAGMENTOS_CACHE", "0")
+        import app_mysql
+        from modelos import db
+        app = app_mysql.create_app()
+        criar_cliente = lambda: ClienteLocal(app)
+        banco = type(db).__name__
+
+    if args.escala_compartilhamento:
+        niveis = sorted({int(n) for n in args.escala_compartilhamento.split(",") if n.strip()})
+        resultados = escala_compartilhamento(criar_cliente, niveis, args.clientes, args.usuarios,
+                                             args.duracao, args.aquecimento, args.semente)
+        print(f"\n{'rota':<22}" + "".join(f"{n:>10}" for n in niveis) + "   (p95 ms)")
+        for nome in ROTAS_COMPARTILHAMENTO:
+            print(f"{nome:<22}" + "".join(f"{resultados[n][nome]['p95_ms'] or '-':>10}" for n in niveis))
+        if args.saida:
+            with open(args.saida, "w", encoding="utf-8") as f:
+                json.dump({"meta": {"quando": datetime.now().isoformat(timespec="seconds"), "alvo": banco,
+                                    "clientes": args.clientes, "usuarios": args.usuarios,
+                                    "duracao": args.duracao, "semente": args.semente},
+                           "escala": {str(n): r for n, r in resultados.items()}},
+                          f, indent=2, ensure_ascii=False)
+        regressoes = variacao_escala(resultados, args.tolerancia)
+        if regressoes:
+            print(f"\nLatência cresceu com os compartilhamentos (> {args.tolerancia}%):")
+            for nome, antes, depois, variacao in regressoes:
+                print(f"  {nome} p95: {antes} -> {depois} ({variacao:+}%)")
+            return 1
+        print(f"\nLatência estável (p95 das rotas paginadas dentro de {args.tolerancia}%).")
+        return 0
+
+    resultado = executar(criar_cliente, rotas, args.clientes, args.usuarios, args.duracao,
+                         args.aquecimento, args.semente)
+    imprimir(resultado)
+
+    saida = {
+        "meta": {"quando": datetime.now().isoformat(timespec="seconds"), "alvo": banco,
+                 "clientes": args.clientes, "usuarios": args.usuarios, "duracao": args.duracao,
+                 "semente": args.semente},
+        "rotas": resultado,
+    }
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(saida, f, indent=2, ensure_ascii=False)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        regressoes = comparar(base, saida, args.tolerancia)
+        if regressoes:
+            print(f"\nRegressões (> {args.tolerancia}%) em relação a {args.comparar}:")
+            for nome, metrica, antes, depois, variacao in regressoes:
+                print(f"  {nome} {metrica}: {antes} -> {depois} ({variacao:+}%)")
+            return 1
+        print(f"\nSem regressões acima de {args.tolerancia}% em relação a {args.comparar}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
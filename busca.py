@@ -0,0 +1,80 @@
+"""Busca textual e filtros das listagens de tarefas e lançamentos.
+
+No MySQL a busca usa os índices FULLTEXT (MATCH ... AGAINST em modo
+booleano, com prefixo: "merc" encontra "mercado"), então digitar letra a
+letra não vira um `LIKE '%x%'` varrendo a tabela. Em outros bancos
+(SQLite de desenvolvimento) cai para LIKE por termo.
+
+Os filtros estruturados (categoria, status, tipo) são igualdades sobre
+colunas cobertas pelos índices compostos que começam pelo usuário.
+`arquivadas=1` inclui as tabelas de arquivo (ver arquivamento.py); os
+mesmos filtros valem para elas, passando o modelo de arquivo em `modelo`.
+"""
+import operator
+import re
+from functools import reduce
+
+from peewee import MySQLDatabase
+from playhouse.mysql_ext import Match
+
+from modelos import db, Tarefa, Financa
+
+# Tamanho mínimo de termo indexado pelo InnoDB (innodb_ft_min_token_size)
+BUSCA_MIN_CARACTERES = 3
+BUSCA_MAX_TERMOS = 8
+STATUS = {"0": 0, "pendente": 0, "1": 1, "concluida": 1}
+
+
+class BuscaInvalida(ValueError):
+    pass
+
+
+def termos(texto):
+    """Palavras da busca com tamanho suficiente para o índice (sem curingas do usuário)."""
+    palavras = re.findall(r"[^\W_]+", (texto or "").lower())
+    return [p for p in palavras if len(p) >= BUSCA_MIN_CARACTERES][:BUSCA_MAX_TERMOS]
+
+def filtro_texto(campos, texto):
+    """Condição que exige todos os termos (cada um como prefixo) em algum dos `campos`."""
+    lista = termos(texto)
+    if not lista:
+        raise BuscaInvalida(f"Digite ao menos {BUSCA_MIN_CARACTERES} letras para buscar.")
+    if isinstance(db, MySQLDatabase):
+        # As colunas precisam ser exatamente as de um índice FULLTEXT
+        return Match(campos, " ".join(f"+{t}*" for t in lista), modifier="IN BOOLEAN MODE")
+    return reduce(operator.and_, [reduce(operator.or_, [c.contains(t) for c in campos])
+                                  for t in lista])
+
+def ler_filtros(args):
+    """Lê q, categoria, status, tipo e arquivadas da query string (valores vazios são ignorados)."""
+    status = (args.get("status") or "").strip().lower()
+    if status and status not in STATUS:
+        raise BuscaInvalida("Status deve ser 'pendente' ou 'concluida'.")
+    tipo = (args.get("tipo") or "").strip().lower()
+    if tipo and tipo not in ("entrada", "saida"):
+        raise BuscaInvalida("Tipo deve ser 'entrada' ou 'saida'.")
+    return {
+        "q": (args.get("q") or "").strip(),
+        "categoria": (args.get("categoria") or "").strip(),
+        "status": STATUS.get(status),
+        "tipo": tipo,
+        "arquivadas": (args.get("arquivadas") or "").strip().lower() in ("1", "true", "on", "sim"),
+    }
+
+def filtrar_tarefas(query, filtros, modelo=Tarefa):
+    if filtros.get("q"):
+        query = query.where(filtro_texto((modelo.titulo, modelo.descricao), filtros["q"]))
+    if filtros.get("categoria"):
+        query = query.where(modelo.categoria == filtros["categoria"])
+    if filtros.get("status") is not None:
+        query = query.where(modelo.status == filtros["status"])
+    return query
+
+def filtrar_financas(query, filtros, modelo=Financa):
+    if filtros.get("q"):
+        query = query.where(filtro_texto((modelo.descricao,), filtros["q"]))
+    if filtros.get("categoria"):
+        query = query.where(modelo.categoria == filtros["categoria"])
+    if filtros.get("tipo"):
+        query = query.where(modelo.tipo == filtros["tipo"])
+    return query
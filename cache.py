@@ -0,0 +1,258 @@
+"""Cache da aplicação: LRU em memória e backends plugáveis (memória / Redis)."""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("datefy.cache")
+
+
+class CacheLocal:
+    """Cache LRU limitado a `max_itens`, com expiração por item, seguro para threads."""
+
+    def __init__(self, max_itens=1000, ttl=60):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens = OrderedDict()  # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._expirados = self._despejados = 0
+
+    def obter(self, chave):
+        """Retorna o valor em cache ou None (ausente ou expirado)."""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self._misses += 1
+                return None
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                self._expirados += 1
+                self._misses += 1
+                return None
+            self._itens.move_to_end(chave)
+            self._hits += 1
+            return valor
+
+    def definir(self, chave, valor, ttl=None):
+        expira_em = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._itens[chave] = (expira_em, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self._despejados += 1
+
+    def invalidar(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self._hits + self._misses
+            return {
+                "itens": len(self._itens),
+                "max_itens": self.max_itens,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / consultas, 4) if consultas else 0.0,
+                "expirados": self._expirados,
+                "despejados": self._despejados,
+            }
+
+
+# --- Backends plugáveis (memória do processo ou Redis compartilhado) ---
+SEM_EXPIRACAO = float("inf")
+
+
+class BackendCache:
+    """Interface dos backends de cache/sessão. Valores devem ser serializáveis em JSON."""
+
+    def obter(self, chave):
+        raise NotImplementedError
+
+    def definir(self, chave, valor, ttl=None):
+        raise NotImplementedError
+
+    def apagar(self, chave):
+        raise NotImplementedError
+
+    def incrementar(self, chave):
+        """Incremento atômico; retorna o novo valor (chave inexistente conta como 0)."""
+        raise NotImplementedError
+
+    def estatisticas(self):
+        return {}
+
+
+class CacheMemoria(BackendCache):
+    """Backend local: rápido, mas cada worker tem o seu (não compartilha invalidações)."""
+
+    def __init__(self, max_itens=10000, ttl=300):
+        self._cache = CacheLocal(max_itens=max_itens, ttl=ttl)
+        # Contadores (versões do CacheVersionado) ficam fora do LRU: se uma versão fosse
+        # despejada, o INCR recomeçaria do 0 e valores antigos daquela versão voltariam
+        self._contadores = {}
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            if chave in self._contadores:
+                return self._contadores[chave]
+        return self._cache.obter(chave)
+
+    def definir(self, chave, valor, ttl=None):
+        self._cache.definir(chave, valor, ttl)
+
+    def apagar(self, chave):
+        with self._lock:
+            self._contadores.pop(chave, None)
+        self._cache.invalidar(chave)
+
+    def incrementar(self, chave):
+        with self._lock:
+            valor = self._contadores.get(chave, 0) + 1
+            self._contadores[chave] = valor
+            return valor
+
+    def estatisticas(self):
+        with self._lock:
+            contadores = len(self._contadores)
+        return {"backend": "memoria", "contadores": contadores, **self._cache.estatisticas()}
+
+
+class CacheRedis(BackendCache):
+    """Backend compartilhado entre workers/processos (Redis ou compatível).
+
+    Se o Redis cair, leituras viram miss e escritas são ignoradas (com aviso
+    no log): a aplicação continua servindo direto do banco.
+    """
+
+    def __init__(self, url, prefixo="datefy:", ttl=300):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_URL aponta para Redis, mas o pacote 'redis' não está instalado.")
+        # from_url não conecta: a primeira conexão acontece no primeiro comando
+        self._redis = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self._erros = (redis.ConnectionError, redis.TimeoutError)
+        self.prefixo = prefixo
+        self.ttl = ttl
+
+    def obter(self, chave):
+        try:
+            bruto = self._redis.get(self.prefixo + chave)
+        except self._erros as e:
+            logger.warning("Cache indisponível (get %s): %s", chave, e)
+            return None
+        return None if bruto is None else json.loads(bruto)
+
+    def definir(self, chave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        dados = json.dumps(valor, default=str)
+        try:
+            if ttl == SEM_EXPIRACAO:
+                self._redis.set(self.prefixo + chave, dados)
+            else:
+                self._redis.set(self.prefixo + chave, dados, px=max(1, int(ttl * 1000)))
+        except self._erros as e:
+            logger.warning("Cache indisponível (set %s): %s", chave, e)
+
+    def apagar(self, chave):
+        try:
+            self._redis.delete(self.prefixo + chave)
+        except self._erros as e:
+            logger.warning("Cache indisponível (delete %s): %s", chave, e)
+
+    def incrementar(self, chave):
+        # Sem o INCR a invalidação se perde: valores antigos valem até o TTL
+        try:
+            return self._redis.incr(self.prefixo + chave)
+        except self._erros as e:
+            logger.warning("Cache indisponível (incr %s): %s", chave, e)
+            return None
+
+    def estatisticas(self):
+        try:
+            info = self._redis.info("stats")
+        except Exception:
+            return {"backend": "redis"}
+        return {"backend": "redis", "hits": info.get("keyspace_hits"), "misses": info.get("keyspace_misses")}
+
+
+def criar_backend(url=None):
+    """'memoria://' (padrão) ou 'redis://host:porta/db'.
+
+    A memória só serve para um processo: o gunicorn recusa subir mais de um
+    worker com ela (gunicorn.conf.py).
+    """
+    url = url or "memoria://"
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return CacheRedis(url)
+    return CacheMemoria(max_itens=int(os.getenv("CACHE_MAX_ITENS", "10000")))
+
+
+class CacheVersionado:
+    """Valores por id guardados em chaves versionadas (`ns:id:versao`).
+
+    Invalidar é só incrementar a versão (um INCR): leitores passam a procurar
+    a chave nova em todos os processos e as antigas expiram sozinhas pelo TTL.
+    """
+
+    def __init__(self, backend, namespace, ttl=60):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._hits = self._misses = 0
+
+    def _chave_versao(self, id_):
+        return f"{self.namespace}:{id_}:v"
+
+    def obter_ou_calcular(self, id_, calcular, variante=None):
+        """Valor de `id_` no cache; em falta, chama `calcular()` e guarda.
+
+        `variante` separa valores do mesmo id que dependem de outro parâmetro
+        (ex: a data de hoje); todos são invalidados juntos por `invalidar(id_)`.
+        """
+        # A versão é lida antes do cálculo: se uma escrita acontecer no meio,
+        # o valor calculado fica numa versão que ninguém mais vai ler.
+        versao = self.backend.obter(self._chave_versao(id_)) or 0
+        chave = f"{self.namespace}:{id_}:{versao}"
+        if variante is not None:
+            chave += f":{variante}"
+        valor = self.backend.obter(chave)
+        with self._lock:
+            if valor is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        if valor is None:
+            valor = calcular()
+            self.backend.definir(chave, valor, self.ttl)
+        return valor
+
+    def invalidar(self, id_):
+        self.backend.incrementar(self._chave_versao(id_))
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self._hits + self._misses
+            return {
+                "namespace": self.namespace,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / consultas, 4) if consultas else 0.0,
+                "backend": self.backend.estatisticas(),
+            }
+
+
+backend = criar_backend(os.getenv("CACHE_URL"))
@@ -0,0 +1,213 @@
+"""Compartilhamento de lembretes (RF15/R9) com feed materializado por destinatário.
+
+`compartilhamentos` guarda as arestas (tarefa -> destinatário) e
+`feed_compartilhado` uma cópia da tarefa para cada destinatário. O
+calendário e a listagem de quem recebe leem só o feed, numa faixa do índice
+(destinatario, status, data) ou (destinatario, data): o custo da leitura não
+depende de quantas tarefas foram compartilhadas com o usuário nem com
+quantas pessoas cada uma foi compartilhada.
+
+O custo fica na escrita (fan-out): compartilhar, descompartilhar e cada
+alteração da tarefa (concluir, reabrir, arquivar, excluir, nome do dono)
+reescrevem as cópias dos destinatários em lotes de COMPARTILHAMENTO_LOTE,
+cada lote numa transação curta, e incrementam `tarefas_versao` de quem
+recebeu (ETag do calendário). As funções retornam os ids dos destinatários
+afetados, para a rota invalidar os fragmentos deles.
+
+Tarefas arquivadas saem do feed (as arestas ficam) e voltam nele se a
+tarefa for restaurada.
+"""
+import os
+from datetime import datetime
+
+from modelos import db, Usuario, Tarefa, Compartilhamento, FeedCompartilhado
+
+COMPARTILHAMENTO_LOTE = int(os.getenv("COMPARTILHAMENTO_LOTE", "500"))
+# Destinatários por envio do formulário (e-mails separados por vírgula)
+COMPARTILHAMENTO_MAX_EMAILS = 20
+
+
+class CompartilhamentoInvalido(ValueError):
+    pass
+
+
+def _lotes(itens, lote):
+    for i in range(0, len(itens), lote):
+        yield itens[i:i + lote]
+
+def _marcar_alterados(destinatarios):
+    """Muda o ETag do calendário de quem recebeu (mesmo efeito de marcar_tarefas_alteradas)."""
+    (Usuario
+     .update(tarefas_versao=Usuario.tarefas_versao + 1, tarefas_alterado_em=datetime.now())
+     .where(Usuario.id.in_(destinatarios))
+     .execute())
+
+def _destinatarios(tarefa_id, lote):
+    """Ids dos destinatários da tarefa, em lotes (keyset pelo índice único (tarefa_id, destinatario))."""
+    ultimo = 0
+    while True:
+        ids = [d for d, in Compartilhamento
+               .select(Compartilhamento.destinatario)
+               .where((Compartilhamento.tarefa_id == tarefa_id) & (Compartilhamento.destinatario > ultimo))
+               .order_by(Compartilhamento.destinatario)
+               .limit(lote)
+               .tuples()]
+        if not ids:
+            return
+        yield ids
+        if len(ids) < lote:
+            return
+        ultimo = ids[-1]
+
+def _copia(tarefa, dono_nome):
+    return {"tarefa_id": tarefa.id, "dono": tarefa.user_id, "dono_nome": dono_nome,
+            "titulo": tarefa.titulo, "descricao": tarefa.descricao, "data": tarefa.data,
+            "categoria": tarefa.categoria, "status": tarefa.status, "atualizado_em": datetime.now()}
+
+def _gravar_feed(tarefa, dono_nome, destinatarios):
+    """Cria ou atualiza a cópia da tarefa no feed de cada destinatário (um lote, já em transação)."""
+    copia = _copia(tarefa, dono_nome)
+    (FeedCompartilhado
+     .insert_many([dict(copia, destinatario=d) for d in destinatarios])
+     .on_conflict_ignore()
+     .execute())
+    campos = {k: v for k, v in copia.items() if k not in ("tarefa_id", "dono")}
+    (FeedCompartilhado
+     .update(**campos)
+     .where((FeedCompartilhado.tarefa_id == tarefa.id) & FeedCompartilhado.destinatario.in_(destinatarios))
+     .execute())
+    _marcar_alterados(destinatarios)
+
+
+# --- Compartilhar / descompartilhar ---
+def ler_emails(texto):
+    emails = {e.strip() for e in (texto or "").replace(";", ",").split(",") if e.strip()}
+    if not emails:
+        raise CompartilhamentoInvalido("Informe ao menos um e-mail.")
+    if len(emails) > COMPARTILHAMENTO_MAX_EMAILS:
+        raise CompartilhamentoInvalido(f"Compartilhe com até {COMPARTILHAMENTO_MAX_EMAILS} pessoas por vez.")
+    return sorted(emails)
+
+def compartilhar(tarefa_id, dono_id, emails, lote=COMPARTILHAMENTO_LOTE):
+    """Compartilha a tarefa com os usuários dos `emails`. Retorna (ids dos destinatários, e-mails desconhecidos)."""
+    tarefa = Tarefa.get_or_none((Tarefa.id == tarefa_id) & (Tarefa.user == dono_id))
+    if tarefa is None:
+        raise CompartilhamentoInvalido("Tarefa não encontrada (tarefas arquivadas não podem ser compartilhadas).")
+    # Mesma comparação do login (no MySQL a collation já ignora maiúsculas)
+    usuarios = {email: id_ for id_, email in Usuario
+                .select(Usuario.id, Usuario.email)
+                .where(Usuario.email.in_(emails) & (Usuario.id != dono_id))
+                .tuples()}
+    desconhecidos = [e for e in emails if e not in usuarios]
+    destinatarios = sorted(usuarios.values())
+    dono_nome = Usuario.select(Usuario.nome).where(Usuario.id == dono_id).scalar()
+    for ids in _lotes(destinatarios, lote):
+        with db.atomic():
+            (Compartilhamento
+             .insert_many([{"tarefa_id": tarefa_id, "dono": dono_id, "destinatario": d} for d in ids])
+             .on_conflict_ignore()
+             .execute())
+            _gravar_feed(tarefa, dono_nome, ids)
+    return set(destinatarios), desconhecidos
+
+def descompartilhar(tarefa_id, dono_id, destinatario_id=None, lote=COMPARTILHAMENTO_LOTE):
+    """Desfaz o compartilhamento com um destinatário (ou com todos). Retorna os ids afetados."""
+    do_dono = Compartilhamento.select().where((Compartilhamento.tarefa_id == tarefa_id)
+                                              & (Compartilhamento.dono == dono_id))
+    if not do_dono.exists():
+        return set()
+    afetados = set()
+    lotes = [[destinatario_id]] if destinatario_id is not None else list(_destinatarios(tarefa_id, lote))
+    for ids in lotes:
+        with db.atomic():
+            apagados = (Compartilhamento
+                        .delete()
+                        .where((Compartilhamento.tarefa_id == tarefa_id)
+                               & Compartilhamento.destinatario.in_(ids))
+                        .execute())
+            if not apagados:
+                continue
+            (FeedCompartilhado
+             .delete()
+             .where((FeedCompartilhado.tarefa_id == tarefa_id) & FeedCompartilhado.destinatario.in_(ids))
+             .execute())
+            _marcar_alterados(ids)
+        afetados.update(ids)
+    return afetados
+
+
+# --- Propagação das alterações da tarefa ---
+def propagar(tarefa_id, lote=COMPARTILHAMENTO_LOTE):
+    """Reescreve a cópia da tarefa no feed de todos os destinatários. Retorna os ids afetados.
+
+    Chamar depois de alterar (ou restaurar do arquivo) uma tarefa; sem
+    compartilhamentos custa uma consulta no índice (tarefa_id, destinatario).
+    """
+    afetados = set()
+    tarefa = None
+    for ids in _destinatarios(tarefa_id, lote):
+        if tarefa is None:
+            tarefa = Tarefa.get_or_none(Tarefa.id == tarefa_id)
+            if tarefa is None:
+                return afetados
+            dono_nome = Usuario.select(Usuario.nome).where(Usuario.id == tarefa.user_id).scalar()
+        with db.atomic():
+            _gravar_feed(tarefa, dono_nome, ids)
+        afetados.update(ids)
+    return afetados
+
+def retirar_do_feed(tarefa_ids):
+    """Tira tarefas do feed sem desfazer os compartilhamentos (arquivamento). Já em transação."""
+    destinatarios = [d for d, in FeedCompartilhado
+                     .select(FeedCompartilhado.destinatario)
+                     .where(FeedCompartilhado.tarefa_id.in_(tarefa_ids))
+                     .distinct()
+                     .tuples()]
+    if destinatarios:
+        FeedCompartilhado.delete().where(FeedCompartilhado.tarefa_id.in_(tarefa_ids)).execute()
+        _marcar_alterados(destinatarios)
+    return set(destinatarios)
+
+def propagar_dono(dono_id, lote=COMPARTILHAMENTO_LOTE):
+    """Atualiza o nome do dono nas cópias do feed (depois de editar o perfil). Retorna os ids afetados."""
+    nome = Usuario.select(Usuario.nome).where(Usuario.id == dono_id).scalar()
+    afetados, ultimo = set(), 0
+    while True:
+        linhas = list(FeedCompartilhado
+                      .select(FeedCompartilhado.id, FeedCompartilhado.destinatario)
+                      .where((FeedCompartilhado.dono == dono_id) & (FeedCompartilhado.id > ultimo))
+                      .order_by(FeedCompartilhado.id)
+                      .limit(lote)
+                      .tuples())
+        if not linhas:
+            return afetados
+        # O nome aparece no calendário: o ETag de quem recebeu precisa mudar (uma vez por destinatário)
+        novos = {d for _, d in linhas} - afetados
+        with db.atomic():
+            (FeedCompartilhado
+             .update(dono_nome=nome)
+             .where(FeedCompartilhado.id.in_([i for i, _ in linhas]))
+             .execute())
+            if novos:
+                _marcar_alterados(list(novos))
+        afetados.update(novos)
+        if len(linhas) < lote:
+            return afetados
+        ultimo = linhas[-1][0]
+
+
+# --- Leitura ---
+def destinatarios_por_tarefa(tarefa_ids, dono_id):
+    """{tarefa_id: [{"id", "nome", "email"}]} dos compartilhamentos do dono (para a listagem dele)."""
+    saida = {}
+    if not tarefa_ids:
+        return saida
+    query = (Compartilhamento
+             .select(Compartilhamento.tarefa_id, Usuario.id, Usuario.nome, Usuario.email)
+             .join(Usuario, on=(Compartilhamento.destinatario == Usuario.id))
+             .where((Compartilhamento.dono == dono_id) & Compartilhamento.tarefa_id.in_(tarefa_ids))
+             .order_by(Usuario.nome)
+             .tuples())
+    for tarefa_id, id_, nome, email in query:
+        saida.setdefault(tarefa_id, []).append({"id": id_, "nome": nome, "email": email})
+    return saida
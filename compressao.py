@@ -0,0 +1,89 @@
+"""Compressão (brotli/gzip) e ETag forte das respostas HTML e JSON.
+
+Depois de cada requisição GET com resposta 200 em HTML/JSON:
+
+1. a resposta ganha um ETag forte (SHA-1 do corpo), se a rota não definiu um;
+2. a codificação é escolhida pelo Accept-Encoding (brotli, se o pacote estiver
+   instalado, senão gzip) e entra no ETag como sufixo ("-br"/"-gz"), já que o
+   corpo entregue muda com ela;
+3. se o navegador já tem essa versão (If-None-Match), responde 304 sem corpo
+   e sem comprimir nada;
+4. o corpo comprimido fica num LRU do processo pelo hash do conteúdo: a
+   mesma página vista de novo não é comprimida outra vez.
+
+Respostas em streaming (exportação CSV) e arquivos (send_file) passam direto.
+"""
+import gzip
+import hashlib
+import os
+
+from flask import request
+
+from cache import CacheLocal
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TIPOS = {"text/html", "application/json", "text/css", "text/javascript", "application/javascript",
+         "text/plain", "image/svg+xml"}
+COMPRESSAO_MIN_BYTES = int(os.getenv("COMPRESSAO_MIN_BYTES", "500"))
+NIVEL_GZIP = int(os.getenv("COMPRESSAO_NIVEL_GZIP", "6"))
+NIVEL_BROTLI = int(os.getenv("COMPRESSAO_NIVEL_BROTLI", "5"))
+SUFIXOS = {"br": "-br", "gzip": "-gz"}
+
+cache_comprimidos = CacheLocal(max_itens=int(os.getenv("COMPRESSAO_CACHE_ITENS", "256")), ttl=600)
+
+
+def etag_confere(etag, etags):
+    """True se o If-None-Match (`etags`) tem `etag` em qualquer uma das codificações."""
+    return any(etag + sufixo in etags for sufixo in ("", *SUFIXOS.values()))
+
+def _codificacao(aceitas):
+    if brotli is not None and aceitas["br"]:
+        return "br"
+    if aceitas["gzip"]:
+        return "gzip"
+    return None
+
+def _comprimir(corpo, codificacao):
+    if codificacao == "br":
+        return brotli.compress(corpo, quality=NIVEL_BROTLI)
+    # mtime fixo: o mesmo corpo gera sempre os mesmos bytes
+    return gzip.compress(corpo, compresslevel=NIVEL_GZIP, mtime=0)
+
+def processar(resposta):
+    if (request.method not in ("GET", "HEAD") or resposta.status_code != 200
+            or resposta.direct_passthrough or resposta.is_streamed
+            or resposta.mimetype not in TIPOS or "Content-Encoding" in resposta.headers):
+        return resposta
+
+    corpo = resposta.get_data()
+    hash_corpo = hashlib.sha1(corpo).hexdigest()
+    etag, fraco = resposta.get_etag()
+    if etag is None:
+        etag, fraco = hash_corpo, False
+
+    codificacao = _codificacao(request.accept_encodings) if len(corpo) >= COMPRESSAO_MIN_BYTES else None
+    resposta.vary.add("Accept-Encoding")
+    resposta.set_etag(etag + SUFIXOS.get(codificacao, ""), weak=fraco)
+    if not resposta.headers.get("Cache-Control"):
+        # Páginas e dados são por usuário: o navegador guarda, mas sempre revalida pelo ETag
+        resposta.headers["Cache-Control"] = "private, no-cache"
+
+    resposta.make_conditional(request)
+    if resposta.status_code == 304 or codificacao is None:
+        return resposta
+
+    chave = f"{hash_corpo}:{codificacao}"
+    comprimido = cache_comprimidos.obter(chave)
+    if comprimido is None:
+        comprimido = _comprimir(corpo, codificacao)
+        cache_comprimidos.definir(chave, comprimido)
+    resposta.set_data(comprimido)
+    resposta.headers["Content-Encoding"] = codificacao
+    return resposta
+
+def instalar(app):
+    app.after_request(processar)
@@ -0,0 +1,151 @@
+"""Gerador de dados sintéticos para benchmarks (`flask gerar-dados`).
+
+Cria usuários `bench<N>@datefy.test` (senha BENCH_SENHA) com tarefas e
+lançamentos aleatórios, mas reprodutíveis pela semente. Tudo é gravado com
+`insert_many` em lotes; no fim os saldos mensais e as parcelas dos usuários
+gerados são recalculados de uma vez.
+
+`gerar_compartilhamentos` faz com que um usuário receba N tarefas de outros
+usuários (benchmark.py --escala-compartilhamento).
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from peewee import fn
+
+from modelos import db, Usuario, Tarefa, Financa, Compartilhamento, FeedCompartilhado
+from saldos import reconstruir_saldos
+from parcelamento import materializar_pendentes
+from senhas import gerar_hash
+
+BENCH_SENHA = "bench123"
+BENCH_DOMINIO = "datefy.test"
+TITULOS = ["Reunião", "Academia", "Pagar contas", "Mercado", "Estudar", "Consulta médica",
+           "Ligar para a família", "Revisar orçamento", "Entrega do projeto", "Aniversário"]
+FORMAS = ["pix", "debito", "credito", "boleto", "dinheiro"]
+
+
+def email_bench(n):
+    return f"bench{n}@{BENCH_DOMINIO}"
+
+def _lotes(linhas, lote):
+    for i in range(0, len(linhas), lote):
+        yield linhas[i:i + lote]
+
+def _tarefas(rnd, usuario_id, n, hoje, dias, categorias):
+    for _ in range(n):
+        data = hoje + timedelta(days=rnd.randint(-dias, dias // 4))
+        yield {
+            "user": usuario_id,
+            "titulo": rnd.choice(TITULOS),
+            "descricao": None,
+            "data": data,
+            "categoria": rnd.choice(categorias),
+            # passado quase todo concluído, futuro pendente
+            "status": 1 if data < hoje and rnd.random() < 0.85 else 0,
+        }
+
+def _financas(rnd, usuario_id, n, hoje, dias, categorias):
+    for _ in range(n):
+        entrada = rnd.random() < 0.25
+        parcelas = rnd.choice([2, 3, 6, 10, 12, 24]) if not entrada and rnd.random() < 0.05 else 1
+        yield {
+            "usuario": usuario_id,
+            "descricao": "Salário" if entrada else rnd.choice(TITULOS),
+            "categoria": "salario" if entrada else rnd.choice(categorias),
+            "tipo": "entrada" if entrada else "saida",
+            "valor": Decimal(rnd.randint(500, 500000)) / 100,
+            "forma_pagamento": rnd.choice(FORMAS),
+            "parcelas": parcelas,
+            "data": hoje - timedelta(days=rnd.randint(0, dias)),
+        }
+
+def gerar_dados(usuarios, tarefas, financas, categorias, semente=42, dias=730,
+                inicio=1, lote=1000, log=print):
+    """Cria `usuarios` usuários de benchmark (a partir de bench<inicio>).
+
+    `tarefas` e `financas` são quantidades por usuário. Retorna os ids criados.
+    """
+    rnd = random.Random(semente)
+    hoje = date.today()
+    # Hash barato (custo mínimo): é refeito no custo configurado no primeiro login
+    senha_hash = gerar_hash(BENCH_SENHA, custo=4)
+
+    emails = [email_bench(n) for n in range(inicio, inicio + usuarios)]
+    with db.atomic():
+        for parte in _lotes([{"nome": f"Usuário Bench {e.split('@')[0][5:]}", "email": e,
+                              "senha_hash": senha_hash} for e in emails], lote):
+            Usuario.insert_many(parte).on_conflict_ignore().execute()
+    ids = [u.id for u in Usuario.select(Usuario.id).where(Usuario.email.in_(emails))]
+    log(f"{len(ids)} usuário(s)")
+
+    for i, usuario_id in enumerate(ids, start=1):
+        with db.atomic():
+            for parte in _lotes(list(_tarefas(rnd, usuario_id, tarefas, hoje, dias, categorias)), lote):
+                Tarefa.insert_many(parte).execute()
+            for parte in _lotes(list(_financas(rnd, usuario_id, financas, hoje, dias, categorias)), lote):
+                Financa.insert_many(parte).execute()
+        reconstruir_saldos(usuario_id)
+        materializar_pendentes(usuario_id)
+        if i % 10 == 0 or i == len(ids):
+            log(f"  {i}/{len(ids)} usuário(s) preenchido(s)")
+    return ids
+
+def gerar_compartilhamentos(destinatario_id, quantidade, donos, lote=1000, log=print):
+    """Deixa o destinatário com `quantidade` tarefas dos usuários `donos` compartilhadas com ele.
+
+    Grava as arestas e as cópias do feed direto com `insert_many` (o mesmo
+    resultado de compartilhamento.compartilhar, sem uma transação por tarefa);
+    se ele já recebeu mais, apaga as excedentes. Retorna quantas ele recebeu no total.
+    """
+    atual = Compartilhamento.select().where(Compartilhamento.destinatario == destinatario_id).count()
+    falta = quantidade - atual
+    if falta < 0:
+        excedentes = [t for t, in Compartilhamento
+                      .select(Compartilhamento.tarefa_id)
+                      .where(Compartilhamento.destinatario == destinatario_id)
+                      .order_by(Compartilhamento.tarefa_id.desc())
+                      .limit(-falta)
+                      .tuples()]
+        for parte in _lotes(excedentes, lote):
+            with db.atomic():
+                (Compartilhamento.delete()
+                 .where((Compartilhamento.destinatario == destinatario_id)
+                        & Compartilhamento.tarefa_id.in_(parte))
+                 .execute())
+                (FeedCompartilhado.delete()
+                 .where((FeedCompartilhado.destinatario == destinatario_id)
+                        & FeedCompartilhado.tarefa_id.in_(parte))
+                 .execute())
+        return quantidade
+    if falta == 0:
+        return atual
+    ja_recebida = (Compartilhamento
+                   .select(Compartilhamento.id)
+                   .where((Compartilhamento.tarefa_id == Tarefa.id)
+                          & (Compartilhamento.destinatario == destinatario_id)))
+    tarefas = list(Tarefa
+                   .select(Tarefa, Usuario.nome.alias("dono_nome"))
+                   .join(Usuario)
+                   .where(Tarefa.user.in_(donos) & ~fn.EXISTS(ja_recebida))
+                   .order_by(Tarefa.id)
+                   .limit(falta)
+                   .dicts())
+    if len(tarefas) < falta:
+        log(f"  só há {len(tarefas)} tarefa(s) a mais para compartilhar (gere mais tarefas para os donos)")
+    for parte in _lotes(tarefas, lote):
+        with db.atomic():
+            (Compartilhamento
+             .insert_many([{"tarefa_id": t["id"], "dono": t["user"], "destinatario": destinatario_id}
+                           for t in parte])
+             .on_conflict_ignore()
+             .execute())
+            (FeedCompartilhado
+             .insert_many([{"destinatario": destinatario_id, "tarefa_id": t["id"], "dono": t["user"],
+                            "dono_nome": t["dono_nome"], "titulo": t["titulo"], "descricao": t["descricao"],
+                            "data": t["data"], "categoria": t["categoria"], "status": t["status"]}
+                           for t in parte])
+             .on_conflict_ignore()
+             .execute())
+    return atual + len(tarefas)
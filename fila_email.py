@@ -0,0 +1,254 @@
+"""Fila de envio de e-mails em segundo plano.
+
+As rotas só enfileiram a mensagem e retornam; uma thread de entrega envia
+usando um pool de sessões SMTP reaproveitadas, com novas tentativas em
+backoff exponencial. Mensagens que esgotam as tentativas (ou recebem erro
+permanente 5xx) são repassadas ao callback `ao_falhar` (dead letter).
+"""
+import heapq
+import itertools
+import logging
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("datefy.email")
+
+
+class PoolSMTP:
+    """Mantém até `max_conexoes` sessões SMTP abertas (STARTTLS + login feitos uma vez)."""
+
+    def __init__(self, host, port, usuario=None, senha=None, starttls=True,
+                 max_conexoes=2, ociosa_max=60, timeout=10):
+        self.host = host
+        self.port = port
+        self.usuario = usuario
+        self.senha = senha
+        self.starttls = starttls
+        self.ociosa_max = ociosa_max
+        self.timeout = timeout
+        self._ociosas = []  # [(devolvida_em, smtp)]
+        self._lock = threading.Lock()
+        self._limite = threading.BoundedSemaphore(max_conexoes)
+
+    def _abrir(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.usuario:
+            smtp.login(self.usuario, self.senha)
+        return smtp
+
+    @staticmethod
+    def _fechar(smtp):
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def _pegar(self):
+        while True:
+            with self._lock:
+                if not self._ociosas:
+                    break
+                devolvida_em, smtp = self._ociosas.pop()
+            if time.monotonic() - devolvida_em > self.ociosa_max:
+                self._fechar(smtp)
+                continue
+            try:
+                # health check: o servidor pode ter derrubado a sessão
+                if smtp.noop()[0] == 250:
+                    return smtp
+            except Exception:
+                pass
+            self._fechar(smtp)
+        return self._abrir()
+
+    @contextmanager
+    def conexao(self):
+        self._limite.acquire()
+        try:
+            smtp = self._pegar()
+            try:
+                yield smtp
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self._fechar(smtp)
+                raise
+            except Exception:
+                # erro de protocolo: a sessão continua válida
+                with self._lock:
+                    self._ociosas.append((time.monotonic(), smtp))
+                raise
+            else:
+                with self._lock:
+                    self._ociosas.append((time.monotonic(), smtp))
+        finally:
+            self._limite.release()
+
+    def fechar_todas(self):
+        with self._lock:
+            ociosas, self._ociosas = self._ociosas, []
+        for _, smtp in ociosas:
+            self._fechar(smtp)
+
+
+def _erro_permanente(erro):
+    if isinstance(erro, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(erro, smtplib.SMTPResponseException) and erro.smtp_code >= 500
+
+
+class FilaEmail:
+    """Fila em memória com agendamento por horário (para o backoff)."""
+
+    def __init__(self, pool, workers=1, max_tentativas=5, backoff_base=2.0,
+                 backoff_max=300.0, ao_falhar=None):
+        self.pool = pool
+        self.workers = workers
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.ao_falhar = ao_falhar
+        self._heap = []  # [(executar_em, seq, item)]
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._parando = False
+        self._em_andamento = 0
+        self._stats = {"enfileirados": 0, "enviados": 0, "tentativas_falhas": 0, "descartados": 0}
+
+    # --- API ---
+    def enfileirar(self, mensagem, ao_enviar=None, ao_falhar=None):
+        """Agenda o envio de um `email.message.Message`; retorna imediatamente.
+
+        `ao_enviar()` e `ao_falhar(mensagem, tentativas, erro)` são chamados na
+        thread de entrega quando esta mensagem é enviada ou descartada.
+        """
+        item = {"mensagem": mensagem, "tentativas": 0, "ultimo_erro": None,
+                "ao_enviar": ao_enviar, "ao_falhar": ao_falhar}
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic(), next(self._seq), item))
+            self._stats["enfileirados"] += 1
+            self._cond.notify()
+        self._iniciar()
+
+    def aguardar(self, timeout=None):
+        """Espera a fila esvaziar (útil em testes e no desligamento)."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._heap or self._em_andamento:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._cond.wait(restante if restante is not None else 1.0)
+        return True
+
+    def parar(self, timeout=5.0):
+        """Espera a fila por até `timeout`s e encerra as threads.
+
+        O que ainda estiver na fila (ex: novas tentativas aguardando o backoff)
+        não é perdido em silêncio: vai para o dead letter (`ao_falhar`).
+        """
+        self.aguardar(timeout)
+        with self._cond:
+            self._parando = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        with self._cond:
+            restantes, self._heap = [item for _, _, item in self._heap], []
+        if restantes:
+            logger.warning("Fila de e-mail encerrada com %d mensagem(ns) pendente(s); "
+                           "enviadas ao dead letter", len(restantes))
+        for item in restantes:
+            self._descartar(item, item["ultimo_erro"] or "fila encerrada antes do envio")
+        self.pool.fechar_todas()
+
+    def estatisticas(self):
+        with self._cond:
+            return {**self._stats, "pendentes": len(self._heap), "em_andamento": self._em_andamento}
+
+    # --- Worker ---
+    def _iniciar(self):
+        # As threads nascem no primeiro envio, já no processo (worker) que vai usá-las
+        with self._cond:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            if self._parando:
+                self._parando = False
+            for _ in range(self.workers - len(self._threads)):
+                t = threading.Thread(target=self._loop, name="fila-email", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _proximo(self):
+        with self._cond:
+            while not self._parando:
+                if self._heap:
+                    espera = self._heap[0][0] - time.monotonic()
+                    if espera <= 0:
+                        self._em_andamento += 1
+                        return heapq.heappop(self._heap)[2]
+                    self._cond.wait(espera)
+                else:
+                    self._cond.wait()
+            return None
+
+    def _loop(self):
+        while True:
+            item = self._proximo()
+            if item is None:
+                return
+            try:
+                self._entregar(item)
+            finally:
+                with self._cond:
+                    self._em_andamento -= 1
+                    self._cond.notify_all()
+
+    def _entregar(self, item):
+        mensagem = item["mensagem"]
+        try:
+            with self.pool.conexao() as smtp:
+                smtp.send_message(mensagem)
+        except Exception as e:
+            item["tentativas"] += 1
+            item["ultimo_erro"] = repr(e)
+            with self._cond:
+                self._stats["tentativas_falhas"] += 1
+
+            if _erro_permanente(e) or item["tentativas"] >= self.max_tentativas:
+                logger.error("E-mail para %s descartado após %d tentativa(s): %s",
+                             mensagem["To"], item["tentativas"], e)
+                self._descartar(item, item["ultimo_erro"])
+                return
+
+            atraso = min(self.backoff_base * 2 ** (item["tentativas"] - 1), self.backoff_max)
+            logger.warning("Falha ao enviar e-mail para %s (tentativa %d), nova tentativa em %.0fs: %s",
+                           mensagem["To"], item["tentativas"], atraso, e)
+            with self._cond:
+                heapq.heappush(self._heap, (time.monotonic() + atraso, next(self._seq), item))
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._stats["enviados"] += 1
+        if item["ao_enviar"]:
+            try:
+                item["ao_enviar"]()
+            except Exception:
+                logger.exception("Falha no callback de e-mail enviado")
+
+    def _descartar(self, item, erro):
+        with self._cond:
+            self._stats["descartados"] += 1
+        for callback in (self.ao_falhar, item["ao_falhar"]):
+            if callback:
+                try:
+                    callback(item["mensagem"], item["tentativas"], erro)
+                except Exception:
+                    logger.exception("Falha ao registrar e-mail descartado")
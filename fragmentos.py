@@ -0,0 +1,103 @@
+"""Cache de fragmentos de template e pré-compilação dos templates.
+
+Nos templates:
+
+    {% cache "financas:lista", dono, filtros, busca %} ... {% endcache %}
+
+O HTML do bloco é guardado por `dono` (o id do usuário) e pelas demais
+chaves. Os fragmentos de usuário ficam no backend de cache compartilhado,
+em chaves versionadas: as rotas que gravam tarefas ou lançamentos chamam
+`invalidar(user_id)` (um INCR) e todos os workers passam a ignorar os
+fragmentos antigos daquele usuário. Com `dono` nulo o fragmento é igual para
+todos (ex: a legenda de CATEGORIAS) e fica na memória do processo, sem ida
+ao Redis, até o próximo deploy.
+
+Os dados usados só dentro do bloco devem chegar ao template como
+`Preguicoso`: quando o fragmento vem do cache, a consulta nem acontece.
+Nada que dependa da sessão (tokens CSRF, mensagens flash) pode ficar dentro
+de um bloco cacheado.
+"""
+import hashlib
+import json
+import os
+
+from jinja2 import nodes, FileSystemBytecodeCache
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+import cache
+
+FRAGMENTOS_CACHE = os.getenv("FRAGMENTOS_CACHE", "1") == "1"
+cache_fragmentos = cache.CacheVersionado(cache.backend, "fragmento",
+                                         ttl=float(os.getenv("FRAGMENTOS_CACHE_TTL", "300")))
+cache_global = cache.CacheLocal(max_itens=200, ttl=cache.SEM_EXPIRACAO)
+
+
+class Preguicoso:
+    """Valor calculado no primeiro acesso a `.valor` (e só então)."""
+
+    def __init__(self, calcular):
+        self._calcular = calcular
+        self._calculado = False
+        self._valor = None
+
+    @property
+    def valor(self):
+        if not self._calculado:
+            self._valor = self._calcular()
+            self._calculado = True
+        return self._valor
+
+
+class ExtensaoFragmentos(Extension):
+    """Tag `{% cache nome[, dono[, chaves...]] %}...{% endcache %}`."""
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        partes = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            partes.append(parser.parse_expression())
+        corpo = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(self.call_method("_renderizar", [nodes.List(partes)]),
+                               [], [], corpo).set_lineno(lineno)
+
+    def _renderizar(self, partes, caller):
+        if not FRAGMENTOS_CACHE:
+            return caller()
+        nome, dono, chaves = partes[0], (partes[1:] or [None])[0], partes[2:]
+        variante = nome
+        if chaves:
+            bruto = json.dumps(chaves, sort_keys=True, default=str).encode()
+            variante += ":" + hashlib.sha1(bruto).hexdigest()[:16]
+
+        if dono is None:
+            html = cache_global.obter(variante)
+            if html is None:
+                html = str(caller())
+                cache_global.definir(variante, html)
+        else:
+            html = cache_fragmentos.obter_ou_calcular(dono, lambda: str(caller()), variante=variante)
+        return Markup(html)
+
+
+def invalidar(user_id):
+    """Chamar depois de gravar qualquer alteração nos dados que aparecem nos fragmentos do usuário."""
+    cache_fragmentos.invalidar(user_id)
+
+def instalar(app):
+    """Registra a tag {% cache %} e compila todos os templates na subida.
+
+    Com JINJA_CACHE_DIR o bytecode compilado vai para disco e os workers
+    seguintes (ou reciclados pelo max_requests) só o carregam.
+    """
+    env = app.jinja_env
+    env.add_extension(ExtensaoFragmentos)
+    diretorio = os.getenv("JINJA_CACHE_DIR")
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+        env.bytecode_cache = FileSystemBytecodeCache(diretorio)
+    # Erros de sintaxe aparecem no deploy, e a primeira requisição não paga a compilação
+    for nome in env.list_templates(extensions=("html",)):
+        env.get_template(nome)
@@ -0,0 +1,54 @@
+# Configuração do Gunicorn (servidor de produção). Tudo pode ser ajustado por env.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+
+# Processos x threads: por padrão um worker por núcleo (mais um), 4 threads cada
+workers = int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count() + 1))
+threads = int(os.getenv("WEB_THREADS", "4"))
+worker_class = "gthread" if threads > 1 else "sync"
+
+timeout = int(os.getenv("WEB_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+
+# Recicla workers periodicamente (com jitter para não reiniciarem todos juntos)
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "200"))
+
+# Carregar o app no master economiza memória, mas o HUP deixa de recarregar o código
+preload_app = os.getenv("WEB_PRELOAD", "0") == "1"
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("WEB_LOGLEVEL", "info")
+
+
+def on_starting(server):
+    # Com o cache em memória cada worker teria as próprias versões e sessões: uma
+    # invalidação (ou um login) feita num worker não valeria nos outros
+    import cache
+    if server.cfg.workers > 1 and isinstance(cache.backend, cache.CacheMemoria):
+        raise RuntimeError(f"{server.cfg.workers} workers com o cache em memória (CACHE_URL={os.getenv('CACHE_URL', '')!r}): "
+                           "configure CACHE_URL=redis://... ou use WEB_WORKERS=1.")
+
+
+def pre_fork(server, worker):
+    # Conexões abertas no master (preload_app) não podem ser compartilhadas entre processos:
+    # fecha tudo antes do fork para cada worker começar com o pool vazio.
+    if preload_app:
+        from modelos import db
+        if hasattr(db, "close_all"):
+            db.close_all()
+        elif not db.is_closed():
+            db.close()
+
+
+def worker_exit(server, worker):
+    # Entrega os e-mails pendentes e devolve as conexões antes de sair
+    from modelos import db
+    from app_mysql import fila_email
+    fila_email.parar(timeout=graceful_timeout)
+    if hasattr(db, "close_all"):
+        db.close_all()
@@ -0,0 +1,241 @@
+"""Importação e exportação em massa de lançamentos financeiros (CSV / OFX).
+
+Os arquivos são lidos em streaming (linha a linha / bloco a bloco) e os
+lançamentos válidos são gravados com `insert_many` em lotes, cada lote em
+uma transação que também atualiza os saldos pré-calculados. As parcelas dos
+lançamentos parcelados são materializadas ao final.
+"""
+import csv
+import io
+import re
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from peewee import SQL
+
+from modelos import db, Financa, FinancaArquivada
+from saldos import atualizar_saldo
+from parcelamento import PARCELAS_MAX, materializar_pendentes
+
+TIPOS = ("entrada", "saida")
+COLUNAS_CSV = ["data", "descricao", "categoria", "tipo", "valor", "forma_pagamento", "parcelas"]
+LOTE_PADRAO = 500
+
+
+class LancamentoInvalido(ValueError):
+    pass
+
+
+def validar_lancamento(campos):
+    """Valida e normaliza um lançamento (mesmas regras do formulário de /financas).
+
+    `campos` é qualquer mapeamento com as chaves do formulário (request.form,
+    linha de CSV...). Levanta `LancamentoInvalido` com a mensagem do erro.
+    """
+    tipo = (campos.get("tipo") or "").strip().lower()
+    if tipo not in TIPOS:
+        raise LancamentoInvalido("Tipo deve ser 'entrada' ou 'saida'.")
+
+    valor_raw = (campos.get("valor") or "0").replace(",", ".").strip()
+    try:
+        valor = Decimal(valor_raw).quantize(Decimal("0.01"))
+        parcelas = int(campos.get("parcelas") or 1)
+    except (InvalidOperation, ValueError):
+        raise LancamentoInvalido("Valor ou parcelas inválidos.")
+    if not 1 <= parcelas <= PARCELAS_MAX:
+        raise LancamentoInvalido(f"Parcelas deve estar entre 1 e {PARCELAS_MAX}.")
+
+    data = (campos.get("data") or "").strip() or None
+    if data:
+        try:
+            data = datetime.strptime(data, "%Y-%m-%d").date()
+        except ValueError:
+            raise LancamentoInvalido("Data inválida (use AAAA-MM-DD).")
+
+    return {
+        "descricao": (campos.get("descricao") or "").strip(),
+        "categoria": campos.get("categoria") or None,
+        "tipo": tipo,
+        "valor": valor,
+        "forma_pagamento": campos.get("forma_pagamento") or "",
+        "parcelas": parcelas,
+        "data": data,
+    }
+
+
+# --- Leitores (geram dicionários no formato do formulário) ---
+def ler_csv(arquivo_texto):
+    """Lê um CSV com cabeçalho (colunas de COLUNAS_CSV; ';' ou ',' como separador)."""
+    primeira = arquivo_texto.readline()
+    separador = ";" if primeira.count(";") > primeira.count(",") else ","
+    cabecalho = next(csv.reader([primeira], delimiter=separador))
+    for linha in csv.DictReader(arquivo_texto, fieldnames=[c.strip().lower() for c in cabecalho],
+                                delimiter=separador):
+        yield linha
+
+
+_TAG_OFX = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+def _tags_ofx(arquivo_texto, tamanho_bloco=64 * 1024):
+    # OFX 1.x é SGML (tags sem fechamento, às vezes tudo em uma linha só):
+    # varre o texto em blocos, guardando o pedaço após o último '<'.
+    resto = ""
+    while True:
+        bloco = arquivo_texto.read(tamanho_bloco)
+        texto = resto + bloco
+        if not bloco:
+            corte = len(texto)
+        else:
+            corte = texto.rfind("<")
+            if corte <= 0:
+                resto = texto
+                continue
+        for m in _TAG_OFX.finditer(texto, 0, corte):
+            yield m.group(1) == "/", m.group(2).upper(), m.group(3).strip()
+        resto = texto[corte:]
+        if not bloco:
+            return
+
+def ler_ofx(arquivo_texto):
+    """Lê as transações (<STMTTRN>) de um extrato OFX."""
+    atual = None
+    for fechamento, tag, valor in _tags_ofx(arquivo_texto):
+        if tag == "STMTTRN":
+            if not fechamento:
+                atual = {}
+                continue
+            if atual is not None:
+                yield _transacao_ofx(atual)
+            atual = None
+        elif atual is not None and not fechamento:
+            atual[tag] = valor
+
+def _transacao_ofx(t):
+    valor = (t.get("TRNAMT") or "0").replace(",", ".")
+    negativo = valor.startswith("-")
+    data = t.get("DTPOSTED", "")[:8]
+    return {
+        "data": f"{data[:4]}-{data[4:6]}-{data[6:8]}" if len(data) == 8 else "",
+        "descricao": t.get("MEMO") or t.get("NAME") or "",
+        "categoria": "",
+        "tipo": "saida" if negativo else "entrada",
+        "valor": valor.lstrip("-+"),
+        "forma_pagamento": t.get("TRNTYPE", "").lower(),
+        "parcelas": "1",
+    }
+
+def abrir_texto(arquivo_binario):
+    """Envolve um arquivo binário (upload, open(..., 'rb')) em leitura de texto."""
+    return io.TextIOWrapper(arquivo_binario, encoding="utf-8-sig", errors="replace", newline="")
+
+def detectar_formato(nome_arquivo):
+    return "ofx" if (nome_arquivo or "").lower().endswith((".ofx", ".qfx")) else "csv"
+
+
+# --- Importação em lote ---
+def _gravar_lote(usuario_id, lote):
+    saldos = defaultdict(lambda: [Decimal("0"), 0])
+    for r in lote:
+        chave = (r["tipo"], r["categoria"], r["data"].strftime("%Y-%m") if r["data"] else "")
+        saldos[chave][0] += r["valor"]
+        saldos[chave][1] += 1
+
+    with db.atomic():
+        Financa.insert_many([{**r, "usuario": usuario_id} for r in lote]).execute()
+        for (tipo, categoria, mes), (total, qtd) in saldos.items():
+            atualizar_saldo(usuario_id, tipo, categoria, mes, total, quantidade=qtd)
+
+def importar(usuario_id, linhas, lote=LOTE_PADRAO, max_erros=100):
+    """Valida e grava os lançamentos de `linhas` (iterável de dicionários).
+
+    Linhas inválidas são ignoradas e reportadas. Retorna um resumo com a
+    quantidade importada e os erros (número da linha, mensagem).
+    """
+    importados = 0
+    erros = []
+    pendentes = []
+    for numero, campos in enumerate(linhas, start=1):
+        try:
+            pendentes.append(validar_lancamento(campos))
+        except LancamentoInvalido as e:
+            if len(erros) < max_erros:
+                erros.append((numero, str(e)))
+            continue
+
+        if len(pendentes) >= lote:
+            _gravar_lote(usuario_id, pendentes)
+            importados += len(pendentes)
+            pendentes = []
+
+    if pendentes:
+        _gravar_lote(usuario_id, pendentes)
+        importados += len(pendentes)
+
+    # insert_many não devolve os ids: as parcelas são geradas para os lançamentos sem parcelas
+    materializar_pendentes(usuario_id)
+    return {"importados": importados, "erros": erros}
+
+
+# --- Exportação em streaming ---
+def _cursor_servidor(conexao):
+    # No MySQL o cursor padrão traz o resultado inteiro para a memória;
+    # o SSCursor lê do servidor conforme as linhas são consumidas.
+    modulo = type(conexao).__module__
+    if modulo.startswith("pymysql"):
+        from pymysql.cursors import SSCursor
+        return conexao.cursor(SSCursor)
+    if modulo.startswith("MySQLdb"):
+        from MySQLdb.cursors import SSCursor
+        return conexao.cursor(SSCursor)
+    return conexao.cursor()
+
+def _consulta_exportacao(modelo, usuario_id, de, ate):
+    query = (modelo
+             .select(modelo.data, modelo.descricao, modelo.categoria, modelo.tipo,
+                     modelo.valor, modelo.forma_pagamento, modelo.parcelas, modelo.id)
+             .where(modelo.usuario == usuario_id))
+    if de:
+        query = query.where(modelo.data >= de)
+    if ate:
+        query = query.where(modelo.data <= ate)
+    return query
+
+def exportar_csv(usuario_id, de=None, ate=None, tamanho_lote=1000, arquivadas=False):
+    """Gera o CSV dos lançamentos do usuário, linha a linha, sem carregar tudo na memória.
+
+    Com `arquivadas`, os lançamentos do arquivo entram na mesma ordem por data (UNION ALL).
+    """
+    query = _consulta_exportacao(Financa, usuario_id, de, ate)
+    if arquivadas:
+        query = (query + _consulta_exportacao(FinancaArquivada, usuario_id, de, ate)).order_by(
+            SQL("data"), SQL("id"))
+    else:
+        query = query.order_by(Financa.data, Financa.id)
+    sql, params = query.sql()
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+
+    def descarregar():
+        texto = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return texto
+
+    escritor.writerow(COLUNAS_CSV)
+    yield descarregar()
+
+    cursor = _cursor_servidor(db.connection())
+    try:
+        cursor.execute(sql, params)
+        while True:
+            linhas = cursor.fetchmany(tamanho_lote)
+            if not linhas:
+                break
+            for data, descricao, categoria, tipo, valor, forma, parcelas, _ in linhas:
+                escritor.writerow([data or "", descricao or "", categoria or "", tipo,
+                                   f"{Decimal(str(valor)):.2f}", forma or "", parcelas])
+            yield descarregar()
+    finally:
+        cursor.close()
@@ -0,0 +1,204 @@
+"""Instrumentação opcional da aplicação (METRICAS=1).
+
+Mede, por endpoint, a latência das requisições, a quantidade e o tempo das
+consultas ao banco (envolvendo `db.execute_sql` do Peewee) e o tempo de
+renderização dos templates. Tudo é exposto em /metrics no formato texto do
+Prometheus; requisições acima do limiar são registradas no log.
+
+/metrics e as rotas de estatísticas (/api/db/pool, /api/resumo/cache) exigem
+o cabeçalho `Authorization: Bearer <METRICAS_TOKEN>`; sem METRICAS_TOKEN
+configurado elas ficam fechadas.
+"""
+import bisect
+import functools
+import hmac
+import os
+import threading
+import time
+
+from flask import g, has_app_context, request, template_rendered, before_render_template
+
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN", "")
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.contagens = [0] * (len(buckets) + 1)  # último = +Inf
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect.bisect_left(self.buckets, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+def _rotulos(**rotulos):
+    return ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in rotulos.items())
+
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.duracao = {}       # endpoint -> Histograma (segundos)
+        self.requisicoes = {}   # (endpoint, método, status) -> contador
+        self.consultas = {}     # endpoint -> Histograma (consultas por requisição)
+        self.tempo_db = {}      # endpoint -> Histograma (segundos de banco por requisição)
+        self.templates = {}     # template -> Histograma (segundos)
+        self.consultas_fora = 0  # consultas fora de requisições (CLI, threads)
+        self.coletores = []     # funções extras que devolvem linhas no formato texto
+
+    def _hist(self, tabela, chave, buckets):
+        h = tabela.get(chave)
+        if h is None:
+            h = tabela[chave] = Histograma(buckets)
+        return h
+
+    def observar_requisicao(self, endpoint, metodo, status, duracao, consultas, tempo_db):
+        with self._lock:
+            self._hist(self.duracao, endpoint, BUCKETS_SEGUNDOS).observar(duracao)
+            self._hist(self.consultas, endpoint, BUCKETS_CONSULTAS).observar(consultas)
+            self._hist(self.tempo_db, endpoint, BUCKETS_SEGUNDOS).observar(tempo_db)
+            chave = (endpoint, metodo, status)
+            self.requisicoes[chave] = self.requisicoes.get(chave, 0) + 1
+
+    def observar_template(self, nome, duracao):
+        with self._lock:
+            self._hist(self.templates, nome, BUCKETS_SEGUNDOS).observar(duracao)
+
+    def _texto_histograma(self, nome, ajuda, tabela, rotulo):
+        linhas = [f"# HELP {nome} {ajuda}", f"# TYPE {nome} histogram"]
+        for chave, h in sorted(tabela.items()):
+            acumulado = 0
+            for limite, n in zip(h.buckets, h.contagens):
+                acumulado += n
+                linhas.append(f'{nome}_bucket{{{_rotulos(**{rotulo: chave})},le="{limite}"}} {acumulado}')
+            linhas.append(f'{nome}_bucket{{{_rotulos(**{rotulo: chave})},le="+Inf"}} {h.total}')
+            linhas.append(f"{nome}_sum{{{_rotulos(**{rotulo: chave})}}} {h.soma:.6f}")
+            linhas.append(f"{nome}_count{{{_rotulos(**{rotulo: chave})}}} {h.total}")
+        return linhas
+
+    def texto_prometheus(self):
+        with self._lock:
+            linhas = self._texto_histograma(
+                "datefy_http_request_duration_seconds", "Latência das requisições por endpoint.",
+                self.duracao, "endpoint")
+            linhas += ["# HELP datefy_http_requests_total Requisições por endpoint, método e status.",
+                       "# TYPE datefy_http_requests_total counter"]
+            for (endpoint, metodo, status), n in sorted(self.requisicoes.items()):
+                linhas.append(f"datefy_http_requests_total{{{_rotulos(endpoint=endpoint, method=metodo, status=status)}}} {n}")
+            linhas += self._texto_histograma(
+                "datefy_db_queries_per_request", "Consultas ao banco por requisição.",
+                self.consultas, "endpoint")
+            linhas += self._texto_histograma(
+                "datefy_db_time_per_request_seconds", "Tempo gasto no banco por requisição.",
+                self.tempo_db, "endpoint")
+            linhas += self._texto_histograma(
+                "datefy_template_render_seconds", "Tempo de renderização por template.",
+                self.templates, "template")
+            linhas += ["# HELP datefy_db_queries_outside_request_total Consultas fora de requisições.",
+                       "# TYPE datefy_db_queries_outside_request_total counter",
+                       f"datefy_db_queries_outside_request_total {self.consultas_fora}"]
+        for coletor in self.coletores:
+            linhas += coletor()
+        return "\n".join(linhas) + "\n"
+
+
+metricas = Metricas()
+
+
+def _instrumentar_db(db):
+    # Envolve execute_sql da instância: todas as consultas do Peewee passam por ele
+    if getattr(db, "_datefy_instrumentado", False):
+        return
+    original = db.execute_sql
+
+    @functools.wraps(original)
+    def execute_sql(sql, params=None, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return original(sql, params, *args, **kwargs)
+        finally:
+            duracao = time.perf_counter() - inicio
+            if has_app_context() and "metricas_consultas" in g:
+                g.metricas_consultas += 1
+                g.metricas_tempo_db += duracao
+            else:
+                with metricas._lock:
+                    metricas.consultas_fora += 1
+
+    db.execute_sql = execute_sql
+    db._datefy_instrumentado = True
+
+
+def _coletor_pool(db):
+    def coletar():
+        if not hasattr(db, "estatisticas"):
+            return []
+        linhas = []
+        for chave, valor in db.estatisticas().items():
+            if valor is None:
+                continue
+            nome = f"datefy_db_pool_{chave}"
+            linhas += [f"# TYPE {nome} gauge", f"{nome} {valor}"]
+        return linhas
+    return coletar
+
+
+def acesso_operacional():
+    """True se a requisição traz o token das rotas operacionais (comparação em tempo constante)."""
+    if not METRICAS_TOKEN:
+        return False
+    esquema, _, token = request.headers.get("Authorization", "").partition(" ")
+    return esquema.lower() == "bearer" and hmac.compare_digest(token.strip().encode(), METRICAS_TOKEN.encode())
+
+def acesso_negado():
+    return {"error": "Não autorizado"}, 401, {"WWW-Authenticate": "Bearer"}
+
+
+def instalar(app, db, limiar_lento_ms=500):
+    """Liga a instrumentação em `app` e registra a rota /metrics."""
+    _instrumentar_db(db)
+    metricas.coletores = [_coletor_pool(db)]
+
+    @app.before_request
+    def _inicio_requisicao():
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_consultas = 0
+        g.metricas_tempo_db = 0.0
+
+    @app.after_request
+    def _fim_requisicao(response):
+        if "metricas_inicio" not in g:
+            return response
+        duracao = time.perf_counter() - g.metricas_inicio
+        endpoint = request.endpoint or "404"
+        metricas.observar_requisicao(endpoint, request.method, response.status_code, duracao,
+                                     g.metricas_consultas, g.metricas_tempo_db)
+        if duracao * 1000 >= limiar_lento_ms:
+            app.logger.warning("Requisição lenta: %s %s (%s) %.1f ms, %d consulta(s), %.1f ms no banco",
+                               request.method, request.path, endpoint, duracao * 1000,
+                               g.metricas_consultas, g.metricas_tempo_db * 1000)
+        return response
+
+    def _antes_template(sender, template, context, **extra):
+        g.metricas_template_inicio = time.perf_counter()
+
+    def _depois_template(sender, template, context, **extra):
+        inicio = g.pop("metricas_template_inicio", None)
+        if inicio is not None:
+            metricas.observar_template(template.name or "?", time.perf_counter() - inicio)
+
+    before_render_template.connect(_antes_template, app, weak=False)
+    template_rendered.connect(_depois_template, app, weak=False)
+
+    @app.route("/metrics")
+    def metrics():
+        if not acesso_operacional():
+            return acesso_negado()
+        return app.response_class(metricas.texto_prometheus(),
+                                  mimetype="text/plain; version=0.0.4")
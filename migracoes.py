@@ -0,0 +1,317 @@
+"""Migrações de schema do Datefy.
+
+Cada migração é idempotente (verifica o estado atual do banco antes de
+alterar) e fica registrada na tabela `schema_migracoes`. Bancos novos,
+criados por `create_tables()`, já nascem com os tipos e índices corretos;
+as migrações servem para atualizar bancos existentes sem parar a aplicação.
+"""
+import time
+from datetime import datetime
+
+from peewee import Model, CharField, DateTimeField, MySQLDatabase
+
+
+class SchemaMigracao(Model):
+    nome = CharField(unique=True)
+    aplicada_em = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = 'schema_migracoes'
+
+
+# --- Utilitários ---
+def _eh_mysql(db):
+    return isinstance(db, MySQLDatabase)
+
+def _tipo_coluna(db, tabela, coluna):
+    for c in db.get_columns(tabela):
+        if c.name == coluna:
+            return c.data_type.lower()
+    return None
+
+def _tem_indice(db, tabela, nome):
+    return _colunas_indice(db, tabela, nome) is not None
+
+def _colunas_indice(db, tabela, nome):
+    """Colunas do índice, em ordem, ou None se ele não existe."""
+    for i in db.get_indexes(tabela):
+        if i.name == nome:
+            return list(i.columns)
+    return None
+
+def _indices_da_coluna(db, tabela, coluna):
+    """(nome, colunas) dos índices secundários que incluem `coluna`."""
+    return [(i.name, list(i.columns)) for i in db.get_indexes(tabela)
+            if coluna in i.columns and i.name != 'PRIMARY' and not i.unique]
+
+def _criar_indice(db, tabela, nome, colunas, log):
+    """Cria o índice; se já existe com outras colunas, recria (só o nome não basta)."""
+    atuais = _colunas_indice(db, tabela, nome)
+    if atuais == list(colunas):
+        log(f"  índice {nome} já existe")
+        return
+    cols = ", ".join(f"`{c}`" for c in colunas)
+    if atuais is not None:
+        log(f"  índice {nome} cobre {atuais}, esperado {list(colunas)}: recriando")
+        if _eh_mysql(db):
+            # Troca na mesma instrução: a tabela não fica sem o índice no meio
+            db.execute_sql(f"ALTER TABLE `{tabela}` DROP INDEX `{nome}`, ADD INDEX `{nome}` ({cols}), "
+                           "ALGORITHM=INPLACE, LOCK=NONE")
+        else:
+            db.execute_sql(f"DROP INDEX `{nome}`")
+            db.execute_sql(f"CREATE INDEX `{nome}` ON `{tabela}` ({cols})")
+    else:
+        sql = f"CREATE INDEX `{nome}` ON `{tabela}` ({cols})"
+        if _eh_mysql(db):
+            # InnoDB cria índices secundários sem bloquear escritas
+            sql += " ALGORITHM=INPLACE LOCK=NONE"
+        db.execute_sql(sql)
+    if _colunas_indice(db, tabela, nome) != list(colunas):
+        raise RuntimeError(f"índice {tabela}.{nome} não ficou com as colunas {list(colunas)}")
+    log(f"  índice {nome} {'recriado' if atuais is not None else 'criado'}")
+
+def _adicionar_coluna(db, tabela, coluna, definicao, log):
+    if _tipo_coluna(db, tabela, coluna) is not None:
+        log(f"  {tabela}.{coluna} já existe")
+        return
+    db.execute_sql(f"ALTER TABLE `{tabela}` ADD COLUMN `{coluna}` {definicao}")
+    log(f"  {tabela}.{coluna} criada")
+
+def _converter_coluna(db, tabela, coluna, tipo_novo, expressao, nulo, log, lote=1000):
+    """Troca o tipo de uma coluna sem bloquear a tabela durante o backfill.
+
+    1. cria `<coluna>_nova` com o tipo novo;
+    2. triggers mantêm a coluna nova em dia com inserts/updates concorrentes;
+    3. backfill em lotes por faixa de id;
+    4. com a tabela travada por poucos milissegundos: recupera o atraso,
+       remove os triggers e troca os nomes das colunas;
+    5. remove a coluna antiga.
+
+    `expressao` é o SQL que converte `{col}` (valor antigo) para o tipo novo.
+    Os índices secundários que cobriam a coluna acompanham o RENAME e perdem
+    a coluna no DROP; por isso são recriados no fim sobre a coluna nova.
+    """
+    nova = f"{coluna}_nova"
+    antiga = f"{coluna}_antiga"
+    indices = _indices_da_coluna(db, tabela, coluna)
+    trg_ins = f"trg_{tabela}_{coluna}_ins"
+    trg_upd = f"trg_{tabela}_{coluna}_upd"
+    conv_new = expressao.format(col=f"NEW.`{coluna}`")
+    conv_row = expressao.format(col=f"`{coluna}`")
+
+    if _tipo_coluna(db, tabela, nova) is None:
+        db.execute_sql(f"ALTER TABLE `{tabela}` ADD COLUMN `{nova}` {tipo_novo} NULL")
+
+    db.execute_sql(f"DROP TRIGGER IF EXISTS `{trg_ins}`")
+    db.execute_sql(f"DROP TRIGGER IF EXISTS `{trg_upd}`")
+    db.execute_sql(f"CREATE TRIGGER `{trg_ins}` BEFORE INSERT ON `{tabela}` "
+                   f"FOR EACH ROW SET NEW.`{nova}` = {conv_new}")
+    db.execute_sql(f"CREATE TRIGGER `{trg_upd}` BEFORE UPDATE ON `{tabela}` "
+                   f"FOR EACH ROW SET NEW.`{nova}` = {conv_new}")
+
+    # Backfill em lotes curtos (cada lote é uma transação pequena)
+    max_id = db.execute_sql(f"SELECT COALESCE(MAX(id), 0) FROM `{tabela}`").fetchone()[0]
+    inicio = 0
+    while inicio <= max_id:
+        fim = inicio + lote
+        with db.atomic():
+            db.execute_sql(f"UPDATE `{tabela}` SET `{nova}` = {conv_row} "
+                           f"WHERE id >= %s AND id < %s", (inicio, fim))
+        inicio = fim
+        time.sleep(0.01)  # dá espaço para as escritas da aplicação
+    log(f"  {tabela}.{coluna}: backfill concluído até id {max_id}")
+
+    # Valores antigos que não puderam ser convertidos
+    invalidos = db.execute_sql(
+        f"SELECT id, `{coluna}` FROM `{tabela}` WHERE `{nova}` IS NULL "
+        f"AND `{coluna}` IS NOT NULL AND `{coluna}` <> '' LIMIT 20").fetchall()
+    if invalidos:
+        raise RuntimeError(
+            f"{tabela}.{coluna}: valores que não puderam ser convertidos (id, valor): {invalidos}. "
+            "Corrija esses registros e rode a migração novamente.")
+
+    db.execute_sql(f"LOCK TABLES `{tabela}` WRITE")
+    try:
+        db.execute_sql(f"UPDATE `{tabela}` SET `{nova}` = {conv_row} WHERE `{nova}` IS NULL")
+        db.execute_sql(f"DROP TRIGGER IF EXISTS `{trg_ins}`")
+        db.execute_sql(f"DROP TRIGGER IF EXISTS `{trg_upd}`")
+        db.execute_sql(f"ALTER TABLE `{tabela}` RENAME COLUMN `{coluna}` TO `{antiga}`, "
+                       f"RENAME COLUMN `{nova}` TO `{coluna}`")
+    finally:
+        db.execute_sql("UNLOCK TABLES")
+
+    db.execute_sql(f"ALTER TABLE `{tabela}` DROP COLUMN `{antiga}`, ALGORITHM=INPLACE, LOCK=NONE")
+    if not nulo:
+        db.execute_sql(f"ALTER TABLE `{tabela}` MODIFY `{coluna}` {tipo_novo} NOT NULL, "
+                       "ALGORITHM=INPLACE, LOCK=NONE")
+    for nome, colunas in indices:
+        _criar_indice(db, tabela, nome, colunas, log)
+    log(f"  {tabela}.{coluna} convertida para {tipo_novo}")
+
+
+# --- Migrações ---
+def m001_indices_compostos(db, log, lote):
+    _criar_indice(db, 'tarefas', 'tarefa_user_id_status_data', ['user_id', 'status', 'data'], log)
+    _criar_indice(db, 'financas', 'financa_usuario_id_tipo_data', ['usuario_id', 'tipo', 'data'], log)
+    _criar_indice(db, 'financas', 'financa_usuario_id_categoria_tipo', ['usuario_id', 'categoria', 'tipo'], log)
+
+def m002_tipos_nativos(db, log, lote):
+    data_str = "STR_TO_DATE(NULLIF({col}, ''), '%%Y-%%m-%%d')"
+    conversoes = [
+        ('tarefas', 'data', 'date', 'DATE', data_str, False),
+        ('financas', 'data', 'date', 'DATE', data_str, True),
+        ('financas', 'valor', 'decimal', 'DECIMAL(12,2)', "ROUND({col}, 2)", False),
+    ]
+    for tabela, coluna, tipo, tipo_sql, expressao, nulo in conversoes:
+        if (_tipo_coluna(db, tabela, coluna) or '').startswith(tipo):
+            log(f"  {tabela}.{coluna} já é {tipo_sql}")
+            continue
+        if not _eh_mysql(db):
+            raise RuntimeError(f"Conversão de {tabela}.{coluna} só é suportada no MySQL.")
+        _converter_coluna(db, tabela, coluna, tipo_sql, expressao, nulo, log, lote)
+
+def m003_indices_listagem(db, log, lote):
+    # Paginação keyset em (data, id): o InnoDB já inclui o id (PK) no índice
+    _criar_indice(db, 'tarefas', 'tarefa_user_id_data', ['user_id', 'data'], log)
+    _criar_indice(db, 'financas', 'financa_usuario_id_data', ['usuario_id', 'data'], log)
+
+def m004_versao_tarefas(db, log, lote):
+    # ETag/Last-Modified de /api/tarefas
+    _adicionar_coluna(db, 'usuarios', 'tarefas_versao', "INTEGER NOT NULL DEFAULT 0", log)
+    _adicionar_coluna(db, 'usuarios', 'tarefas_alterado_em', "DATETIME NULL", log)
+
+def m005_ocorrencias_parcelas(db, log, lote):
+    # Tabela de parcelas materializadas + preenchimento a partir de `financas`
+    from modelos import Financa, FinancaOcorrencia
+    import parcelamento
+    with db.bind_ctx([Financa, FinancaOcorrencia]):
+        db.create_tables([FinancaOcorrencia], safe=True)
+        log(f"  {parcelamento.materializar_pendentes(lote=lote)} lançamento(s) parcelado(s) expandido(s)")
+
+def m006_indices_busca(db, log, lote):
+    from modelos import criar_indices_fulltext
+    _criar_indice(db, 'tarefas', 'tarefa_user_id_categoria_data', ['user_id', 'categoria', 'data'], log)
+    if not _eh_mysql(db):
+        log("  índices FULLTEXT ignorados (só MySQL; a busca usa LIKE)")
+        return
+    # O primeiro FULLTEXT de uma tabela InnoDB a reconstrói (coluna FTS_DOC_ID):
+    # rodar fora do horário de pico em tabelas grandes.
+    for nome in criar_indices_fulltext(db):
+        log(f"  índice {nome} criado")
+
+def m007_notificacoes(db, log, lote):
+    from modelos import Notificacao
+    _adicionar_coluna(db, 'usuarios', 'notif_email', "BOOLEAN NOT NULL DEFAULT 1", log)
+    _adicionar_coluna(db, 'usuarios', 'notif_push', "BOOLEAN NOT NULL DEFAULT 0", log)
+    _adicionar_coluna(db, 'usuarios', 'notif_relatorio', "BOOLEAN NOT NULL DEFAULT 0", log)
+    # Consultas por dia (todas as contas) do agendador de notificações
+    _criar_indice(db, 'tarefas', 'tarefa_data_status', ['data', 'status'], log)
+    _criar_indice(db, 'financas', 'financa_data_tipo', ['data', 'tipo'], log)
+    _criar_indice(db, 'financas_ocorrencias', 'financaocorrencia_data_tipo', ['data', 'tipo'], log)
+    with db.bind_ctx([Notificacao]):
+        db.create_tables([Notificacao], safe=True)
+    log("  tabela notificacoes pronta")
+
+def m008_arquivo(db, log, lote):
+    from modelos import TarefaArquivada, FinancaArquivada, criar_indices_fulltext
+    with db.bind_ctx([TarefaArquivada, FinancaArquivada]):
+        db.create_tables([TarefaArquivada, FinancaArquivada], safe=True)
+    log("  tabelas tarefas_arquivo e financas_arquivo prontas")
+    if _eh_mysql(db):
+        for nome in criar_indices_fulltext(db):
+            log(f"  índice {nome} criado")
+
+def m009_anexos(db, log, lote):
+    from modelos import Arquivo, Anexo
+    with db.bind_ctx([Arquivo, Anexo]):
+        db.create_tables([Arquivo, Anexo], safe=True)
+    log("  tabelas arquivos e anexos prontas")
+
+def m010_compartilhamento(db, log, lote):
+    from modelos import Compartilhamento, FeedCompartilhado, criar_indices_fulltext
+    with db.bind_ctx([Compartilhamento, FeedCompartilhado]):
+        db.create_tables([Compartilhamento, FeedCompartilhado], safe=True)
+    log("  tabelas compartilhamentos e feed_compartilhado prontas")
+    if _eh_mysql(db):
+        for nome in criar_indices_fulltext(db):
+            log(f"  índice {nome} criado")
+
+def m011_categoria_livro(db, log, lote):
+    # financas.categoria é VARCHAR(255) e aceita texto livre (formulário e importação):
+    # com 50 o livro e as parcelas recusavam categorias longas no modo estrito do MySQL
+    if not _eh_mysql(db):
+        log("  ignorada (o SQLite não limita o tamanho de VARCHAR)")
+        return
+    db.execute_sql("ALTER TABLE `financas_saldos` MODIFY `categoria` VARCHAR(255) NOT NULL DEFAULT ''")
+    db.execute_sql("ALTER TABLE `financas_ocorrencias` MODIFY `categoria` VARCHAR(255) NULL")
+    log("  financas_saldos.categoria e financas_ocorrencias.categoria com 255 caracteres")
+
+def m012_indices_data(db, log, lote):
+    # Bancos que passaram pela 002 antes da correção ficaram com os índices
+    # compostos sem `data` (a coluna antiga saiu deles no DROP): recria os que divergem
+    for tabela, nome, colunas in INDICES_DATA:
+        _criar_indice(db, tabela, nome, colunas, log)
+
+def m013_saldos_mensais(db, log, lote):
+    # O dashboard e /financas/data leem só o livro: sem preenchê-lo a partir de
+    # `financas` (e do arquivo), usuários existentes veriam totais zerados
+    from modelos import Financa, FinancaArquivada, SaldoMensal
+    from saldos import reconstruir_saldos
+    with db.bind_ctx([Financa, FinancaArquivada, SaldoMensal]):
+        db.create_tables([SaldoMensal], safe=True)
+        log(f"  {reconstruir_saldos()} linha(s) de saldo gravada(s)")
+
+
+# Índices (das migrações acima) que terminam ou começam em `data`
+INDICES_DATA = [
+    ('tarefas', 'tarefa_user_id_status_data', ['user_id', 'status', 'data']),
+    ('financas', 'financa_usuario_id_tipo_data', ['usuario_id', 'tipo', 'data']),
+    ('tarefas', 'tarefa_user_id_data', ['user_id', 'data']),
+    ('financas', 'financa_usuario_id_data', ['usuario_id', 'data']),
+    ('tarefas', 'tarefa_user_id_categoria_data', ['user_id', 'categoria', 'data']),
+    ('tarefas', 'tarefa_data_status', ['data', 'status']),
+    ('financas', 'financa_data_tipo', ['data', 'tipo']),
+]
+
+
+MIGRACOES = [
+    ('001_indices_compostos', m001_indices_compostos),
+    ('002_tipos_nativos', m002_tipos_nativos),
+    ('003_indices_listagem', m003_indices_listagem),
+    ('004_versao_tarefas', m004_versao_tarefas),
+    ('005_ocorrencias_parcelas', m005_ocorrencias_parcelas),
+    ('006_indices_busca', m006_indices_busca),
+    ('007_notificacoes', m007_notificacoes),
+    ('008_arquivo', m008_arquivo),
+    ('009_anexos', m009_anexos),
+    ('010_compartilhamento', m010_compartilhamento),
+    ('011_categoria_livro', m011_categoria_livro),
+    ('012_indices_data', m012_indices_data),
+    ('013_saldos_mensais', m013_saldos_mensais),
+]
+
+
+def aplicar_migracoes(db, log=print, lote=1000):
+    """Aplica, em ordem, as migrações que ainda não foram registradas."""
+    with db.bind_ctx([SchemaMigracao]):
+        db.create_tables([SchemaMigracao], safe=True)
+        aplicadas = {m.nome for m in SchemaMigracao.select()}
+
+        executadas = []
+        for nome, funcao in MIGRACOES:
+            if nome in aplicadas:
+                continue
+            log(f"Aplicando {nome}...")
+            funcao(db, log, lote)
+            SchemaMigracao.create(nome=nome)
+            executadas.append(nome)
+        return executadas
+
+
+def explicar(db, query):
+    """Roda EXPLAIN para uma query Peewee e devolve as linhas como dicionários."""
+    sql, params = query.sql()
+    prefixo = "EXPLAIN " if _eh_mysql(db) else "EXPLAIN QUERY PLAN "
+    cursor = db.execute_sql(prefixo + sql, params)
+    colunas = [c[0] for c in cursor.description]
+    return [dict(zip(colunas, linha)) for linha in cursor.fetchall()]
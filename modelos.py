@@ -0,0 +1,416 @@
+import os
+from datetime import datetime
+
+from peewee import *
+
+from pool_mysql import PooledMySQLMonitorado
+from replicas import RoteadorLeitura, com_fallback, atraso_mysql, sem_atraso
+
+# ---------------- CONFIGURAÇÕES DO MYSQL COM PEEWEE ----------------
+MYSQL_HOST = os.getenv("MYSQL_HOST", "datefy_mysql")
+MYSQL_USER = os.getenv("MYSQL_USER", "datefy_user")
+MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "senac")
+MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "datefy_db")
+MYSQL_PORT = int(os.getenv("MYSQL_PORT", "3306"))
+
+# Pool de conexões (MYSQL_POOL=0 volta a abrir uma conexão por requisição)
+MYSQL_POOL = os.getenv("MYSQL_POOL", "1") == "1"
+MYSQL_POOL_MAX = int(os.getenv("MYSQL_POOL_MAX", "10"))
+MYSQL_POOL_STALE_TIMEOUT = int(os.getenv("MYSQL_POOL_STALE_TIMEOUT", "300"))
+MYSQL_POOL_WAIT_TIMEOUT = int(os.getenv("MYSQL_POOL_WAIT_TIMEOUT", "10"))
+
+# SQLITE_PATH usa um arquivo SQLite no lugar do MySQL (desenvolvimento e benchmarks locais)
+SQLITE_PATH = os.getenv("SQLITE_PATH")
+
+# Configuração do banco de dados Peewee (MySQL)
+if SQLITE_PATH:
+    db = SqliteDatabase(SQLITE_PATH, pragmas={
+        "journal_mode": "wal",
+        "foreign_keys": 1,
+        "busy_timeout": 5000,
+        "synchronous": "normal",
+    })
+elif MYSQL_POOL:
+    db = PooledMySQLMonitorado(
+        MYSQL_DATABASE,
+        max_connections=MYSQL_POOL_MAX,
+        stale_timeout=MYSQL_POOL_STALE_TIMEOUT,
+        timeout=MYSQL_POOL_WAIT_TIMEOUT,
+        user=MYSQL_USER,
+        password=MYSQL_PASSWORD,
+        host=MYSQL_HOST,
+        port=MYSQL_PORT,
+        ssl=False,
+        connect_timeout=5,
+    )
+else:
+    db = MySQLDatabase(
+        MYSQL_DATABASE,
+        user=MYSQL_USER,
+        password=MYSQL_PASSWORD,
+        host=MYSQL_HOST,
+        port=MYSQL_PORT,
+        ssl=False,
+        connect_timeout=5,
+    )
+
+# Réplicas de leitura: MYSQL_REPLICAS=host1[:porta],host2[:porta] (mesmo usuário/senha/banco).
+# Em desenvolvimento, SQLITE_REPLICAS=arquivo1,arquivo2 (cópias do arquivo de SQLITE_PATH).
+MYSQL_REPLICAS = [h.strip() for h in os.getenv("MYSQL_REPLICAS", "").split(",") if h.strip()]
+SQLITE_REPLICAS = [a.strip() for a in os.getenv("SQLITE_REPLICAS", "").split(",") if a.strip()]
+
+if SQLITE_PATH:
+    replicas = [com_fallback(SqliteDatabase)(arquivo, pragmas={"busy_timeout": 5000})
+                for arquivo in SQLITE_REPLICAS]
+    roteador = RoteadorLeitura(db, replicas, medir_atraso=sem_atraso)
+else:
+    replicas = []
+    for endereco in MYSQL_REPLICAS:
+        host, _, porta = endereco.partition(":")
+        replicas.append(com_fallback(PooledMySQLMonitorado)(
+            MYSQL_DATABASE,
+            max_connections=MYSQL_POOL_MAX,
+            stale_timeout=MYSQL_POOL_STALE_TIMEOUT,
+            timeout=MYSQL_POOL_WAIT_TIMEOUT,
+            user=MYSQL_USER,
+            password=MYSQL_PASSWORD,
+            host=host,
+            port=int(porta or MYSQL_PORT),
+            ssl=False,
+            connect_timeout=2,
+        ))
+    roteador = RoteadorLeitura(db, replicas, medir_atraso=atraso_mysql)
+
+# --- Definição dos Modelos (Mapeamento ORM) ---
+class BaseModel(Model):
+    class Meta:
+        database = db
+
+    # Escritas sempre vão para o primário; marcá-las faz o resto da requisição
+    # (e da sessão, até as réplicas alcançarem) ler do primário também.
+    @classmethod
+    def insert(cls, *args, **kwargs):
+        roteador.marcar_escrita()
+        return super().insert(*args, **kwargs)
+
+    @classmethod
+    def insert_many(cls, *args, **kwargs):
+        roteador.marcar_escrita()
+        return super().insert_many(*args, **kwargs)
+
+    @classmethod
+    def insert_from(cls, *args, **kwargs):
+        roteador.marcar_escrita()
+        return super().insert_from(*args, **kwargs)
+
+    @classmethod
+    def replace(cls, *args, **kwargs):
+        roteador.marcar_escrita()
+        return super().replace(*args, **kwargs)
+
+    @classmethod
+    def replace_many(cls, *args, **kwargs):
+        roteador.marcar_escrita()
+        return super().replace_many(*args, **kwargs)
+
+    @classmethod
+    def update(cls, *args, **kwargs):
+        roteador.marcar_escrita()
+        return super().update(*args, **kwargs)
+
+    @classmethod
+    def delete(cls):
+        roteador.marcar_escrita()
+        return super().delete()
+
+class LeituraEmReplica:
+    """Modelos cujos SELECTs, dentro de uma requisição, podem ir para uma réplica."""
+
+    @classmethod
+    def select(cls, *fields):
+        query = super().select(*fields)
+        banco = roteador.banco_leitura()
+        return query if banco is None else query.bind(banco)
+
+class Usuario(LeituraEmReplica, BaseModel):
+    nome = CharField()
+    email = CharField(unique=True)
+    senha_hash = CharField()
+    # Versão das tarefas do usuário: incrementada a cada alteração, usada no ETag do calendário
+    tarefas_versao = IntegerField(default=0)
+    tarefas_alterado_em = DateTimeField(null=True)
+    # Preferências de notificação (perfil > Notificações)
+    notif_email = BooleanField(default=True)
+    notif_push = BooleanField(default=False)
+    notif_relatorio = BooleanField(default=False)
+
+    class Meta:
+        table_name = 'usuarios'
+
+class Tarefa(LeituraEmReplica, BaseModel):
+    user = ForeignKeyField(Usuario, backref='tarefas', column_name='user_id')
+    titulo = CharField()
+    descricao = TextField(null=True)
+    data = DateField()
+    categoria = CharField(null=True)
+    status = IntegerField(default=0)  # 0: pendente, 1: concluída
+
+    class Meta:
+        table_name = 'tarefas'
+        indexes = (
+            (('user', 'status', 'data'), False),
+            (('user', 'data'), False),
+            (('user', 'categoria', 'data'), False),
+            (('data', 'status'), False),  # tarefas do dia de todos os usuários (notificações)
+        )
+
+class Financa(LeituraEmReplica, BaseModel):
+    usuario = ForeignKeyField(Usuario, backref='financas', column_name='usuario_id')
+    descricao = CharField(null=True)
+    categoria = CharField(null=True)
+    tipo = CharField(max_length=10)  # 'entrada' ou 'saida'
+    valor = DecimalField(max_digits=12, decimal_places=2)
+    forma_pagamento = CharField(null=True)
+    parcelas = IntegerField(default=1)
+    data = DateField(null=True)
+
+    class Meta:
+        table_name = 'financas'
+        indexes = (
+            (('usuario', 'tipo', 'data'), False),
+            (('usuario', 'categoria', 'tipo'), False),
+            (('usuario', 'data'), False),
+            (('data', 'tipo'), False),  # vencimentos do dia (notificações)
+        )
+
+class SaldoMensal(LeituraEmReplica, BaseModel):
+    """Totais pré-calculados de `financas` por usuário / tipo / categoria / mês.
+
+    Atualizado junto com cada inserção ou exclusão em `Financa`, para que o
+    dashboard e /financas/data não precisem somar o histórico inteiro.
+    """
+    usuario = ForeignKeyField(Usuario, backref='saldos', column_name='usuario_id', on_delete='CASCADE')
+    tipo = CharField(max_length=10)
+    categoria = CharField(default='')  # '' quando sem categoria; mesmo tamanho de financas.categoria
+    mes = CharField(max_length=7, default='')  # YYYY-MM ('' quando sem data)
+    total = DecimalField(max_digits=14, decimal_places=2, default=0)
+    quantidade = IntegerField(default=0)
+
+    class Meta:
+        table_name = 'financas_saldos'
+        indexes = (
+            (('usuario', 'tipo', 'categoria', 'mes'), True),
+        )
+
+class FinancaOcorrencia(LeituraEmReplica, BaseModel):
+    """Parcelas materializadas dos lançamentos parcelados (uma linha por mês).
+
+    Regeneradas por lançamento (parcelamento.regenerar) quando ele é criado ou
+    alterado; alimentam a projeção de fluxo de caixa e o calendário financeiro.
+    """
+    financa = ForeignKeyField(Financa, backref='ocorrencias', column_name='financa_id', on_delete='CASCADE')
+    usuario = ForeignKeyField(Usuario, column_name='usuario_id', on_delete='CASCADE')
+    tipo = CharField(max_length=10)
+    categoria = CharField(null=True)
+    numero = IntegerField()  # 1..parcelas
+    data = DateField()
+    mes = CharField(max_length=7)  # YYYY-MM (agrupamento da projeção)
+    valor = DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        table_name = 'financas_ocorrencias'
+        indexes = (
+            (('usuario', 'data'), False),
+            (('usuario', 'mes', 'tipo'), False),
+            (('data', 'tipo'), False),  # vencimentos do dia (notificações)
+        )
+
+class TarefaArquivada(LeituraEmReplica, BaseModel):
+    """Tarefas concluídas há mais de ARQUIVO_TAREFAS_DIAS, fora da tabela quente.
+
+    Mesmas colunas de `Tarefa` (o id é preservado) mais o instante do
+    arquivamento; movidas em lotes por arquivamento.arquivar_tarefas.
+    """
+    id = IntegerField(primary_key=True)
+    user = ForeignKeyField(Usuario, backref='+', column_name='user_id', on_delete='CASCADE')
+    titulo = CharField()
+    descricao = TextField(null=True)
+    data = DateField()
+    categoria = CharField(null=True)
+    status = IntegerField(default=1)
+    arquivada_em = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = 'tarefas_arquivo'
+        indexes = (
+            (('user', 'data'), False),
+            (('user', 'categoria', 'data'), False),
+        )
+
+class FinancaArquivada(LeituraEmReplica, BaseModel):
+    """Lançamentos antigos (e já sem parcelas a vencer), fora da tabela quente.
+
+    Continuam somados em `financas_saldos`: arquivar não muda totais nem relatórios.
+    """
+    id = IntegerField(primary_key=True)
+    usuario = ForeignKeyField(Usuario, backref='+', column_name='usuario_id', on_delete='CASCADE')
+    descricao = CharField(null=True)
+    categoria = CharField(null=True)
+    tipo = CharField(max_length=10)
+    valor = DecimalField(max_digits=12, decimal_places=2)
+    forma_pagamento = CharField(null=True)
+    parcelas = IntegerField(default=1)
+    data = DateField(null=True)
+    arquivada_em = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = 'financas_arquivo'
+        indexes = (
+            (('usuario', 'data'), False),
+            (('usuario', 'tipo', 'data'), False),
+        )
+
+class Arquivo(BaseModel):
+    """Conteúdo de um anexo, guardado uma única vez por SHA-256 (ver anexos.py)."""
+    hash = CharField(max_length=64, primary_key=True)
+    tamanho = BigIntegerField()
+    tipo = CharField(max_length=100)  # content-type detectado pelo conteúdo
+    criado_em = DateTimeField(default=datetime.now)  # renovado a cada novo anexo (coleta de órfãos)
+
+    class Meta:
+        table_name = 'arquivos'
+
+class Anexo(LeituraEmReplica, BaseModel):
+    """Documento ou comprovante ligado a uma tarefa ou a um lançamento.
+
+    tarefa_id / financa_id não são chaves estrangeiras: o item pode estar na
+    tabela quente ou no arquivo (os ids são preservados ao arquivar).
+    """
+    usuario = ForeignKeyField(Usuario, backref='anexos', column_name='usuario_id', on_delete='CASCADE')
+    tarefa_id = IntegerField(null=True)
+    financa_id = IntegerField(null=True)
+    arquivo = ForeignKeyField(Arquivo, backref='anexos', column_name='arquivo_hash')
+    nome = CharField()
+    tamanho = BigIntegerField()  # cópia de arquivo.tamanho: a cota soma só esta tabela
+    criado_em = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = 'anexos'
+        indexes = (
+            (('usuario', 'tarefa_id'), False),
+            (('usuario', 'financa_id'), False),
+        )
+
+class Compartilhamento(BaseModel):
+    """Tarefa (lembrete) compartilhada pelo dono com outro usuário, só para visualização (RF15/R9).
+
+    Como em `Anexo`, tarefa_id não é chave estrangeira: a tarefa pode estar no arquivo.
+    """
+    tarefa_id = IntegerField()
+    dono = ForeignKeyField(Usuario, backref='+', column_name='dono_id', on_delete='CASCADE')
+    destinatario = ForeignKeyField(Usuario, backref='+', column_name='destinatario_id', on_delete='CASCADE')
+    criado_em = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = 'compartilhamentos'
+        indexes = (
+            (('tarefa_id', 'destinatario'), True),
+            (('dono', 'tarefa_id'), False),
+        )
+
+class FeedCompartilhado(LeituraEmReplica, BaseModel):
+    """Cópia materializada, por destinatário, das tarefas compartilhadas com ele.
+
+    Escrita no compartilhamento e em cada alteração da tarefa (compartilhamento.py);
+    o calendário e a listagem do destinatário leem só esta tabela, por faixa
+    de (destinatario, status, data) ou (destinatario, data), sem junções.
+    """
+    destinatario = ForeignKeyField(Usuario, backref='+', column_name='destinatario_id', on_delete='CASCADE')
+    tarefa_id = IntegerField()
+    dono = ForeignKeyField(Usuario, backref='+', column_name='dono_id', on_delete='CASCADE')
+    dono_nome = CharField()
+    titulo = CharField()
+    descricao = TextField(null=True)
+    data = DateField()
+    categoria = CharField(null=True)
+    status = IntegerField(default=0)
+    atualizado_em = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = 'feed_compartilhado'
+        indexes = (
+            (('destinatario', 'tarefa_id'), True),
+            (('destinatario', 'status', 'data'), False),
+            (('destinatario', 'data', 'tarefa_id'), False),
+            (('tarefa_id',), False),
+        )
+
+class Notificacao(BaseModel):
+    """Notificações planejadas e seu estado de entrega.
+
+    A chave única (usuario, tipo, referencia) garante que o mesmo aviso
+    (ex: "tarefa:12:2026-10-20") nunca seja planejado, e portanto enviado, duas vezes.
+    """
+    usuario = ForeignKeyField(Usuario, column_name='usuario_id', on_delete='CASCADE')
+    tipo = CharField(max_length=20)  # 'tarefa', 'pagamento' ou 'relatorio'
+    referencia = CharField(max_length=100)
+    descricao = CharField(null=True)
+    data_evento = DateField(null=True)
+    estado = CharField(max_length=10, default='pendente')  # pendente, enviando, enviada, falhou
+    lote = CharField(max_length=32, null=True)
+    erro = TextField(null=True)
+    criada_em = DateTimeField(default=datetime.now)
+    atualizada_em = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = 'notificacoes'
+        indexes = (
+            (('usuario', 'tipo', 'referencia'), True),
+            (('estado', 'id'), False),
+        )
+
+class EmailFalho(BaseModel):
+    """E-mails que a fila de envio desistiu de entregar (dead letter)."""
+    destinatario = CharField()
+    assunto = CharField(null=True)
+    mensagem = TextField()
+    tentativas = IntegerField()
+    erro = TextField(null=True)
+    criado_em = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = 'emails_falhos'
+
+# Todos os modelos da aplicação (ordem respeita as chaves estrangeiras)
+MODELOS = [Usuario, Tarefa, Financa, SaldoMensal, FinancaOcorrencia, TarefaArquivada, FinancaArquivada,
+           Arquivo, Anexo, Compartilhamento, FeedCompartilhado, Notificacao, EmailFalho]
+
+# Índices FULLTEXT da busca (só MySQL; o Peewee não os declara em Meta.indexes)
+INDICES_FULLTEXT = [
+    ('tarefas', 'tarefa_ft_titulo_descricao', ['titulo', 'descricao']),
+    ('financas', 'financa_ft_descricao', ['descricao']),
+    ('tarefas_arquivo', 'tarefaarquivada_ft_titulo_descricao', ['titulo', 'descricao']),
+    ('financas_arquivo', 'financaarquivada_ft_descricao', ['descricao']),
+    ('feed_compartilhado', 'feedcompartilhado_ft_titulo_descricao', ['titulo', 'descricao']),
+]
+
+def criar_indices_fulltext(database=None):
+    """Cria os índices FULLTEXT que faltam; retorna os nomes criados."""
+    database = database or db
+    if not isinstance(database, MySQLDatabase):
+        return []
+    criados = []
+    for tabela, nome, colunas in INDICES_FULLTEXT:
+        if not database.table_exists(tabela):
+            continue  # criada por uma migração posterior
+        if any(i.name == nome for i in database.get_indexes(tabela)):
+            continue
+        cols = ", ".join(f"`{c}`" for c in colunas)
+        database.execute_sql(f"CREATE FULLTEXT INDEX `{nome}` ON `{tabela}` ({cols})")
+        criados.append(nome)
+    return criados
+
+def create_tables():
+    with db:
+        db.create_tables(MODELOS, safe=True)
+        criar_indices_fulltext()
@@ -0,0 +1,242 @@
+"""Agendador de notificações (tarefas do dia, vencimentos e relatório mensal).
+
+Roda como processo próprio (`flask notificacoes`), em ciclos:
+
+1. planejar: para cada dia da janela (hoje .. hoje + antecedência) busca as
+   tarefas pendentes e os pagamentos (lançamentos e parcelas) que vencem
+   naquele dia, pelos índices (data, status) / (data, tipo), sem percorrer
+   os usuários, e grava uma `Notificacao` por item com INSERT IGNORE: a
+   chave única (usuario, tipo, referencia) impede avisos repetidos;
+2. despachar: reserva um lote de notificações pendentes (estado 'enviando'),
+   agrupa por usuário (um e-mail com todos os avisos do ciclo) e entrega
+   pela fila de e-mails respeitando um limite de envios por segundo; a fila
+   marca cada grupo como 'enviada' ou 'falhou'.
+
+No início de cada mês o resumo do mês anterior entra como notificação
+'relatorio' para quem ativou o relatório mensal.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from email.message import EmailMessage
+
+from modelos import db, Usuario, Tarefa, Financa, FinancaOcorrencia, Notificacao
+from parcelamento import A_VISTA
+from relatorios import relatorio_periodo
+
+logger = logging.getLogger("datefy.notificacoes")
+
+LOTE_INSERCAO = 500
+
+
+class LimiteTaxa:
+    """Token bucket: no máximo `por_segundo` envios por segundo, com rajadas de até `rajada`."""
+
+    def __init__(self, por_segundo, rajada=None):
+        self.por_segundo = float(por_segundo)
+        self.rajada = float(rajada or max(1.0, por_segundo))
+        self._fichas = self.rajada
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def aguardar(self):
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._fichas = min(self.rajada, self._fichas + (agora - self._ultimo) * self.por_segundo)
+                self._ultimo = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) / self.por_segundo
+            time.sleep(espera)
+
+
+# --- Planejamento ---
+def _gravar(linhas):
+    """INSERT IGNORE em lotes; retorna quantas linhas foram oferecidas."""
+    total = 0
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= LOTE_INSERCAO:
+            Notificacao.insert_many(lote).on_conflict_ignore().execute()
+            total += len(lote)
+            lote = []
+    if lote:
+        Notificacao.insert_many(lote).on_conflict_ignore().execute()
+        total += len(lote)
+    return total
+
+def _tarefas_do_dia(dia):
+    query = (Tarefa
+             .select(Tarefa.id, Tarefa.user, Tarefa.titulo)
+             .join(Usuario, on=(Tarefa.user == Usuario.id))
+             .where((Tarefa.data == dia) & (Tarefa.status == 0) & (Usuario.notif_email == True))
+             .tuples())
+    for id_, usuario_id, titulo in query.iterator():
+        yield {"usuario": usuario_id, "tipo": "tarefa", "referencia": f"tarefa:{id_}:{dia}",
+               "descricao": titulo[:255], "data_evento": dia}
+
+def _pagamentos_do_dia(dia):
+    a_vista = (Financa
+               .select(Financa.id, Financa.usuario, Financa.descricao, Financa.valor)
+               .join(Usuario, on=(Financa.usuario == Usuario.id))
+               .where((Financa.data == dia) & (Financa.tipo == "saida") & A_VISTA &
+                      (Usuario.notif_email == True))
+               .tuples())
+    for id_, usuario_id, descricao, valor in a_vista.iterator():
+        yield {"usuario": usuario_id, "tipo": "pagamento", "referencia": f"financa:{id_}",
+               "descricao": f"{descricao or 'Pagamento'} (R$ {valor:.2f})"[:255], "data_evento": dia}
+
+    parcelas = (FinancaOcorrencia
+                .select(FinancaOcorrencia.financa, FinancaOcorrencia.usuario, FinancaOcorrencia.numero,
+                        FinancaOcorrencia.valor, Financa.descricao, Financa.parcelas)
+                .join(Financa, on=(FinancaOcorrencia.financa == Financa.id))
+                .switch(FinancaOcorrencia)
+                .join(Usuario, on=(FinancaOcorrencia.usuario == Usuario.id))
+                .where((FinancaOcorrencia.data == dia) & (FinancaOcorrencia.tipo == "saida") &
+                       (Usuario.notif_email == True))
+                .tuples())
+    for financa_id, usuario_id, numero, valor, descricao, total in parcelas.iterator():
+        yield {"usuario": usuario_id, "tipo": "pagamento", "referencia": f"parcela:{financa_id}:{numero}",
+               "descricao": f"{descricao or 'Parcela'} ({numero}/{total}) (R$ {valor:.2f})"[:255],
+               "data_evento": dia}
+
+def _relatorios_do_mes(hoje):
+    mes = (hoje.replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+    query = (Usuario.select(Usuario.id).where(Usuario.notif_relatorio == True).tuples())
+    for (usuario_id,) in query.iterator():
+        yield {"usuario": usuario_id, "tipo": "relatorio", "referencia": f"relatorio:{mes}",
+               "descricao": f"Resumo de {mes}", "data_evento": None}
+
+def planejar(hoje=None, antecedencia=1, dias_relatorio=3):
+    """Grava as notificações dos itens que vencem entre hoje e hoje + `antecedencia` dias."""
+    hoje = hoje or date.today()
+    oferecidas = 0
+    for k in range(antecedencia + 1):
+        dia = hoje + timedelta(days=k)
+        with db.atomic():
+            oferecidas += _gravar(_tarefas_do_dia(dia))
+            oferecidas += _gravar(_pagamentos_do_dia(dia))
+    if hoje.day <= dias_relatorio:
+        with db.atomic():
+            oferecidas += _gravar(_relatorios_do_mes(hoje))
+    return oferecidas
+
+
+# --- Entrega ---
+def recuperar_travadas(minutos=30):
+    """Devolve à fila as notificações reservadas por um despachante que morreu no meio."""
+    limite = datetime.now() - timedelta(minutes=minutos)
+    return (Notificacao
+            .update(estado="pendente", lote=None, atualizada_em=datetime.now())
+            .where((Notificacao.estado == "enviando") & (Notificacao.atualizada_em < limite))
+            .execute())
+
+def _reservar(lote):
+    ids = [n for (n,) in Notificacao
+           .select(Notificacao.id)
+           .where(Notificacao.estado == "pendente")
+           .order_by(Notificacao.id)
+           .limit(lote)
+           .tuples()]
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Outro despachante pode ter reservado parte dos ids: fica só com o que esta UPDATE pegou
+    (Notificacao
+     .update(estado="enviando", lote=token, atualizada_em=datetime.now())
+     .where(Notificacao.id.in_(ids) & (Notificacao.estado == "pendente"))
+     .execute())
+    return list(Notificacao
+                .select(Notificacao, Usuario.id, Usuario.nome, Usuario.email)
+                .join(Usuario, on=(Notificacao.usuario == Usuario.id))
+                .where(Notificacao.lote == token)
+                .order_by(Notificacao.data_evento, Notificacao.id))
+
+def _marcar(ids, estado):
+    def marcar(*args):
+        erro = args[2] if len(args) >= 3 else None
+        with db.connection_context():
+            (Notificacao
+             .update(estado=estado, erro=erro, atualizada_em=datetime.now())
+             .where(Notificacao.id.in_(ids))
+             .execute())
+    return marcar
+
+def _mensagem(destino, assunto, corpo, remetente):
+    msg = EmailMessage()
+    msg["Subject"] = assunto
+    msg["From"] = remetente
+    msg["To"] = destino
+    msg.set_content(corpo)
+    return msg
+
+def _corpo_alertas(nome, itens):
+    linhas = [f"Olá, {nome}!", "", "Lembretes do DateFY:", ""]
+    for n in itens:
+        rotulo = "Tarefa" if n.tipo == "tarefa" else "Pagamento"
+        linhas.append(f"- {n.data_evento:%d/%m} {rotulo}: {n.descricao}")
+    return "\n".join(linhas + ["", "Você pode desativar estes avisos em Perfil > Notificações."])
+
+def _corpo_relatorio(nome, usuario_id, referencia, legenda):
+    ano, mes = (int(x) for x in referencia.split(":")[1].split("-"))
+    de = date(ano, mes, 1)
+    ate = (de + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    r = relatorio_periodo(usuario_id, de, ate, legenda, janela=1)
+    linhas = [f"Olá, {nome}!", "", f"Resumo financeiro de {de:%m/%Y}:", "",
+              f"Entradas: R$ {r['mensal']['entradas'][0]:.2f}",
+              f"Saídas:   R$ {r['mensal']['saidas'][0]:.2f}",
+              f"Saldo:    R$ {r['mensal']['saldo'][0]:.2f}",
+              f"Saldo acumulado: R$ {r['mensal']['saldo_acumulado'][0]:.2f}"]
+    gastos = sorted(zip(r["por_categoria"]["rotulos"], r["por_categoria"]["total_saidas"]),
+                    key=lambda x: -x[1])
+    if gastos and gastos[0][1]:
+        linhas += ["", "Maiores gastos por categoria:"]
+        linhas += [f"- {rotulo}: R$ {total:.2f}" for rotulo, total in gastos[:5] if total]
+    return "\n".join(linhas)
+
+def despachar(fila, limite_taxa, remetente, legenda=(), lote=200):
+    """Reserva até `lote` notificações e as entrega pela `fila`; retorna quantas foram reservadas."""
+    reservadas = _reservar(lote)
+
+    grupos = defaultdict(list)  # (usuario, relatorio?) -> notificações
+    for n in reservadas:
+        chave = (n.usuario_id, n.referencia if n.tipo == "relatorio" else "alertas")
+        grupos[chave].append(n)
+
+    for (usuario_id, grupo), itens in grupos.items():
+        usuario = itens[0].usuario
+        ids = [n.id for n in itens]
+        try:
+            if grupo == "alertas":
+                assunto = f"DateFY: {len(itens)} lembrete(s) para os próximos dias"
+                corpo = _corpo_alertas(usuario.nome, itens)
+            else:
+                assunto = f"DateFY: {itens[0].descricao}"
+                corpo = _corpo_relatorio(usuario.nome, usuario_id, grupo, legenda)
+        except Exception as e:
+            logger.exception("Falha ao montar notificação para o usuário %s", usuario_id)
+            _marcar(ids, "falhou")(None, 0, repr(e))
+            continue
+        limite_taxa.aguardar()
+        fila.enfileirar(_mensagem(usuario.email, assunto, corpo, remetente),
+                        ao_enviar=_marcar(ids, "enviada"), ao_falhar=_marcar(ids, "falhou"))
+    return len(reservadas)
+
+def ciclo(fila, limite_taxa, remetente, legenda=(), antecedencia=1, lote=200):
+    """Um ciclo completo do agendador; retorna (planejadas, reservadas)."""
+    recuperadas = recuperar_travadas()
+    if recuperadas:
+        logger.warning("%d notificação(ões) travada(s) devolvida(s) à fila", recuperadas)
+    planejadas = planejar(antecedencia=antecedencia)
+    reservadas = 0
+    while True:
+        n = despachar(fila, limite_taxa, remetente, legenda, lote)
+        reservadas += n
+        if n < lote:
+            return planejadas, reservadas
@@ -0,0 +1,179 @@
+"""Parcelamento de lançamentos: expansão em ocorrências mensais e projeção.
+
+Um lançamento com `parcelas` > 1 é dividido em parcelas mensais a partir da
+sua data (mesmo dia nos meses seguintes, limitado ao fim do mês). `valor` é o
+total da compra; os centavos que sobram da divisão ficam na primeira parcela.
+
+As parcelas ficam materializadas em `financas_ocorrencias` (regeneradas por
+lançamento, só quando ele muda), então a projeção mensal é um GROUP BY sobre
+a janela pedida, qualquer que seja o tamanho dos planos. Lançamentos à vista
+continuam só em `financas` e entram na mesma consulta (UNION ALL).
+"""
+import calendar
+from datetime import date
+from decimal import Decimal, ROUND_DOWN
+
+from peewee import fn, JOIN, Value
+
+from modelos import db, Financa, FinancaOcorrencia
+
+PARCELAS_MAX = 480  # 40 anos
+LOTE_INSERCAO = 500
+
+# Lançamentos que não têm parcelas materializadas (parcelas nula em dados antigos)
+A_VISTA = Financa.parcelas.is_null() | (Financa.parcelas <= 1)
+
+
+# --- Expansão (sem banco) ---
+def somar_meses(data, meses):
+    total = data.month - 1 + meses
+    ano, mes = data.year + total // 12, total % 12 + 1
+    return date(ano, mes, min(data.day, calendar.monthrange(ano, mes)[1]))
+
+def _indice_mes(data):
+    return data.year * 12 + data.month - 1
+
+def valores_parcelas(valor, parcelas):
+    """(primeira, demais): divisão em centavos, com o resto na primeira parcela."""
+    valor = Decimal(str(valor))
+    demais = (valor / parcelas).quantize(Decimal("0.01"), rounding=ROUND_DOWN)
+    return valor - demais * (parcelas - 1), demais
+
+def expandir(data, valor, parcelas, de=None, ate=None):
+    """Gera (numero, data, valor) das parcelas com data em [de, ate].
+
+    Só percorre os meses da janela: o custo não depende do tamanho do plano.
+    """
+    if data is None:
+        return
+    parcelas = max(1, int(parcelas or 1))
+    primeiro, ultimo = 0, parcelas - 1
+    if de is not None:
+        primeiro = max(primeiro, _indice_mes(de) - _indice_mes(data))
+    if ate is not None:
+        ultimo = min(ultimo, _indice_mes(ate) - _indice_mes(data))
+
+    valor_primeira, valor_demais = valores_parcelas(valor, parcelas)
+    for k in range(primeiro, ultimo + 1):
+        dia = somar_meses(data, k)
+        if (de is None or dia >= de) and (ate is None or dia <= ate):
+            yield k + 1, dia, valor_primeira if k == 0 else valor_demais
+
+
+# --- Materialização ---
+def _linhas(financa):
+    for numero, dia, valor in expandir(financa.data, financa.valor, financa.parcelas):
+        yield {
+            "financa": financa.id,
+            "usuario": financa.usuario_id,
+            "tipo": financa.tipo,
+            "categoria": financa.categoria,
+            "numero": numero,
+            "data": dia,
+            "mes": dia.strftime("%Y-%m"),
+            "valor": valor,
+        }
+
+def _inserir(linhas):
+    linhas = list(linhas)
+    for i in range(0, len(linhas), LOTE_INSERCAO):
+        FinancaOcorrencia.insert_many(linhas[i:i + LOTE_INSERCAO]).execute()
+    return len(linhas)
+
+def parcelado(financa):
+    return (financa.parcelas or 1) > 1 and financa.data is not None
+
+def regenerar(financa):
+    """Refaz as parcelas de um lançamento (chamar após criar/alterar, na mesma transação)."""
+    with db.atomic():
+        FinancaOcorrencia.delete().where(FinancaOcorrencia.financa == financa.id).execute()
+        if parcelado(financa):
+            return _inserir(_linhas(financa))
+    return 0
+
+def remover(financa_id):
+    """Apaga as parcelas de um lançamento (antes de apagar o próprio lançamento)."""
+    return FinancaOcorrencia.delete().where(FinancaOcorrencia.financa == financa_id).execute()
+
+def materializar_pendentes(usuario_id=None, lote=200):
+    """Materializa os lançamentos parcelados que ainda não têm parcelas gravadas.
+
+    Usado após a importação em lote (insert_many não devolve os ids) e para
+    preencher bancos existentes. Retorna o número de lançamentos processados.
+    """
+    processados = 0
+    while True:
+        query = (Financa
+                 .select()
+                 .join(FinancaOcorrencia, JOIN.LEFT_OUTER,
+                       on=(FinancaOcorrencia.financa == Financa.id))
+                 .where((Financa.parcelas > 1) & Financa.data.is_null(False) &
+                        FinancaOcorrencia.id.is_null())
+                 .order_by(Financa.id)
+                 .limit(lote))
+        if usuario_id is not None:
+            query = query.where(Financa.usuario == usuario_id)
+        pendentes = list(query)
+        if not pendentes:
+            return processados
+        with db.atomic():
+            _inserir(linha for f in pendentes for linha in _linhas(f))
+        processados += len(pendentes)
+
+def reconstruir(usuario_id=None):
+    """Apaga e recria todas as parcelas (de um usuário ou de todos)."""
+    delete = FinancaOcorrencia.delete()
+    if usuario_id is not None:
+        delete = delete.where(FinancaOcorrencia.usuario == usuario_id)
+    delete.execute()
+    return materializar_pendentes(usuario_id)
+
+
+# --- Consultas ---
+def _meses(de, ate):
+    return [somar_meses(date(de.year, de.month, 1), k).strftime("%Y-%m")
+            for k in range(_indice_mes(ate) - _indice_mes(de) + 1)]
+
+def fluxo_mensal(usuario_id, de, ate):
+    """Entradas, saídas e saldo por mês em [de, ate], com as parcelas no mês em que vencem."""
+    a_vista = (Financa
+               .select(fn.SUBSTR(Financa.data, 1, 7).alias("mes"), Financa.tipo.alias("tipo"),
+                       fn.SUM(Financa.valor).alias("total"))
+               .where((Financa.usuario == usuario_id) & A_VISTA &
+                      (Financa.data >= de) & (Financa.data <= ate))
+               .group_by(fn.SUBSTR(Financa.data, 1, 7), Financa.tipo))
+    parcelas = (FinancaOcorrencia
+                .select(FinancaOcorrencia.mes, FinancaOcorrencia.tipo,
+                        fn.SUM(FinancaOcorrencia.valor))
+                .where((FinancaOcorrencia.usuario == usuario_id) &
+                       (FinancaOcorrencia.data >= de) & (FinancaOcorrencia.data <= ate))
+                .group_by(FinancaOcorrencia.mes, FinancaOcorrencia.tipo))
+
+    meses = {m: {"mes": m, "entrada": 0.0, "saida": 0.0} for m in _meses(de, ate)}
+    for linha in (a_vista + parcelas).dicts():  # UNION ALL: grupos iguais não podem se fundir
+        mes = meses.get(linha["mes"])
+        if mes is not None and linha["tipo"] in ("entrada", "saida"):
+            mes[linha["tipo"]] += float(linha["total"] or 0)
+
+    resultado = []
+    for mes in meses.values():
+        mes["entrada"] = round(mes["entrada"], 2)
+        mes["saida"] = round(mes["saida"], 2)
+        mes["saldo"] = round(mes["entrada"] - mes["saida"], 2)
+        resultado.append(mes)
+    return resultado
+
+def vencimentos(usuario_id, de, ate):
+    """Lançamentos e parcelas com data em [de, ate] (calendário financeiro)."""
+    a_vista = (Financa
+               .select(Financa.descricao, Financa.tipo, Financa.data, Financa.valor,
+                       Value(1).alias("numero"), Financa.parcelas)
+               .where((Financa.usuario == usuario_id) & A_VISTA &
+                      (Financa.data >= de) & (Financa.data <= ate)))
+    parcelas = (FinancaOcorrencia
+                .select(Financa.descricao, FinancaOcorrencia.tipo, FinancaOcorrencia.data,
+                        FinancaOcorrencia.valor, FinancaOcorrencia.numero, Financa.parcelas)
+                .join(Financa, on=(FinancaOcorrencia.financa == Financa.id))
+                .where((FinancaOcorrencia.usuario == usuario_id) &
+                       (FinancaOcorrencia.data >= de) & (FinancaOcorrencia.data <= ate)))
+    return list((a_vista + parcelas).dicts())
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from playhouse.pool import PooledMySQLDatabase, MaxConnectionsExceeded
+
+
+class PooledMySQLMonitorado(PooledMySQLDatabase):
+    """Pool de conexões MySQL que guarda estatísticas de uso.
+
+    As conexões são reaproveitadas entre requisições: `db.close()` devolve a
+    conexão ao pool em vez de encerrá-la. Antes de entregar uma conexão ociosa
+    o pool faz um `ping` (health check) e descarta as que o servidor derrubou.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._stats_lock = threading.Lock()
+        self._checkouts = 0
+        self._esperas = 0
+        self._health_falhas = 0
+        self._tempo_checkout_total = 0.0
+        self._tempo_checkout_max = 0.0
+        # Marca, por thread, se o connect() em andamento já esperou pelo pool
+        self._espera_local = threading.local()
+        super().__init__(*args, **kwargs)
+
+    def connect(self, reuse_if_open=False):
+        self._espera_local.esperou = False
+        inicio = time.perf_counter()
+        try:
+            resultado = super().connect(reuse_if_open)
+        finally:
+            # Com timeout o pool tenta de novo até liberar: conta uma espera por connect(),
+            # inclusive quando o tempo acaba sem conexão
+            if self._espera_local.esperou:
+                self._espera_local.esperou = False
+                with self._stats_lock:
+                    self._esperas += 1
+        duracao = time.perf_counter() - inicio
+
+        with self._stats_lock:
+            self._checkouts += 1
+            self._tempo_checkout_total += duracao
+            self._tempo_checkout_max = max(self._tempo_checkout_max, duracao)
+        return resultado
+
+    def _connect(self):
+        try:
+            return super()._connect()
+        except MaxConnectionsExceeded:
+            # Pool cheio: quem chamou vai esperar uma conexão ser devolvida
+            self._espera_local.esperou = True
+            raise
+
+    def _is_closed(self, conn):
+        fechada = super()._is_closed(conn)
+        if fechada:
+            with self._stats_lock:
+                self._health_falhas += 1
+        return fechada
+
+    def estatisticas(self):
+        """Retorna um dicionário com o estado atual do pool."""
+        with self._pool_lock:
+            em_uso = len(self._in_use)
+            ociosas = len(self._connections)
+
+        with self._stats_lock:
+            media = (self._tempo_checkout_total / self._checkouts) if self._checkouts else 0.0
+            return {
+                "max_conexoes": self._max_connections,
+                "stale_timeout": self._stale_timeout,
+                "em_uso": em_uso,
+                "ociosas": ociosas,
+                "checkouts": self._checkouts,
+                "esperas": self._esperas,
+                "health_check_falhas": self._health_falhas,
+                "checkout_ms_medio": round(media * 1000, 3),
+                "checkout_ms_max": round(self._tempo_checkout_max * 1000, 3),
+            }
@@ -0,0 +1,168 @@
+"""Relatórios por período sobre `financas`: mês a mês, categoria x mês e tendências.
+
+A agregação é feita no banco: os meses inteiros do período vêm prontos de
+`financas_saldos`, e só os meses parciais das pontas (quando o período não
+começa no dia 1 ou não termina no último dia) são somados em `financas`
+(e em `financas_arquivo`, quando anteriores ao corte do arquivamento),
+tudo em uma única consulta UNION ALL. O resultado (poucas linhas, já
+agrupadas) vira matrizes NumPy para saldos acumulados, médias móveis e
+tendência, sem laços por lançamento em Python.
+"""
+import calendar
+from datetime import date, timedelta
+
+import numpy as np
+from peewee import fn, Value
+
+from arquivamento import corte_financas
+from modelos import Financa, FinancaArquivada, SaldoMensal
+
+MESES_MAX = 120
+
+
+def _mes(d):
+    return d.strftime("%Y-%m")
+
+def _meses(de, ate):
+    n = (ate.year - de.year) * 12 + ate.month - de.month + 1
+    return [f"{de.year + (de.month - 1 + k) // 12:04d}-{(de.month - 1 + k) % 12 + 1:02d}"
+            for k in range(n)]
+
+def _ultimo_dia(d):
+    return d.replace(day=calendar.monthrange(d.year, d.month)[1])
+
+def _agregado(modelo, usuario_id, k, de, ate):
+    mes = fn.SUBSTR(modelo.data, 1, 7)
+    return (modelo
+            .select(Value(k).alias("k"), mes.alias("mes"), modelo.categoria.alias("categoria"),
+                    modelo.tipo.alias("tipo"), fn.SUM(modelo.valor).alias("total"))
+            .where((modelo.usuario == usuario_id) & (modelo.data >= de) & (modelo.data <= ate))
+            .group_by(mes, modelo.categoria, modelo.tipo))
+
+def _agregados_financas(usuario_id, k, de, ate):
+    """Somas de um trecho do período; inclui o arquivo se o trecho começa antes do corte dele."""
+    partes = [_agregado(Financa, usuario_id, k, de, ate)]
+    if de < corte_financas():
+        partes.append(_agregado(FinancaArquivada, usuario_id, k, de, ate))
+    return partes
+
+def _agregado_saldos(usuario_id, k, filtro):
+    return (SaldoMensal
+            .select(Value(k), SaldoMensal.mes, SaldoMensal.categoria, SaldoMensal.tipo,
+                    fn.SUM(SaldoMensal.total))
+            .where((SaldoMensal.usuario == usuario_id) & filtro)
+            .group_by(SaldoMensal.mes, SaldoMensal.categoria, SaldoMensal.tipo))
+
+def consultar_periodo(usuario_id, de, ate):
+    """Linhas (k, mes, categoria, tipo, total) do período e do saldo anterior a `de`.
+
+    k = "periodo" para os totais do período, "abertura" para o que veio antes.
+    """
+    # Meses inteiros dentro de [de, ate] saem do livro de saldos
+    inicio_cheio = de if de.day == 1 else _ultimo_dia(de) + timedelta(days=1)
+    fim_cheio = ate if ate == _ultimo_dia(ate) else ate.replace(day=1) - timedelta(days=1)
+
+    partes = []
+    if inicio_cheio <= fim_cheio:
+        partes.append(_agregado_saldos(usuario_id, "periodo",
+                                       SaldoMensal.mes.between(_mes(inicio_cheio), _mes(fim_cheio))))
+        if de < inicio_cheio:
+            partes.extend(_agregados_financas(usuario_id, "periodo", de, inicio_cheio - timedelta(days=1)))
+        if fim_cheio < ate:
+            partes.extend(_agregados_financas(usuario_id, "periodo", fim_cheio + timedelta(days=1), ate))
+    else:
+        # Período dentro de um mês (ou entre dois meses parciais)
+        partes.extend(_agregados_financas(usuario_id, "periodo", de, ate))
+
+    # Saldo de abertura: meses anteriores pelo livro + o começo do mês de `de`
+    partes.append(_agregado_saldos(usuario_id, "abertura",
+                                   (SaldoMensal.mes < _mes(de)) & (SaldoMensal.mes != "")))
+    if de.day != 1:
+        partes.extend(_agregados_financas(usuario_id, "abertura", de.replace(day=1),
+                                         de - timedelta(days=1)))
+
+    query = partes[0]
+    for parte in partes[1:]:
+        query = query + parte  # UNION ALL: partes iguais não podem se fundir
+    return list(query.tuples())
+
+
+def _media_movel(x, janela):
+    """Média dos últimos `janela` meses (NaN enquanto não há meses suficientes)."""
+    saida = np.full(x.shape, np.nan)
+    if janela <= len(x):
+        acumulado = np.cumsum(np.insert(x, 0, 0.0))
+        saida[janela - 1:] = (acumulado[janela:] - acumulado[:-janela]) / janela
+    return saida
+
+def _lista(x):
+    return [None if np.isnan(v) else v for v in np.round(x, 2).tolist()]
+
+def relatorio_periodo(usuario_id, de, ate, legenda, janela=3):
+    """Matrizes mês a mês e categoria x mês, saldo acumulado, médias móveis e tendência.
+
+    `legenda` é a lista de categorias conhecidas (CATEGORIAS), que define a
+    ordem e os rótulos; categorias fora dela aparecem no fim.
+    """
+    meses = _meses(de, ate)
+    if len(meses) > MESES_MAX:
+        raise ValueError(f"Período máximo de {MESES_MAX} meses.")
+
+    linhas = consultar_periodo(usuario_id, de, ate)
+
+    rotulos = {c["key"]: c["label"] for c in legenda}
+    chaves = [c["key"] for c in legenda]
+    for _, _, categoria, _, _ in linhas:
+        if (categoria or "outras") not in rotulos:
+            rotulos[categoria or "outras"] = categoria or "outras"
+            chaves.append(categoria or "outras")
+    pos_mes = {m: i for i, m in enumerate(meses)}
+    pos_cat = {c: i for i, c in enumerate(chaves)}
+
+    abertura = sum(float(t or 0) * (1 if tipo == "entrada" else -1)
+                   for k, _, _, tipo, t in linhas if k == "abertura")
+    periodo = [(pos_mes[m], pos_cat[c or "outras"], tipo == "entrada", float(t or 0))
+               for k, m, c, tipo, t in linhas if k == "periodo" and m in pos_mes]
+
+    entradas = np.zeros((len(chaves), len(meses)))
+    saidas = np.zeros((len(chaves), len(meses)))
+    if periodo:
+        i_mes, i_cat, eh_entrada, total = (np.array(v) for v in zip(*periodo))
+        eh_entrada = eh_entrada.astype(bool)
+        np.add.at(entradas, (i_cat[eh_entrada], i_mes[eh_entrada]), total[eh_entrada])
+        np.add.at(saidas, (i_cat[~eh_entrada], i_mes[~eh_entrada]), total[~eh_entrada])
+
+    entradas_mes = entradas.sum(axis=0)
+    saidas_mes = saidas.sum(axis=0)
+    saldo_mes = entradas_mes - saidas_mes
+    acumulado = abertura + np.cumsum(saldo_mes)
+
+    tendencia = None
+    if len(meses) >= 2:
+        # Inclinação da reta (mínimos quadrados) dos gastos mensais: R$/mês
+        tendencia = round(float(np.polyfit(np.arange(len(meses)), saidas_mes, 1)[0]), 2)
+
+    usadas = np.flatnonzero(entradas.any(axis=1) | saidas.any(axis=1))
+    return {
+        "de": de.isoformat(),
+        "ate": ate.isoformat(),
+        "meses": meses,
+        "saldo_abertura": round(abertura, 2),
+        "mensal": {
+            "entradas": _lista(entradas_mes),
+            "saidas": _lista(saidas_mes),
+            "saldo": _lista(saldo_mes),
+            "saldo_acumulado": _lista(acumulado),
+            "media_movel_saidas": _lista(_media_movel(saidas_mes, janela)),
+            "media_movel_saldo": _lista(_media_movel(saldo_mes, janela)),
+        },
+        "por_categoria": {
+            "categorias": [chaves[i] for i in usadas],
+            "rotulos": [rotulos[chaves[i]] for i in usadas],
+            "entradas": [_lista(entradas[i]) for i in usadas],
+            "saidas": [_lista(saidas[i]) for i in usadas],
+            "total_saidas": _lista(saidas[usadas].sum(axis=1)),
+        },
+        "janela_media_movel": janela,
+        "tendencia_saidas_mes": tendencia,
+    }
@@ -0,0 +1,217 @@
+"""Divisão leitura/escrita: SELECTs das requisições vão para réplicas, escritas para o primário.
+
+Em cada requisição o roteador escolhe um banco de leitura (`iniciar`):
+
+- uma réplica saudável e com atraso de replicação abaixo de REPLICA_ATRASO_MAX,
+  sorteada entre as elegíveis;
+- depois que o usuário grava algo, a sessão guarda o instante da escrita e,
+  dali em diante, só servem réplicas cujo atraso seja menor que o tempo
+  desde essa escrita (read-your-writes sem precisar esperar GTID);
+- nenhuma elegível (ou todas fora do ar): o primário.
+
+O atraso é medido com SHOW REPLICA STATUS (ou SHOW SLAVE STATUS) no máximo a
+cada REPLICA_VERIFICAR_SEGUNDOS, pela requisição que notar o valor vencido.
+Uma réplica que falha numa consulta fica de fora por REPLICA_ESPERA_FALHA
+segundos e a consulta é refeita no primário.
+
+Dentro de uma transação, depois de uma escrita na mesma requisição e fora de
+requisições (CLI, agendador) tudo vai para o primário.
+"""
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+
+from peewee import DatabaseError, DataError, IntegrityError, InterfaceError, ProgrammingError
+
+logger = logging.getLogger("datefy.replicas")
+
+REPLICA_ATRASO_MAX = float(os.getenv("REPLICA_ATRASO_MAX", "5"))
+REPLICA_VERIFICAR_SEGUNDOS = float(os.getenv("REPLICA_VERIFICAR_SEGUNDOS", "5"))
+REPLICA_ESPERA_FALHA = float(os.getenv("REPLICA_ESPERA_FALHA", "30"))
+# Seconds_Behind_Source tem resolução de 1 s: "0" pode ser até 1 s de atraso
+REPLICA_MARGEM_ESCRITA = float(os.getenv("REPLICA_MARGEM_ESCRITA", "1"))
+
+_requisicao = contextvars.ContextVar("datefy_leitura", default=None)
+
+
+def atraso_mysql(banco):
+    """Segundos de atraso da réplica; None se a replicação está parada.
+
+    Um servidor sem replicação configurada (ex: duas instâncias locais de teste)
+    conta como atraso zero.
+    """
+    for sql in ("SHOW REPLICA STATUS", "SHOW SLAVE STATUS"):
+        try:
+            cursor = banco.execute_sql(sql)
+        except ProgrammingError:
+            continue
+        linha = cursor.fetchone()
+        if not linha:
+            return 0.0
+        status = dict(zip([c[0] for c in cursor.description], linha))
+        atraso = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+        return None if atraso is None else float(atraso)
+    return 0.0
+
+def sem_atraso(banco):
+    banco.execute_sql("SELECT 1")
+    return 0.0
+
+
+def com_fallback(classe):
+    """Subclasse de `classe` (MySQLDatabase, SqliteDatabase...) que refaz no primário o que falhar."""
+
+    class Replica(classe):
+        roteador = None
+
+        def execute_sql(self, sql, *args, **kwargs):
+            try:
+                return super().execute_sql(sql, *args, **kwargs)
+            except (DatabaseError, InterfaceError) as e:
+                # Erros do próprio dado dariam o mesmo no primário; o resto é a réplica
+                # (fora do ar, arquivo corrompido, schema ainda sem a última migração)
+                if self.roteador is None or isinstance(e, (IntegrityError, DataError)):
+                    raise
+                self.roteador.falhou(self, e)
+                return self.roteador.primario.execute_sql(sql, *args, **kwargs)
+
+    Replica.__name__ = f"Replica{classe.__name__}"
+    return Replica
+
+
+class RoteadorLeitura:
+    def __init__(self, primario, replicas=(), medir_atraso=atraso_mysql, atraso_max=REPLICA_ATRASO_MAX,
+                 intervalo=REPLICA_VERIFICAR_SEGUNDOS, espera_falha=REPLICA_ESPERA_FALHA,
+                 margem_escrita=REPLICA_MARGEM_ESCRITA):
+        self.primario = primario
+        self.replicas = list(replicas)
+        self.medir_atraso = medir_atraso
+        self.atraso_max = atraso_max
+        self.intervalo = intervalo
+        self.espera_falha = espera_falha
+        self.margem_escrita = margem_escrita
+        self._lock = threading.Lock()
+        # por réplica: atraso medido, quando foi medido, última falha, se há medição em curso
+        self._estado = {id(r): {"atraso": None, "medido_em": 0.0, "falhou_em": None, "medindo": False,
+                                "erro": None, "leituras": 0} for r in self.replicas}
+        self._leituras_primario = 0
+        for replica in self.replicas:
+            if hasattr(replica, "roteador"):
+                replica.roteador = self
+
+    # --- Saúde das réplicas ---
+    def _medir(self, replica):
+        estado = self._estado[id(replica)]
+        try:
+            replica.connect(reuse_if_open=True)
+            atraso = self.medir_atraso(replica)
+            with self._lock:
+                estado.update(atraso=atraso, erro=None if atraso is not None else "replicação parada")
+        except Exception as e:
+            logger.warning("Réplica indisponível (%s): %s", getattr(replica, "database", replica), e)
+            with self._lock:
+                estado.update(atraso=None, falhou_em=time.monotonic(), erro=str(e))
+            try:
+                replica.close()
+            except Exception:
+                pass
+        finally:
+            with self._lock:
+                estado.update(medido_em=time.monotonic(), medindo=False)
+
+    def _atualizar(self):
+        agora = time.monotonic()
+        for replica in self.replicas:
+            estado = self._estado[id(replica)]
+            with self._lock:
+                # Réplica que acabou de falhar só é medida de novo depois da espera
+                em_espera = estado["falhou_em"] is not None and agora - estado["falhou_em"] < self.espera_falha
+                vencido = (agora - estado["medido_em"] >= self.intervalo and not estado["medindo"]
+                           and not em_espera)
+                if vencido:
+                    estado["medindo"] = True
+            if vencido:
+                self._medir(replica)
+
+    def falhou(self, replica, erro):
+        logger.warning("Consulta na réplica falhou, refazendo no primário: %s", erro)
+        with self._lock:
+            self._estado[id(replica)].update(falhou_em=time.monotonic(), atraso=None, erro=str(erro))
+        try:
+            replica.close()
+        except Exception:
+            pass
+
+    def elegiveis(self, escrita_ha=None):
+        """Réplicas saudáveis com atraso aceitável (e menor que o tempo desde a última escrita)."""
+        limite = self.atraso_max
+        if escrita_ha is not None:
+            limite = min(limite, escrita_ha - self.margem_escrita)
+        agora = time.monotonic()
+        saida = []
+        with self._lock:
+            for replica in self.replicas:
+                estado = self._estado[id(replica)]
+                if estado["falhou_em"] is not None and agora - estado["falhou_em"] < self.espera_falha:
+                    continue
+                if estado["atraso"] is not None and estado["atraso"] < limite:
+                    saida.append(replica)
+        return saida
+
+    # --- Ciclo da requisição ---
+    def iniciar(self, escrita_em=None):
+        """Escolhe o banco de leitura da requisição. `escrita_em`: time.time() da última escrita do usuário."""
+        leitura = None
+        if self.replicas:
+            self._atualizar()
+            escrita_ha = None if escrita_em is None else max(0.0, time.time() - escrita_em)
+            candidatas = self.elegiveis(escrita_ha)
+            if candidatas:
+                leitura = random.choice(candidatas)
+        with self._lock:
+            if leitura is None:
+                self._leituras_primario += 1
+            else:
+                self._estado[id(leitura)]["leituras"] += 1
+        _requisicao.set({"leitura": leitura, "escreveu": False})
+
+    def banco_leitura(self):
+        """Banco para um SELECT agora, ou None para o primário."""
+        estado = _requisicao.get()
+        if estado is None or estado["leitura"] is None or self.primario.in_transaction():
+            return None
+        return estado["leitura"]
+
+    def marcar_escrita(self):
+        """Depois de uma escrita, o resto da requisição lê do primário."""
+        estado = _requisicao.get()
+        if estado is not None:
+            estado["leitura"] = None
+            estado["escreveu"] = True
+
+    def escreveu(self):
+        estado = _requisicao.get()
+        return bool(estado and estado["escreveu"])
+
+    def encerrar(self):
+        """Devolve as conexões de réplica ao pool e limpa o estado da requisição."""
+        _requisicao.set(None)
+        for replica in self.replicas:
+            try:
+                if not replica.is_closed():
+                    replica.close()
+            except Exception:
+                pass
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "leituras_primario": self._leituras_primario,
+                "atraso_max": self.atraso_max,
+                "replicas": [{"banco": "/".join(filter(None, (getattr(r, "connect_params", {}).get("host"), r.database))),
+                              "atraso": e["atraso"], "erro": e["erro"], "leituras": e["leituras"]}
+                             for r, e in ((r, self._estado[id(r)]) for r in self.replicas)],
+            }
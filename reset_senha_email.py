@@ -1,8 +1,17 @@
+import os
 import smtplib
 import email.message
-from flask import Flask, request, redirect, render_template, url_for, flash
 
-def enviar_email(email_destino):
+# Configuração do SMTP (para testes locais: SMTP_HOST=localhost SMTP_PORT=8025 SMTP_STARTTLS=0 SMTP_USER=)
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER", "datefyteste@gmail.com")
+# Sem padrão: a senha vem só do ambiente
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+EMAIL_REMETENTE = os.getenv("EMAIL_REMETENTE", SMTP_USER or "datefyteste@gmail.com")
+
+def montar_email(email_destino, codigo=""):
     corpo_email = """ "<h2>Redefinição de senha</h2>
 
     <p>Olá,</p>
@@ -12,10 +21,10 @@ def enviar_email(email_destino):
     <p>Para continuar, utilize o código abaixo:</p>
 
     <h1 style="font-size: 32px; letter-spacing: 4px; text-align: center;">
-        <b>{frhnsgdomanhxnhx}</b>
+        <b>{codigo}</b>
     </h1>
 
-    <p>Se você não solicitou uma troca de senha, basta ignorar este e-mail. 
+    <p>Se você não solicitou uma troca de senha, basta ignorar este e-mail.
     Nenhuma alteração será feita sem sua permissão.</p>
 
     <p>Atenciosamente,<br>
@@ -24,14 +33,20 @@ def enviar_email(email_destino):
 
     msg = email.message.Message()
     msg["Subject"] = "Mensagem titulo"
-    msg["From"] = "datefyteste@gmail.com"
+    msg["From"] = EMAIL_REMETENTE
     msg["To"] = email_destino
-    senha = "frhnsgdomanhxnhx"
     msg.add_header("Content-Type", 'text/html')
-    msg.set_payload(corpo_email)
+    msg.set_payload(corpo_email.format(codigo=codigo), "utf-8")
+    return msg
 
-    envia = smtplib.SMTP("smtp.gmail.com: 587")
-    envia.starttls()
-    envia.login(msg["From"],senha)
-    envia.sendmail(msg["From"], [msg["To"]],msg.as_string().encode('utf-8'))
-    print("Email enviado!")
\ No newline at end of file
+def enviar_email(email_destino):
+    """Envio síncrono (abre uma conexão SMTP só para esta mensagem)."""
+    msg = montar_email(email_destino)
+
+    envia = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
+    if SMTP_STARTTLS:
+        envia.starttls()
+    if SMTP_USER:
+        envia.login(SMTP_USER, SMTP_PASSWORD)
+    envia.sendmail(msg["From"], [msg["To"]], msg.as_string().encode('utf-8'))
+    envia.quit()
@@ -0,0 +1,83 @@
+"""Resumo do usuário (totais financeiros, por categoria e tarefas do dia).
+
+Calculado em uma única ida ao banco a partir dos saldos pré-calculados e
+guardado no cache compartilhado (chaves versionadas por usuário), invalidado
+pelas rotas que alteram tarefas ou lançamentos.
+"""
+import os
+from datetime import date
+
+from peewee import fn, Value
+
+import cache
+from modelos import Tarefa, SaldoMensal
+
+cache_resumo = cache.CacheVersionado(cache.backend, "resumo",
+                                     ttl=float(os.getenv("RESUMO_CACHE_TTL", "60")))
+
+
+def consultar_resumo(user_id, hoje):
+    """Uma consulta (UNION ALL): totais por categoria/tipo + contagem de tarefas de hoje."""
+    por_categoria = (SaldoMensal
+                     .select(Value("categoria").alias("k"),
+                             SaldoMensal.categoria.alias("categoria"),
+                             SaldoMensal.tipo.alias("tipo"),
+                             fn.SUM(SaldoMensal.total).alias("total"))
+                     .where(SaldoMensal.usuario == user_id)
+                     .group_by(SaldoMensal.categoria, SaldoMensal.tipo))
+    tarefas_hoje = (Tarefa
+                    .select(Value("tarefas_hoje"), Value(""), Value(""), fn.COUNT(Tarefa.id))
+                    .where((Tarefa.user == user_id) & (Tarefa.data == hoje) & (Tarefa.status == 0)))
+
+    categorias = []
+    n_tarefas = 0
+    for linha in (por_categoria + tarefas_hoje).dicts():  # UNION ALL: as partes nunca se repetem
+        if linha["k"] == "tarefas_hoje":
+            n_tarefas = int(linha["total"] or 0)
+        else:
+            categorias.append((linha["categoria"], linha["tipo"], float(linha["total"] or 0)))
+
+    totais = {"entrada": 0.0, "saida": 0.0}
+    for _, tipo, total in categorias:
+        totais[tipo] = totais.get(tipo, 0.0) + total
+
+    return {"hoje": hoje.isoformat(), "totais": totais, "categorias": categorias,
+            "tarefas_hoje": n_tarefas}
+
+
+def agrupar_por_categoria(categorias, legenda):
+    """Saldo (entradas - saídas) por categoria, no formato do gráfico de pizza."""
+    cat_map = {}
+    for c in legenda:
+        cat_map[c["key"]] = {"label": c["label"], "color": c["color"], "total": 0.0}
+
+    for categoria, tipo, total in categorias:
+        key = categoria or "outras"
+        if key not in cat_map:
+            cat_map[key] = {"label": key, "color": "#999999", "total": 0.0}
+
+        if tipo == "entrada":
+            cat_map[key]["total"] += total
+        else:
+            cat_map[key]["total"] -= total
+
+    labels, values, colors = [], [], []
+    for k, v in cat_map.items():
+        if abs(v["total"]) > 0:
+            labels.append(v["label"])
+            values.append(round(v["total"], 2))
+            colors.append(v["color"])
+    return {"labels": labels, "values": values, "colors": colors}
+
+
+def obter_resumo(user_id, hoje=None):
+    """Resumo do usuário, do cache quando possível."""
+    hoje = hoje or date.today()
+    # A data entra na chave: na virada do dia a contagem de tarefas é recalculada
+    return cache_resumo.obter_ou_calcular(user_id, lambda: consultar_resumo(user_id, hoje),
+                                          variante=hoje.isoformat())
+
+
+def invalidar_resumo(user_id):
+    """Chamar depois de gravar (após o commit) qualquer alteração em tarefas ou finanças."""
+    cache_resumo.invalidar(user_id)
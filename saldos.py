@@ -0,0 +1,105 @@
+"""Saldos pré-calculados de `financas` (tabela financas_saldos / SaldoMensal)."""
+import itertools
+from decimal import Decimal
+
+from peewee import fn, IntegrityError
+
+from modelos import db, Financa, FinancaArquivada, SaldoMensal
+
+def _chave_saldo(usuario_id, tipo, categoria, data):
+    return {
+        "usuario": usuario_id,
+        "tipo": tipo or "",
+        "categoria": categoria or "",
+        "mes": str(data or "")[:7],
+    }
+
+def atualizar_saldo(usuario_id, tipo, categoria, data, valor, sinal=1, quantidade=1):
+    """Soma (sinal=1) ou subtrai (sinal=-1) um lançamento do saldo mensal.
+
+    `quantidade` > 1 permite aplicar de uma vez a soma de vários lançamentos
+    da mesma chave (importação em lote). Deve ser chamada dentro da mesma
+    transação que grava/apaga o `Financa`.
+    """
+    chave = _chave_saldo(usuario_id, tipo, categoria, data)
+    delta = Decimal(str(valor)) * sinal
+    qtd = quantidade * sinal
+    filtro = ((SaldoMensal.usuario == chave["usuario"]) &
+              (SaldoMensal.tipo == chave["tipo"]) &
+              (SaldoMensal.categoria == chave["categoria"]) &
+              (SaldoMensal.mes == chave["mes"]))
+
+    atualizados = (SaldoMensal
+                   .update(total=SaldoMensal.total + delta,
+                           quantidade=SaldoMensal.quantidade + qtd)
+                   .where(filtro)
+                   .execute())
+    if atualizados:
+        return
+
+    try:
+        with db.atomic():
+            SaldoMensal.create(total=delta, quantidade=qtd, **chave)
+    except IntegrityError:
+        # outra requisição criou a linha ao mesmo tempo
+        (SaldoMensal
+         .update(total=SaldoMensal.total + delta,
+                 quantidade=SaldoMensal.quantidade + qtd)
+         .where(filtro)
+         .execute())
+
+def _agregado(modelo, usuario_id=None):
+    mes = fn.SUBSTR(modelo.data, 1, 7)
+    query = (modelo
+             .select(modelo.usuario.alias('usuario_id'), modelo.tipo, modelo.categoria,
+                     mes.alias('mes'),
+                     fn.SUM(modelo.valor).alias('total'),
+                     fn.COUNT(modelo.id).alias('quantidade'))
+             .group_by(modelo.usuario, modelo.tipo, modelo.categoria, mes)
+             .dicts())
+    if usuario_id is not None:
+        query = query.where(modelo.usuario == usuario_id)
+    return query
+
+def _saldos_calculados(usuario_id=None):
+    """Agrega `financas` (e o arquivo, que continua nos saldos) do zero, no formato da tabela de saldos."""
+    saldos = {}
+    for r in itertools.chain(_agregado(Financa, usuario_id), _agregado(FinancaArquivada, usuario_id)):
+        chave = _chave_saldo(r["usuario_id"], r["tipo"], r["categoria"], r["mes"])
+        chave = (chave["usuario"], chave["tipo"], chave["categoria"], chave["mes"])
+        total, qtd = saldos.get(chave, (Decimal("0"), 0))
+        saldos[chave] = (total + Decimal(str(r["total"] or 0)).quantize(Decimal("0.01")),
+                         qtd + r["quantidade"])
+    return saldos
+
+def _saldos_gravados(usuario_id=None):
+    query = SaldoMensal.select()
+    if usuario_id is not None:
+        query = query.where(SaldoMensal.usuario == usuario_id)
+    return {(s.usuario_id, s.tipo, s.categoria, s.mes): (s.total, s.quantidade)
+            for s in query if s.quantidade or s.total}
+
+def verificar_saldos(usuario_id=None):
+    """Lista as chaves em que a tabela de saldos diverge de `financas`."""
+    esperado = _saldos_calculados(usuario_id)
+    gravado = _saldos_gravados(usuario_id)
+    divergencias = []
+    for chave in sorted(set(esperado) | set(gravado), key=str):
+        if esperado.get(chave, (0, 0)) != gravado.get(chave, (0, 0)):
+            divergencias.append((chave, esperado.get(chave), gravado.get(chave)))
+    return divergencias
+
+def reconstruir_saldos(usuario_id=None):
+    """Apaga e recalcula os saldos (de um usuário ou de todos)."""
+    saldos = _saldos_calculados(usuario_id)
+    with db.atomic():
+        delete = SaldoMensal.delete()
+        if usuario_id is not None:
+            delete = delete.where(SaldoMensal.usuario == usuario_id)
+        delete.execute()
+
+        linhas = [{"usuario": u, "tipo": t, "categoria": c, "mes": m, "total": total, "quantidade": qtd}
+                  for (u, t, c, m), (total, qtd) in saldos.items()]
+        for i in range(0, len(linhas), 500):
+            SaldoMensal.insert_many(linhas[i:i + 500]).execute()
+    return len(saldos)
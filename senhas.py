@@ -0,0 +1,141 @@
+"""Hash de senhas (bcrypt) fora da thread da requisição.
+
+O bcrypt é caro de propósito (~250 ms no custo 12) e libera o GIL, então as
+operações rodam em um pool próprio de threads, limitado a poucos núcleos.
+Quando o pool e a fila estão cheios, a chamada falha na hora com
+`SenhasOcupado` (a rota responde 503) em vez de empilhar requisições e
+prender todos os workers do gunicorn em um pico de logins.
+
+O custo (BCRYPT_CUSTO) pode mudar a qualquer momento: hashes com custo
+diferente continuam válidos e são refeitos no próximo login bem-sucedido.
+"""
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+
+import bcrypt
+
+BCRYPT_CUSTO = int(os.getenv("BCRYPT_CUSTO", "12"))
+BCRYPT_MAX_BYTES = 72  # o bcrypt só considera os primeiros 72 bytes
+
+
+class SenhasOcupado(RuntimeError):
+    """O pool de hash está saturado; tente novamente em instantes."""
+
+
+def _bytes(senha):
+    # Versões antigas do bcrypt truncavam em silêncio; as novas recusam senhas longas
+    return senha.encode("utf-8")[:BCRYPT_MAX_BYTES]
+
+
+def custo_do_hash(senha_hash):
+    """Custo de um hash no formato $2b$12$..., ou None se não reconhecido."""
+    partes = senha_hash.split("$")
+    try:
+        return int(partes[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def gerar_hash(senha, custo=BCRYPT_CUSTO):
+    if not senha:
+        raise ValueError("Senha vazia.")
+    return bcrypt.hashpw(_bytes(senha), bcrypt.gensalt(rounds=custo)).decode("utf-8")
+
+
+def verificar_hash(senha_hash, senha):
+    try:
+        esperado = senha_hash.encode("utf-8")
+        return hmac.compare_digest(bcrypt.hashpw(_bytes(senha), esperado), esperado)
+    except ValueError:
+        # hash corrompido / em formato desconhecido
+        return False
+
+
+class PoolSenhas:
+    """Executa gerar/verificar em até `workers` threads, com no máximo `max_fila` esperando."""
+
+    def __init__(self, workers=2, max_fila=8, timeout=10.0, custo=BCRYPT_CUSTO):
+        self.workers = workers
+        self.max_fila = max_fila
+        self.timeout = timeout
+        self.custo = custo
+        self._vagas = threading.BoundedSemaphore(workers + max_fila)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {"executadas": 0, "rejeitadas": 0, "rehash": 0}
+
+    def _executar(self, funcao, *args, bloquear=True):
+        if not self._vagas.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejeitadas"] += 1
+            raise SenhasOcupado("Muitas operações de senha em andamento.")
+        try:
+            with self._lock:
+                # Criado sob demanda, já no processo (worker) que vai usá-lo
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="senhas")
+                futuro = self._executor.submit(funcao, *args)
+        except BaseException:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        with self._lock:
+            self._stats["executadas"] += 1
+        if not bloquear:
+            return futuro
+        try:
+            return futuro.result(self.timeout)
+        except FuturoTimeout:
+            raise SenhasOcupado("Tempo esgotado aguardando o hash da senha.")
+
+    # --- API ---
+    def gerar(self, senha):
+        return self._executar(gerar_hash, senha, self.custo)
+
+    def verificar(self, senha_hash, senha):
+        return self._executar(verificar_hash, senha_hash, senha)
+
+    def precisa_rehash(self, senha_hash):
+        return custo_do_hash(senha_hash) != self.custo
+
+    def rehash_em_segundo_plano(self, senha, ao_concluir):
+        """Gera o hash no custo atual sem bloquear; se o pool estiver cheio, fica para o próximo login."""
+        try:
+            futuro = self._executar(gerar_hash, senha, self.custo, bloquear=False)
+        except SenhasOcupado:
+            return False
+
+        def concluir(f):
+            if f.exception() is None:
+                ao_concluir(f.result())
+                with self._lock:
+                    self._stats["rehash"] += 1
+        futuro.add_done_callback(concluir)
+        return True
+
+    def estatisticas(self):
+        with self._lock:
+            return {**self._stats, "workers": self.workers, "max_fila": self.max_fila,
+                    "custo": self.custo}
+
+    def parar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def medir(custo, segundos=2.0):
+    """Verificações de senha por segundo em uma thread (≈ logins/s por núcleo)."""
+    senha_hash = gerar_hash("senha-de-benchmark", custo)
+    n = 0
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < segundos or n == 0:
+        verificar_hash(senha_hash, "senha-de-benchmark")
+        n += 1
+    duracao = time.perf_counter() - inicio
+    return {"custo": custo, "verificacoes": n, "ms_por_login": round(duracao / n * 1000, 1),
+            "logins_por_segundo": round(n / duracao, 2)}
@@ -0,0 +1,66 @@
+"""Sessões guardadas no servidor (no backend de cache compartilhado).
+
+O cookie leva só um identificador aleatório; os dados (user_id, nome...) ficam
+em `sessao:<id>` no backend, visíveis para todos os workers. A expiração é
+deslizante: cada requisição renova o TTL (RNF06: 15 minutos de inatividade).
+"""
+import secrets
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class SessaoServidor(CallbackDict, SessionMixin):
+    def __init__(self, dados=None, sid=None, nova=False):
+        def ao_alterar(self):
+            self.modified = True
+        super().__init__(dados, ao_alterar)
+        self.sid = sid
+        self.new = nova
+        self.modified = False
+        self.usuario_original = self.get("user_id")
+
+
+class SessaoBackend(SessionInterface):
+    def __init__(self, backend, ttl=900, prefixo="sessao:"):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefixo = prefixo
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            dados = self.backend.obter(self.prefixo + sid)
+            if dados is not None:
+                return SessaoServidor(dados, sid=sid)
+        return SessaoServidor(sid=secrets.token_urlsafe(32), nova=True)
+
+    def renovar(self, session):
+        self.backend.definir(self.prefixo + session.sid, dict(session), self.ttl)
+
+    def save_session(self, app, session, response):
+        nome = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        caminho = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                # logout: apaga no servidor e no navegador
+                self.backend.apagar(self.prefixo + session.sid)
+                response.delete_cookie(nome, domain=dominio, path=caminho)
+            return
+
+        response.vary.add("Cookie")
+        if not session.new and session.get("user_id") != session.usuario_original:
+            # Troca o id quando o usuário da sessão muda (login), evitando fixação de sessão
+            self.backend.apagar(self.prefixo + session.sid)
+            session.sid = secrets.token_urlsafe(32)
+        # Grava sempre que houver sessão: renova o TTL (expiração por inatividade)
+        self.renovar(session)
+        if session.new or session.modified or session.permanent:
+            response.set_cookie(nome, session.sid,
+                                max_age=self.ttl if session.permanent else None,
+                                domain=dominio, path=caminho,
+                                httponly=self.get_cookie_httponly(app),
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
@@ -0,0 +1,66 @@
+// Anexos (RF16): lista, envio e exclusão dos anexos de uma tarefa ou lançamento.
+// Uso: montarAnexos(elemento, "tarefa" | "financa", id)
+function montarAnexos(caixa, tipo, id) {
+  const base = `/api/anexos/${tipo}/${id}`;
+
+  function tamanho(bytes) {
+    return bytes < 1024 * 1024 ? (bytes / 1024).toFixed(0) + " KB" : (bytes / 1048576).toFixed(1) + " MB";
+  }
+
+  async function listar() {
+    const res = await fetch(base);
+    const itens = res.ok ? await res.json() : [];
+    caixa.innerHTML = "";
+    const lista = document.createElement("ul");
+    lista.style.cssText = "list-style:none;padding:0;margin:8px 0;";
+    for (const a of itens) {
+      const li = document.createElement("li");
+      li.style.cssText = "display:flex;gap:8px;align-items:center;margin:4px 0;";
+      if (a.miniatura) {
+        const img = document.createElement("img");
+        img.width = 40; img.height = 40; img.style.objectFit = "cover"; img.alt = "";
+        carregarMiniatura(img, a.miniatura, 0);
+        li.appendChild(img);
+      }
+      const link = document.createElement("a");
+      link.href = a.url; link.target = "_blank"; link.textContent = a.nome;
+      link.style.color = "#cbd8e4";
+      li.appendChild(link);
+      li.appendChild(document.createTextNode(" " + tamanho(a.tamanho) + " "));
+      const apagar = document.createElement("button");
+      apagar.type = "button"; apagar.textContent = "remover";
+      apagar.onclick = async () => {
+        if (!confirm("Remover este anexo?")) return;
+        await fetch(`/anexos/${a.id}/excluir`, {method: "POST"});
+        listar();
+      };
+      li.appendChild(apagar);
+      lista.appendChild(li);
+    }
+    caixa.appendChild(lista);
+
+    const entrada = document.createElement("input");
+    entrada.type = "file";
+    entrada.onchange = async () => {
+      const arquivo = entrada.files[0];
+      if (!arquivo) return;
+      // Corpo cru: o servidor grava em blocos, sem montar multipart
+      const res = await fetch(`${base}?nome=${encodeURIComponent(arquivo.name)}`, {method: "POST", body: arquivo});
+      if (!res.ok) alert((await res.json()).error || "Falha ao enviar o anexo.");
+      listar();
+    };
+    caixa.appendChild(entrada);
+  }
+
+  // A miniatura é gerada na primeira vez que é pedida (202 até ficar pronta)
+  async function carregarMiniatura(img, url, tentativa) {
+    const res = await fetch(url);
+    if (res.status === 202 && tentativa < 10) {
+      setTimeout(() => carregarMiniatura(img, url, tentativa + 1), 1000);
+    } else if (res.ok) {
+      img.src = url;
+    }
+  }
+
+  listar();
+}
@@ -0,0 +1,14 @@
+"""Configuração dos testes: banco SQLite temporário e a raiz do projeto no sys.path.
+
+O SQLITE_PATH precisa estar definido antes do primeiro `import modelos`.
+"""
+import os
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+_pasta = tempfile.mkdtemp(prefix="datefy-testes-")
+os.environ.setdefault("SQLITE_PATH", os.path.join(_pasta, "datefy.db"))
+os.environ.setdefault("CACHE_URL", "memoria://")
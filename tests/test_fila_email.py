@@ -0,0 +1,107 @@
+"""FilaEmail contra um servidor SMTP local (aiosmtpd)."""
+import email.message
+import socket
+import time
+
+import pytest
+
+pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller
+
+from fila_email import FilaEmail, PoolSMTP
+
+
+class Caixa:
+    """Handler do aiosmtpd: responde 451 (erro temporário) nas `falhas` primeiras entregas."""
+
+    def __init__(self, falhas=0):
+        self.falhas = falhas
+        self.recebidas = []
+        self.tentativas = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.tentativas.append(time.monotonic())
+        if len(self.tentativas) <= self.falhas:
+            return "451 Tente mais tarde"
+        self.recebidas.append(envelope)
+        return "250 OK"
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    def iniciar(falhas=0):
+        caixa = Caixa(falhas)
+        controller = Controller(caixa, hostname="127.0.0.1", port=_porta_livre())
+        controller.start()
+        servidores.append(controller)
+        return caixa, PoolSMTP("127.0.0.1", controller.port, starttls=False, timeout=5)
+    servidores = []
+    yield iniciar
+    for controller in servidores:
+        controller.stop()
+
+
+def _mensagem(destino="ana@example.com"):
+    msg = email.message.Message()
+    msg["Subject"] = "Teste"
+    msg["From"] = "datefy@example.com"
+    msg["To"] = destino
+    msg.set_payload("corpo", "utf-8")
+    return msg
+
+
+def test_envia_pelo_smtp(smtp):
+    caixa, pool = smtp()
+    fila = FilaEmail(pool)
+    enviados = []
+
+    fila.enfileirar(_mensagem(), ao_enviar=lambda: enviados.append(True))
+    assert fila.aguardar(5)
+    fila.parar()
+
+    assert [e.rcpt_tos for e in caixa.recebidas] == [["ana@example.com"]]
+    assert enviados == [True]
+    assert fila.estatisticas()["enviados"] == 1
+
+
+def test_nova_tentativa_com_backoff(smtp):
+    caixa, pool = smtp(falhas=2)
+    fila = FilaEmail(pool, backoff_base=0.2)
+
+    fila.enfileirar(_mensagem())
+    assert fila.aguardar(10)
+    fila.parar()
+
+    assert len(caixa.recebidas) == 1
+    stats = fila.estatisticas()
+    assert (stats["tentativas_falhas"], stats["enviados"], stats["descartados"]) == (2, 1, 0)
+    # Backoff exponencial: 0.2s depois da 1ª falha, 0.4s depois da 2ª
+    intervalos = [b - a for a, b in zip(caixa.tentativas, caixa.tentativas[1:])]
+    assert intervalos[0] >= 0.2 and intervalos[1] >= 0.4
+
+
+def test_parar_manda_pendentes_ao_dead_letter(smtp):
+    caixa, pool = smtp(falhas=99)
+    descartados = []
+    fila = FilaEmail(pool, backoff_base=60, ao_falhar=lambda msg, tentativas, erro:
+                     descartados.append((msg["To"], tentativas, erro)))
+
+    fila.enfileirar(_mensagem())
+    limite = time.monotonic() + 5
+    while not caixa.tentativas and time.monotonic() < limite:
+        time.sleep(0.01)
+    # A nova tentativa fica no backoff de 60s: parar() não pode perdê-la
+    fila.parar(timeout=0.2)
+
+    assert caixa.recebidas == []
+    assert len(descartados) == 1
+    destino, tentativas, erro = descartados[0]
+    assert (destino, tentativas) == ("ana@example.com", 1)
+    assert "451" in erro
+    assert fila.estatisticas()["descartados"] == 1
@@ -0,0 +1,44 @@
+from peewee import SqliteDatabase
+
+import migracoes
+
+
+def _banco(tmp_path):
+    db = SqliteDatabase(str(tmp_path / "migracoes.db"))
+    db.execute_sql("CREATE TABLE tarefas (id INTEGER PRIMARY KEY, user_id INTEGER, "
+                   "status VARCHAR(20), data DATE, data_antiga VARCHAR(10))")
+    return db
+
+
+def test_criar_indice_recria_indice_com_colunas_erradas(tmp_path):
+    db = _banco(tmp_path)
+    # Estado deixado pela 002 antiga: o índice ficou sobre a coluna convertida de antes
+    db.execute_sql("CREATE INDEX tarefa_user_id_status_data ON tarefas (user_id, status, data_antiga)")
+    log = []
+
+    migracoes._criar_indice(db, "tarefas", "tarefa_user_id_status_data",
+                            ["user_id", "status", "data"], log.append)
+
+    assert migracoes._colunas_indice(db, "tarefas", "tarefa_user_id_status_data") == ["user_id", "status", "data"]
+    assert "recriado" in log[-1]
+
+
+def test_criar_indice_idempotente(tmp_path):
+    db = _banco(tmp_path)
+    log = []
+    for _ in range(2):
+        migracoes._criar_indice(db, "tarefas", "tarefa_user_id_data", ["user_id", "data"], log.append)
+    assert log == ["  índice tarefa_user_id_data criado", "  índice tarefa_user_id_data já existe"]
+
+
+def test_indices_de_data_cobrem_data(tmp_path):
+    db = _banco(tmp_path)
+    db.execute_sql("CREATE TABLE financas (id INTEGER PRIMARY KEY, usuario_id INTEGER, "
+                   "tipo VARCHAR(10), categoria VARCHAR(255), data DATE)")
+    db.execute_sql("ALTER TABLE tarefas ADD COLUMN categoria VARCHAR(255)")
+    db.execute_sql("CREATE INDEX financa_usuario_id_tipo_data ON financas (usuario_id, tipo)")
+
+    migracoes.m012_indices_data(db, lambda *a: None, 1000)
+
+    for tabela, nome, colunas in migracoes.INDICES_DATA:
+        assert migracoes._colunas_indice(db, tabela, nome) == colunas
@@ -0,0 +1,89 @@
+"""Roteamento de leituras com dois arquivos SQLite: primário e réplica."""
+import time
+
+import pytest
+from peewee import SqliteDatabase
+
+from replicas import RoteadorLeitura, com_fallback
+
+
+@pytest.fixture
+def bancos(tmp_path):
+    primario = SqliteDatabase(str(tmp_path / "primario.db"))
+    replica = com_fallback(SqliteDatabase)(str(tmp_path / "replica.db"))
+    for banco, origem in ((primario, "primario"), (replica, "replica")):
+        banco.execute_sql("CREATE TABLE origem (nome TEXT)")
+        banco.execute_sql("INSERT INTO origem VALUES (?)", (origem,))
+    yield primario, replica
+    primario.close()
+    replica.close()
+
+
+def _roteador(primario, replica, atrasos):
+    # `atrasos` simula o SHOW REPLICA STATUS: segundos de atraso, None (parada) ou exceção (fora do ar)
+    def medir(banco):
+        atraso = atrasos["replica"]
+        if isinstance(atraso, Exception):
+            raise atraso
+        return atraso
+    return RoteadorLeitura(primario, [replica], medir_atraso=medir, atraso_max=5, intervalo=0,
+                           espera_falha=30, margem_escrita=1)
+
+
+def _origem(roteador):
+    banco = roteador.banco_leitura() or roteador.primario
+    return banco.execute_sql("SELECT nome FROM origem").fetchone()[0]
+
+
+def test_le_da_replica_com_atraso_baixo(bancos):
+    roteador = _roteador(*bancos, {"replica": 0.0})
+    roteador.iniciar()
+    assert _origem(roteador) == "replica"
+
+
+@pytest.mark.parametrize("atraso", [10.0, None])
+def test_primario_com_replica_atrasada_ou_parada(bancos, atraso):
+    roteador = _roteador(*bancos, {"replica": atraso})
+    roteador.iniciar()
+    assert _origem(roteador) == "primario"
+    assert roteador.estatisticas()["leituras_primario"] == 1
+
+
+def test_escrita_na_requisicao_fixa_o_primario(bancos):
+    roteador = _roteador(*bancos, {"replica": 0.0})
+    roteador.iniciar()
+    assert _origem(roteador) == "replica"
+    roteador.marcar_escrita()
+    assert _origem(roteador) == "primario"
+    assert roteador.escreveu()
+
+
+def test_read_your_writes_entre_requisicoes(bancos):
+    atrasos = {"replica": 2.0}
+    roteador = _roteador(*bancos, atrasos)
+    # Escrita há 1 s: uma réplica 2 s atrasada ainda não a tem
+    roteador.iniciar(escrita_em=time.time() - 1)
+    assert _origem(roteador) == "primario"
+    # Escrita há 10 s: a réplica já alcançou (2 s + margem de 1 s)
+    roteador.iniciar(escrita_em=time.time() - 10)
+    assert _origem(roteador) == "replica"
+
+
+def test_replica_fora_do_ar_na_medicao(bancos):
+    roteador = _roteador(*bancos, {"replica": ConnectionError("recusada")})
+    roteador.iniciar()
+    assert _origem(roteador) == "primario"
+    assert roteador.estatisticas()["replicas"][0]["erro"] == "recusada"
+
+
+def test_consulta_que_falha_na_replica_e_refeita_no_primario(bancos):
+    primario, replica = bancos
+    roteador = _roteador(primario, replica, {"replica": 0.0})
+    roteador.iniciar()
+    # Réplica sem a tabela (ex: migração ainda não replicada)
+    replica.execute_sql("DROP TABLE origem")
+    assert roteador.banco_leitura() is replica
+    assert _origem(roteador) == "primario"
+    # A réplica fica de fora durante a espera, mesmo com atraso zero
+    roteador.iniciar()
+    assert roteador.banco_leitura() is None
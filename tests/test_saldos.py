@@ -0,0 +1,32 @@
+from datetime import date
+
+import pytest
+
+import migracoes
+from modelos import db, MODELOS, Usuario, Financa, SaldoMensal
+from saldos import verificar_saldos
+
+
+@pytest.fixture
+def banco():
+    db.bind(MODELOS)
+    db.create_tables(MODELOS)
+    yield db
+    db.drop_tables(MODELOS)
+
+
+def test_migracao_preenche_livro_com_financas_existentes(banco):
+    usuario = Usuario.create(nome="A", email="a@a.com", senha_hash="x")
+    # Lançamentos gravados antes do livro existir (sem passar por atualizar_saldo)
+    Financa.insert_many([
+        {"usuario": usuario.id, "tipo": "entrada", "categoria": "salario", "valor": 1000, "data": date(2025, 3, 5)},
+        {"usuario": usuario.id, "tipo": "saida", "categoria": "casa", "valor": 300, "data": date(2025, 3, 10)},
+        {"usuario": usuario.id, "tipo": "saida", "categoria": "casa", "valor": 50, "data": date(2025, 3, 20)},
+    ]).execute()
+    assert SaldoMensal.select().count() == 0
+
+    migracoes.m013_saldos_mensais(banco, lambda *a: None, 1000)
+
+    casa = SaldoMensal.get((SaldoMensal.tipo == "saida") & (SaldoMensal.categoria == "casa"))
+    assert (casa.mes, casa.total, casa.quantidade) == ("2025-03", 350, 2)
+    assert verificar_saldos(usuario.id) == []
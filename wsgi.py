@@ -0,0 +1,9 @@
+"""Ponto de entrada WSGI para produção.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Para recarregar sem derrubar conexões em andamento: `kill -HUP <pid do master>`.
+"""
+from app_mysql import create_app
+
+app = application = create_app()